@@ -0,0 +1,125 @@
+#!/usr/bin/env python
+# pylint: disable=invalid-name
+'''
+compare two benchmark results files (e.g., before and after a change)
+
+a change is accepted only if module recovery is at least as good
+(within tolerance) for every case; speed-ups that lose accuracy
+are reported as regressions; exits with status 1 on any regression
+'''
+
+from __future__ import print_function
+
+import argparse
+import json
+import sys
+
+ACCURACY_METRICS = ('ari', 'meanBestJaccard', 'noiseUnclassified')
+
+
+def load(fileName):
+    '''
+    load a results file; returns (header, cases by name)
+    '''
+    with open(fileName) as f:
+        results = json.load(f)
+    return results, dict((case['case'], case) for case in results['cases'])
+
+
+def compare_case(base, new, args):
+    '''
+    compare a single case; returns (report lines, list of regressions)
+    '''
+    lines = []
+    regressions = []
+
+    if new['status'] != 'SUCCESS':
+        return ['  run failed'], [new['case'] + ': run failed']
+
+    ratio = new['seconds'] / base['seconds'] if base['seconds'] > 0 else float('nan')
+    lines.append('  %-24s %10.2f %10.2f %8.2fx' % ('seconds', base['seconds'],
+                                                  new['seconds'], ratio))
+    if ratio > 1.0 + args.timeTolerance:
+        regressions.append(new['case'] + ': slower (%.2fx)' % ratio)
+
+    lines.append('  %-24s %10.1f %10.1f %8.2fx'
+                 % ('peakRssMb', base['peakRssMb'], new['peakRssMb'],
+                    new['peakRssMb'] / base['peakRssMb'] if base['peakRssMb'] > 0 else float('nan')))
+    if base['peakRssMb'] > 0 and new['peakRssMb'] / base['peakRssMb'] > 1.0 + args.memoryTolerance:
+        regressions.append(new['case'] + ': more memory (%.1f Mb -> %.1f Mb)'
+                           % (base['peakRssMb'], new['peakRssMb']))
+
+    for stage in sorted(set(base['stages']) | set(new['stages'])):
+        before = base['stages'].get(stage)
+        after = new['stages'].get(stage)
+        lines.append('  %-24s %10s %10s' % (stage,
+                                             '-' if before is None else '%.2f' % before,
+                                             '-' if after is None else '%.2f' % after))
+
+    baseRecovery = base.get('recovery') or {}
+    for metric in ACCURACY_METRICS:
+        before = baseRecovery.get(metric)
+        after = new['recovery'].get(metric)
+        if before is None or after is None:
+            continue
+        lines.append('  %-24s %10.4f %10.4f %+9.4f' % (metric, before, after, after - before))
+        if after < before - args.accuracyTolerance:
+            regressions.append(new['case'] + ': ' + metric
+                               + ' decreased (%.4f -> %.4f)' % (before, after))
+
+    return lines, regressions
+
+
+def parse_command_line_args():
+    '''
+    parse command line args
+    '''
+    parser = argparse.ArgumentParser(description="compare two iterativeWGCNA benchmark results files")
+    parser.add_argument('baseline', help="results file for the reference commit")
+    parser.add_argument('candidate', help="results file for the commit under test")
+    parser.add_argument('--timeTolerance', type=float, default=0.10,
+                        help="allowed fractional increase in wall time; default: 0.10")
+    parser.add_argument('--memoryTolerance', type=float, default=0.10,
+                        help="allowed fractional increase in peak memory; default: 0.10")
+    parser.add_argument('--accuracyTolerance', type=float, default=0.01,
+                        help="allowed decrease in any recovery metric; default: 0.01")
+    return parser.parse_args()
+
+
+def main():
+    '''
+    compare and report; returns exit status
+    '''
+    args = parse_command_line_args()
+    baseHeader, baseCases = load(args.baseline)
+    newHeader, newCases = load(args.candidate)
+
+    print('baseline:  ' + str(baseHeader.get('commit')))
+    print('candidate: ' + str(newHeader.get('commit')))
+    if baseHeader.get('seed') != newHeader.get('seed') \
+       or baseHeader.get('wgcnaParameters') != newHeader.get('wgcnaParameters'):
+        print('WARNING: seed or WGCNA parameters differ between results files')
+
+    regressions = []
+    for name, new in newCases.items():
+        base = baseCases.get(name)
+        if base is None:
+            continue
+        print()
+        print(name + ' (%d genes x %d samples)' % (new['genes'], new['samples']))
+        print('  %-24s %10s %10s %9s' % ('', 'baseline', 'candidate', 'change'))
+        lines, caseRegressions = compare_case(base, new, args)
+        print('\n'.join(lines))
+        regressions.extend(caseRegressions)
+
+    print()
+    if regressions:
+        print('REGRESSIONS:')
+        print('\n'.join('  ' + r for r in regressions))
+        return 1
+    print('OK: no regressions')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,227 @@
+#!/usr/bin/env python
+# pylint: disable=invalid-name
+'''
+benchmark iterativeWGCNA on synthetic data sets with planted modules
+
+each case runs iterativeWGCNA in a separate process; records
+wall time, per-stage time (from the run's metrics file), peak memory,
+and recovery of the planted modules; results are saved as JSON
+for comparison between commits (see compare_benchmarks.py)
+'''
+
+from __future__ import print_function
+
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+from collections import Counter, OrderedDict
+from time import time, strftime
+
+from synthetic import PRESETS, dataset, read_truth
+
+REPOSITORY = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def comb2(n):
+    '''
+    n choose 2
+    '''
+    return n * (n - 1) / 2.0
+
+
+def adjusted_rand_index(truth, predicted):
+    '''
+    adjusted Rand index between two labelings (dicts gene -> label)
+    '''
+    genes = list(truth.keys())
+    pairs = Counter((truth[g], predicted[g]) for g in genes)
+    a = Counter(truth[g] for g in genes)
+    b = Counter(predicted[g] for g in genes)
+
+    index = sum(comb2(n) for n in pairs.values())
+    sumA = sum(comb2(n) for n in a.values())
+    sumB = sum(comb2(n) for n in b.values())
+    expected = sumA * sumB / comb2(len(genes))
+    maximum = (sumA + sumB) / 2.0
+    if maximum == expected:
+        return 1.0
+    return (index - expected) / (maximum - expected)
+
+
+def best_match_jaccard(truth, predicted):
+    '''
+    mean over planted modules of the best Jaccard
+    similarity to any detected module
+    '''
+    planted = {}
+    detected = {}
+    for gene, module in truth.items():
+        if module != 0:
+            planted.setdefault(module, set()).add(gene)
+    for gene, module in predicted.items():
+        if module != 'UNCLASSIFIED':
+            detected.setdefault(module, set()).add(gene)
+
+    if len(planted) == 0:
+        return 1.0
+
+    scores = []
+    for members in planted.values():
+        scores.append(max([len(members & d) / float(len(members | d))
+                           for d in detected.values()] or [0.0]))
+    return sum(scores) / len(scores)
+
+
+def recovery(truthFile, membershipFile):
+    '''
+    compare detected modules to the planted truth
+    '''
+    truth = read_truth(truthFile)
+    predicted = {}
+    with open(membershipFile) as f:
+        next(f)
+        for line in f:
+            gene, module = line.rstrip('\n').split('\t')[:2]
+            predicted[gene] = module
+
+    noise = [g for g, m in truth.items() if m == 0]
+    return OrderedDict((('ari', round(adjusted_rand_index(truth, predicted), 4)),
+                        ('meanBestJaccard', round(best_match_jaccard(truth, predicted), 4)),
+                        ('noiseUnclassified',
+                         round(sum(1 for g in noise if predicted[g] == 'UNCLASSIFIED')
+                               / float(len(noise)), 4) if noise else None)))
+
+
+def stage_times(metricsFile):
+    '''
+    total seconds per stage from the run's metrics file
+    '''
+    totals = OrderedDict()
+    if not os.path.exists(metricsFile):
+        return totals
+    with open(metricsFile) as f:
+        for line in f:
+            for name, stage in json.loads(line)['stages'].items():
+                totals[name] = round(totals.get(name, 0.0) + stage['seconds'], 3)
+    return totals
+
+
+def run_case(name, genes, samples, modules, args):
+    '''
+    generate data and run iterativeWGCNA for a single case
+    '''
+    exprFile, truthFile = dataset(args.dataDir, genes, samples, modules,
+                                  args.noiseFraction, args.seed)
+    outputDir = os.path.join(args.outputDir, name)
+    if os.path.exists(outputDir): # iterativeWGCNA requires a clean working directory
+        shutil.rmtree(outputDir)
+    os.makedirs(outputDir)
+
+    command = [sys.executable, '-m', 'iterativeWGCNA', '-i', os.path.abspath(exprFile),
+               '-o', os.path.abspath(outputDir), '--skipSaveBlocks',
+               '-f', str(args.finalMergeCutHeight)]
+    if args.wgcnaParameters is not None:
+        command.extend(['-p', args.wgcnaParameters])
+
+    start = time()
+    process = subprocess.Popen(command, cwd=REPOSITORY)
+    _, status, usage = os.wait4(process.pid, 0)
+    wallTime = time() - start
+
+    # ru_maxrss is in kilobytes on Linux, bytes on macOS
+    peakMb = usage.ru_maxrss / (1048576.0 if sys.platform == 'darwin' else 1024.0)
+
+    result = OrderedDict((('case', name), ('genes', genes), ('samples', samples),
+                          ('modules', modules), ('seconds', round(wallTime, 2)),
+                          ('peakRssMb', round(peakMb, 1)),
+                          ('stages', stage_times(os.path.join(outputDir,
+                                                              'iterative-wgcna-metrics.jsonl')))))
+
+    membershipFile = os.path.join(outputDir, 'merged-' + str(args.finalMergeCutHeight)
+                                  + '-membership.txt')
+    if status == 0 and os.path.exists(membershipFile):
+        result['recovery'] = recovery(truthFile, membershipFile)
+        result['status'] = 'SUCCESS'
+    else:
+        result['recovery'] = None
+        result['status'] = 'FAIL'
+    return result
+
+
+def git_commit():
+    '''
+    current commit of the repository (if available)
+    '''
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'],
+                                       cwd=REPOSITORY).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def parse_command_line_args():
+    '''
+    parse command line args
+    '''
+    parser = argparse.ArgumentParser(description="benchmark iterativeWGCNA on synthetic "
+                                     + "data sets with planted modules")
+    parser.add_argument('--cases', default='tiny,small',
+                        help="comma separated list of presets ("
+                        + ', '.join('%s=%dx%d' % (k, v[0], v[1])
+                                    for k, v in sorted(PRESETS.items(), key=lambda x: x[1]))
+                        + ") or GENESxSAMPLES[xMODULES] sizes")
+    parser.add_argument('-o', '--outputDir', default='benchmark-output')
+    parser.add_argument('--dataDir', default=None,
+                        help="where generated data sets are cached; default: <outputDir>/data")
+    parser.add_argument('-r', '--results', default=None,
+                        help="results file; default: <outputDir>/benchmark-results.json")
+    parser.add_argument('-p', '--wgcnaParameters', default='maxBlockSize=20000,randomSeed=1234')
+    parser.add_argument('-f', '--finalMergeCutHeight', type=float, default=0.05)
+    parser.add_argument('--noiseFraction', type=float, default=0.5)
+    parser.add_argument('--seed', type=int, default=1234)
+    args = parser.parse_args()
+    if args.dataDir is None:
+        args.dataDir = os.path.join(args.outputDir, 'data')
+    if args.results is None:
+        args.results = os.path.join(args.outputDir, 'benchmark-results.json')
+    return args
+
+
+def parse_case(case):
+    '''
+    preset name or GENESxSAMPLES[xMODULES] -> (name, genes, samples, modules)
+    '''
+    if case in PRESETS:
+        return (case,) + PRESETS[case]
+    sizes = [int(x) for x in case.split('x')]
+    modules = sizes[2] if len(sizes) > 2 else max(5, sizes[0] // 400)
+    return (case, sizes[0], sizes[1], modules)
+
+
+def main():
+    '''
+    run all cases and save results
+    '''
+    args = parse_command_line_args()
+    for directory in (args.outputDir, args.dataDir):
+        if not os.path.exists(directory):
+            os.makedirs(directory)
+
+    results = OrderedDict((('commit', git_commit()), ('date', strftime("%c")),
+                           ('wgcnaParameters', args.wgcnaParameters),
+                           ('seed', args.seed), ('cases', [])))
+    for case in args.cases.split(','):
+        name, genes, samples, modules = parse_case(case)
+        result = run_case(name, genes, samples, modules, args)
+        results['cases'].append(result)
+        print(json.dumps(result), file=sys.stderr)
+
+    with open(args.results, 'w') as f:
+        json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
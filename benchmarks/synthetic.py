@@ -0,0 +1,137 @@
+#!/usr/bin/env python
+# pylint: disable=invalid-name
+'''
+seeded generator of synthetic expression data sets
+with planted modules and noise genes
+
+each planted module is driven by a latent sample profile;
+member genes are the (positively loaded) latent profile plus
+gaussian noise, so within-module correlation is controlled
+by the loading range; noise genes are independent gaussian noise
+'''
+
+from __future__ import print_function
+
+import argparse
+import os
+
+import numpy as np
+
+# named sizes: (genes, samples, modules)
+PRESETS = {'tiny': (1000, 20, 5),
+           'small': (5000, 50, 15),
+           'medium': (10000, 100, 25),
+           'large': (20000, 500, 40),
+           'xlarge': (60000, 2000, 80)}
+
+
+def generate(nGenes, nSamples, nModules, noiseFraction=0.5,
+             loadingRange=(0.6, 0.95), seed=1234):
+    '''
+    generate an expression matrix with planted modules
+
+    returns (values, genes, samples, truth) where truth
+    maps each gene to its planted module (0 = noise gene)
+    '''
+    rng = np.random.RandomState(seed)
+
+    nModuleGenes = int(round(nGenes * (1.0 - noiseFraction)))
+    # random module sizes (at least 30 genes each) summing to nModuleGenes
+    weights = rng.dirichlet(np.ones(nModules) * 2.0)
+    sizes = np.maximum(30, np.floor(weights * nModuleGenes)).astype(int)
+    sizes[-1] = max(30, nModuleGenes - sizes[:-1].sum())
+
+    truth = np.zeros(nGenes, dtype=int)
+    values = rng.standard_normal((nGenes, nSamples))
+
+    latent = rng.standard_normal((nModules, nSamples))
+    start = 0
+    for module, size in enumerate(sizes):
+        end = min(start + size, nGenes)
+        loadings = rng.uniform(loadingRange[0], loadingRange[1], size=end - start)
+        noise = np.sqrt(1.0 - loadings ** 2)
+        values[start:end] = loadings[:, None] * latent[module] + noise[:, None] * values[start:end]
+        truth[start:end] = module + 1
+        start = end
+
+    # shuffle genes so modules are not contiguous; shift to a
+    # positive, expression-like scale
+    order = rng.permutation(nGenes)
+    values = values[order] * 1.5 + 8.0
+    truth = truth[order]
+
+    genes = ['G' + str(i + 1) for i in range(nGenes)]
+    samples = ['S' + str(j + 1) for j in range(nSamples)]
+    return values, genes, samples, dict(zip(genes, truth.tolist()))
+
+
+def write_expression(fileName, values, genes, samples):
+    '''
+    write the expression matrix in iterativeWGCNA input format
+    '''
+    with open(fileName, 'w') as f:
+        print('\t'.join(['Gene'] + samples), file=f)
+        for gene, row in zip(genes, values):
+            print(gene + '\t' + '\t'.join('%.5f' % v for v in row), file=f)
+
+
+def write_truth(fileName, truth):
+    '''
+    write the planted module assignment of each gene
+    '''
+    with open(fileName, 'w') as f:
+        print('Gene\tModule', file=f)
+        for gene, module in truth.items():
+            print(gene + '\t' + str(module), file=f)
+
+
+def read_truth(fileName):
+    '''
+    read planted module assignments
+    '''
+    with open(fileName) as f:
+        next(f)
+        return dict((gene, int(module)) for gene, module
+                    in (line.rstrip('\n').split('\t') for line in f))
+
+
+def dataset(directory, nGenes, nSamples, nModules, noiseFraction=0.5, seed=1234):
+    '''
+    generate (or reuse a cached) data set;
+    returns paths to the expression and truth files
+    '''
+    name = 'synthetic-' + '-'.join(str(x) for x in (nGenes, nSamples, nModules,
+                                                      noiseFraction, seed))
+    exprFile = os.path.join(directory, name + '.txt')
+    truthFile = os.path.join(directory, name + '-truth.txt')
+    if not (os.path.exists(exprFile) and os.path.exists(truthFile)):
+        values, genes, samples, truth = generate(nGenes, nSamples, nModules,
+                                                 noiseFraction, seed=seed)
+        write_expression(exprFile, values, genes, samples)
+        write_truth(truthFile, truth)
+    return exprFile, truthFile
+
+
+def parse_command_line_args():
+    '''
+    parse command line args
+    '''
+    parser = argparse.ArgumentParser(description="generate a synthetic expression data set "
+                                     + "with planted modules")
+    parser.add_argument('-o', '--outputDir', default=os.getcwd())
+    parser.add_argument('--preset', choices=sorted(PRESETS.keys()))
+    parser.add_argument('--genes', type=int, default=1000)
+    parser.add_argument('--samples', type=int, default=20)
+    parser.add_argument('--modules', type=int, default=5)
+    parser.add_argument('--noiseFraction', type=float, default=0.5)
+    parser.add_argument('--seed', type=int, default=1234)
+    args = parser.parse_args()
+    if args.preset is not None:
+        args.genes, args.samples, args.modules = PRESETS[args.preset]
+    return args
+
+
+if __name__ == '__main__':
+    cmlArgs = parse_command_line_args()
+    print('\n'.join(dataset(cmlArgs.outputDir, cmlArgs.genes, cmlArgs.samples,
+                            cmlArgs.modules, cmlArgs.noiseFraction, cmlArgs.seed)))
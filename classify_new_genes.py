@@ -0,0 +1,18 @@
+#!/usr/bin/env python
+
+'''Assign new genes to the modules of an existing run directly from source tree.'''
+
+# Installation workaround - see README
+# import readline
+#pylint: disable=invalid-name
+
+from iterativeWGCNA.classify import Classifier
+from iterativeWGCNA.cmlargs import parse_classify_command_line_args
+
+if __name__ == '__main__':
+    args = parse_classify_command_line_args()
+    classifier = Classifier(args)
+    classifier.run()
+
+__author__ = 'Emily Greenfest-Allen'
+__copyright__ = 'Copyright 2018, University of Pennsylvania'
@@ -0,0 +1,18 @@
+#!/usr/bin/env python
+
+'''Render plots from the run record directly from source tree.'''
+
+# Installation workaround - see README
+# import readline
+#pylint: disable=invalid-name
+
+from iterativeWGCNA.report import Report
+from iterativeWGCNA.cmlargs import parse_report_command_line_args
+
+if __name__ == '__main__':
+    args = parse_report_command_line_args()
+    report = Report(args)
+    report.run()
+
+__author__ = 'Emily Greenfest-Allen'
+__copyright__ = 'Copyright 2018, University of Pennsylvania'
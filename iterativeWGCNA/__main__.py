@@ -1,4 +1,4 @@
-#!/usr/bin/env python2.7
+#!/usr/bin/env python3
 """
 Perform iterative WGCNA analysis
 
@@ -10,11 +10,16 @@ R dependencies:
   * WGCNA
 """
 
+import sys
+
 from .cmlargs import parse_command_line_args
 from .iterativeWGCNA import IterativeWGCNA
+from .estimate import dry_run
 
 if __name__ == '__main__':
     args = parse_command_line_args()
+    if args.dryRun:
+        sys.exit(0 if dry_run(args) else 1)
     alg = IterativeWGCNA(args)
     alg.run()
 
@@ -2,17 +2,106 @@
 functions in support of data analysis
 '''
 
-# TODO move to RManager or wgcnaManager
+from math import exp, lgamma, log
 
-from .r.imports import wgcna, stats, base
+import numpy as np
 
-def calculate_kME(expr, eigengene, calculateP):
+BETA_TOLERANCE = 1e-15 # convergence of the incomplete beta continued fraction
+BETA_MAX_TERMS = 1000
+QUANTILE_ITERATIONS = 200 # Newton (or bisection) steps for a Beta quantile
+QUANTILE_TOLERANCE = 1e-14
+
+
+def calculate_kME(profiles, eigengenes, genes=None, modules=None):
+    '''
+    calculates eigengene connectivity: the correlation
+    (genes x modules array) of each gene in profiles (an
+    Expression object) with each module eigengene (an
+    Eigengenes object); defaults to all genes and modules
+    '''
+    return profiles.standardized().correlation(genes, modules, eigengenes.standardized())
+
+
+def beta_continued_fraction(x, a, b):
+    '''
+    continued fraction for the incomplete beta function
+    (modified Lentz's method; Numerical Recipes betacf)
+    '''
+    tiny = 1e-300
+    c = 1.0
+    d = 1.0 - (a + b) * x / (a + 1.0)
+    d = 1.0 / (d if abs(d) > tiny else tiny)
+    result = d
+    for m in range(1, BETA_MAX_TERMS + 1):
+        for numerator in (m * (b - m) * x / ((a + 2 * m - 1) * (a + 2 * m)),
+                          -(a + m) * (a + b + m) * x / ((a + 2 * m) * (a + 2 * m + 1))):
+            d = 1.0 + numerator * d
+            d = 1.0 / (d if abs(d) > tiny else tiny)
+            c = 1.0 + numerator / c
+            c = c if abs(c) > tiny else tiny
+            result *= c * d
+        if abs(c * d - 1.0) < BETA_TOLERANCE:
+            break
+    return result
+
+
+def regularized_incomplete_beta(x, a, b):
     '''
-    calculates eigengene connectivity
-    between an eigengene and expression data set
+    regularized incomplete beta function I_x(a, b)
+    '''
+    if x <= 0.0:
+        return 0.0
+    if x >= 1.0:
+        return 1.0
+    front = exp(lgamma(a + b) - lgamma(a) - lgamma(b) + a * log(x) + b * log(1.0 - x))
+    if x < (a + 1.0) / (a + b + 2.0):
+        return front * beta_continued_fraction(x, a, b) / a
+    return 1.0 - front * beta_continued_fraction(1.0 - x, b, a) / b
+
+
+def beta_upper_quantile(p, a, b):
+    '''
+    x such that P(X > x) = p for X ~ Beta(a, b): Newton's
+    method on the upper tail I_(1 - x)(b, a), kept within a
+    bisection bracket
+    '''
+    logBeta = lgamma(a) + lgamma(b) - lgamma(a + b)
+    lower, upper = 0.0, 1.0
+    x = 0.5
+    for _ in range(QUANTILE_ITERATIONS):
+        tail = regularized_incomplete_beta(1.0 - x, b, a)
+        if tail > p:
+            lower = x
+        else:
+            upper = x
+        # the tail decreases with x at the rate of the density
+        density = exp((a - 1.0) * log(x) + (b - 1.0) * log(1.0 - x) - logBeta)
+        step = (tail - p) / density if density > 0 else 0.0
+        nextX = x + step
+        if not lower < nextX < upper:
+            nextX = (lower + upper) / 2.0
+        if abs(nextX - x) <= QUANTILE_TOLERANCE * x or upper - lower <= QUANTILE_TOLERANCE:
+            return nextX
+        x = nextX
+    return x
+
+
+def critical_correlation(threshold, sampleCounts):
+    '''
+    for each gene, the absolute correlation above which
+    the (Student t) p-value of the correlation is below
+    threshold, given the number of samples (as in WGCNA
+    corPvalueStudent)
+
+    under the null hypothesis r^2 ~ Beta(1/2, (n - 2)/2), so the
+    critical r^2 is the (1 - threshold) quantile of that
+    distribution (computed without R)
     '''
-    if calculateP:
-        correlation = wgcna().corAndPvalue(base().t(expr), base().t(eigengene))
-    else:
-        correlation = base().as_data_frame(stats().cor(base().t(expr), base().t(eigengene)))
-    return correlation
+    sampleCounts = np.asarray(sampleCounts)
+    counts = np.unique(sampleCounts)
+    result = np.ones(len(sampleCounts)) # too few samples: never significant
+    if threshold <= 0:
+        return result
+    for n in counts[counts > 2]:
+        result[sampleCounts == n] = np.sqrt(beta_upper_quantile(threshold, 0.5, (n - 2.0) / 2.0))
+    return result
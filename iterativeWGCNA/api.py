@@ -0,0 +1,126 @@
+# pylint: disable=invalid-name
+'''
+library entry point: run iterativeWGCNA on an in-memory
+expression matrix and get the results back as arrays
+
+usage:
+    from iterativeWGCNA.api import run_iterative_wgcna
+    result = run_iterative_wgcna(values, genes, samples,
+                                 wgcnaParameters={'power': 8},
+                                 finalMergeCutHeight=0.1)
+    result.modules, result.kME, result.eigengenes
+
+by default nothing is written to disk; specify a workingDir
+to also write the usual output files
+'''
+
+import os
+
+import numpy as np
+
+from .cmlargs import run_argument_parser, set_wgcna_parameter_defaults
+
+IN_MEMORY_INPUT = '<in-memory>' # inputFile label for in-memory data
+
+
+class ModuleResult(object):
+    '''
+    final (merged) module assignments of an iterativeWGCNA run
+
+    genes: gene labels (input order)
+    modules: module assigned to each gene ('UNCLASSIFIED' if none)
+    kME: eigengene connectivity of each gene to its module (NaN if unclassified)
+    eigengeneModules: module labels (rows of eigengenes)
+    samples: sample labels (columns of eigengenes)
+    eigengenes: modules x samples array of module eigengenes
+    '''
+
+    def __init__(self, genes, modules, kME, eigengeneModules, samples, eigengenes):
+        self.genes = genes
+        self.modules = modules
+        self.kME = kME
+        self.eigengeneModules = eigengeneModules
+        self.samples = samples
+        self.eigengenes = eigengenes
+
+
+    @classmethod
+    def from_run(cls, alg):
+        '''
+        collect the result from a completed IterativeWGCNA run
+        '''
+        membership = alg.genes.get_gene_membership()
+        kME = alg.genes.get_gene_kME()
+        genes = list(membership.keys())
+        eigengeneModules, samples, eigengenes = alg.output_eigengenes()
+        return cls(genes,
+                   np.array([membership[g] for g in genes], dtype=object),
+                   np.array([kME[g] for g in genes], dtype=np.float64),
+                   eigengeneModules, samples, eigengenes)
+
+
+    def membership(self):
+        '''
+        gene -> module dict
+        '''
+        return dict(zip(self.genes, self.modules))
+
+
+def run_args(workingDir=None, wgcnaParameters=None, **options):
+    '''
+    build run arguments: defaults for all iterativeWGCNA
+    command line options, overridden by keyword options
+    (named as the option, e.g., finalMergeCutHeight=0.1)
+    '''
+    args = run_argument_parser().parse_args(['-i', IN_MEMORY_INPUT])
+    for name, value in options.items():
+        if name in ('inputFile', 'workingDir') or not hasattr(args, name):
+            raise TypeError("unknown iterativeWGCNA option: " + name)
+        setattr(args, name, value)
+
+    args.workingDir = os.path.abspath(workingDir) if workingDir is not None else None
+    args.wgcnaParameters = set_wgcna_parameter_defaults(dict(wgcnaParameters or {}),
+                                                        args.skipSaveBlocks)
+    return args
+
+
+def run_iterative_wgcna(values, genes, samples, workingDir=None,
+                        wgcnaParameters=None, listener=None, **options):
+    '''
+    run iterativeWGCNA on an expression matrix
+
+    values: genes x samples array-like of expression values
+    genes, samples: row and column labels (used as given)
+    workingDir: if specified, output files are also written here
+    wgcnaParameters: dict of blockwiseModules parameters
+    listener: optional function called with each progress event
+    options: other iterativeWGCNA options (e.g., finalMergeCutHeight,
+    enableWGCNAThreads, autoBlockSize, verbose)
+
+    returns a ModuleResult; raises RuntimeError if the run fails
+    '''
+    # R is started on first use
+    from .iterativeWGCNA import IterativeWGCNA
+    from .r.conversion import array2frame
+
+    values = np.asarray(values, dtype=np.float64)
+    genes = [str(g) for g in genes]
+    samples = [str(s) for s in samples]
+    if values.shape != (len(genes), len(samples)):
+        raise ValueError("expression matrix is " + str(values.shape) + " but "
+                         + str(len(genes)) + " genes and " + str(len(samples))
+                         + " samples were labeled")
+    if len(set(genes)) != len(genes):
+        raise ValueError("gene labels must be unique")
+
+    args = run_args(workingDir, wgcnaParameters, **options)
+    alg = IterativeWGCNA(args, data=array2frame(values, genes, samples))
+    try:
+        if listener is not None:
+            alg.add_listener(listener)
+        if not alg.run():
+            raise RuntimeError("iterativeWGCNA run failed"
+                               + (": " + str(alg.error) if alg.error is not None else ""))
+        return ModuleResult.from_run(alg)
+    finally:
+        alg.close()
@@ -0,0 +1,185 @@
+# pylint: disable=invalid-name
+'''
+batch mode: runs iterativeWGCNA for each job in a manifest
+on a fixed pool of long-lived worker processes
+
+each worker starts R and loads WGCNA once and then runs jobs
+in turn, resetting the R workspace, sinks and logs between jobs
+'''
+
+from __future__ import print_function
+
+import logging
+import os
+import shlex
+import multiprocessing
+from time import strftime
+
+from .cmlargs import run_argument_parser, set_wgcna_parameter_defaults
+from .io.utils import create_dir, warning
+from .resources import limit_job_threads, set_thread_environment, worker_threads
+from .sweep import WORKER, run_and_summarize
+
+MANIFEST_COLUMNS = ('inputFile', 'workingDir', 'options')
+
+
+def job_args(inputFile, workingDir, options=''):
+    '''
+    parse the iterativeWGCNA options for a job
+    '''
+    parser = run_argument_parser()
+    try:
+        args = parser.parse_args(['-i', inputFile, '-o', workingDir] + shlex.split(options))
+    except SystemExit:
+        # argparse exits on invalid options (after printing the error)
+        raise ValueError("invalid options: " + options)
+    args.wgcnaParameters = set_wgcna_parameter_defaults(args.wgcnaParameters,
+                                                        args.skipSaveBlocks)
+    return args
+
+
+def read_manifest(fileName):
+    '''
+    read a tab-delimited job manifest; columns:
+    inputFile, workingDir, and (optionally) options, a string of
+    iterativeWGCNA command line options (e.g., -p power=8 -f 0.1)
+
+    the first line is a header; blank lines and lines starting
+    with '#' are ignored; relative paths are resolved relative
+    to the directory containing the manifest
+
+    returns a list of (label, args) jobs
+    '''
+    manifestDir = os.path.dirname(os.path.abspath(fileName))
+    jobs = []
+    workingDirs = set()
+    with open(fileName) as f:
+        next(f) # header
+        for lineNumber, line in enumerate(f, start=2):
+            if not line.strip() or line.startswith('#'):
+                continue
+            fields = line.rstrip('\n').split('\t')
+            if len(fields) < 2:
+                raise ValueError("Manifest line " + str(lineNumber)
+                                 + ": expected " + '\t'.join(MANIFEST_COLUMNS))
+
+            inputFile, workingDir = [os.path.join(manifestDir, path) for path in fields[:2]]
+            workingDir = os.path.normpath(workingDir)
+            if workingDir in workingDirs:
+                raise ValueError("Manifest line " + str(lineNumber)
+                                 + ": working directory is used by another job: " + workingDir)
+            workingDirs.add(workingDir)
+
+            options = fields[2] if len(fields) > 2 else ''
+            try:
+                args = job_args(inputFile, workingDir, options)
+            except ValueError as err:
+                raise ValueError("Manifest line " + str(lineNumber) + ": " + str(err))
+            jobs.append(('job' + str(len(jobs) + 1), args))
+    return jobs
+
+
+def initialize_worker():
+    '''
+    pool initializer: start R and load WGCNA once per worker
+    '''
+    # R is started here, in the (spawned) worker
+    from .r.imports import wgcna
+
+    WORKER['initialDir'] = os.getcwd()
+    wgcna()
+
+
+def run_job(task):
+    '''
+    pool task: run iterativeWGCNA for one job and return its summary
+    '''
+    label, args = task
+    summary = run_and_summarize('Job', label, args)
+    summary['WorkingDir'] = args.workingDir
+    return summary
+
+
+class BatchRunner(object):
+    '''
+    run iterativeWGCNA for each job in a manifest
+    and assemble a summary table
+    '''
+
+    def __init__(self, args):
+        self.args = args
+        self.args.workingDir = os.path.abspath(self.args.workingDir)
+        create_dir(self.args.workingDir)
+        self.logger = self.__initialize_log()
+        self.jobs = read_manifest(self.args.manifest)
+
+
+    def __initialize_log(self):
+        '''
+        initialize batch log
+        '''
+        logger = logging.getLogger('iterativeWGCNA.BatchRunner')
+        logger.setLevel(logging.DEBUG)
+        handler = logging.FileHandler(os.path.join(self.args.workingDir,
+                                                   'iterativeWGCNA-batch.log'), mode='w')
+        handler.setFormatter(logging.Formatter('%(levelname)s: %(message)s'))
+        logger.addHandler(handler)
+        logger.propagate = False
+        return logger
+
+
+    def run(self):
+        '''
+        run all jobs; write the summary table
+        '''
+        self.logger.info(strftime("%c"))
+        self.logger.info("Running " + str(len(self.jobs)) + " jobs from "
+                         + self.args.manifest + " on "
+                         + str(self.args.processes) + " worker processes")
+        if self.args.verbose:
+            warning("Running " + str(len(self.jobs)) + " jobs")
+
+        threads = worker_threads(self.args.threads, self.args.processes)
+        if threads is not None:
+            for _, args in self.jobs:
+                limit_job_threads(args, threads)
+            set_thread_environment(threads) # read by the spawned workers' BLAS
+            self.logger.info("Thread budget: at most " + str(threads) + " threads per worker")
+
+        results = {}
+        # spawn, not fork, so each worker embeds its own R instance
+        context = multiprocessing.get_context('spawn')
+        pool = context.Pool(processes=self.args.processes,
+                            initializer=initialize_worker)
+        try:
+            for summary in pool.imap_unordered(run_job, self.jobs):
+                results[summary['Job']] = summary
+                message = summary['Job'] + " (" + summary['WorkingDir'] + "): " \
+                          + summary['Status'] + " [" + summary['Runtime'] + "s]"
+                self.logger.info(message)
+                if self.args.verbose:
+                    warning(message)
+        finally:
+            pool.close()
+            pool.join()
+
+        self.write_summary(results)
+        self.logger.info(strftime("%c"))
+
+
+    def write_summary(self, results):
+        '''
+        write one row per job to the summary table
+        '''
+        fileName = os.path.join(self.args.workingDir, 'batch-summary.txt')
+        with open(fileName, 'w') as f:
+            header = None
+            for label, args in self.jobs:
+                summary = results[label]
+                if header is None:
+                    header = ['Job', 'InputFile', 'WorkingDir'] \
+                             + [k for k in summary.keys() if k not in ('Job', 'WorkingDir')]
+                    print('\t'.join(header), file=f)
+                row = [label, args.inputFile, args.workingDir] \
+                      + [str(summary[k]) for k in header[3:]]
+                print('\t'.join(row), file=f)
@@ -0,0 +1,143 @@
+# pylint: disable=invalid-name
+'''
+classify new genes against an existing module set: the kME
+of each new gene to every final (or merged) module eigengene
+of an earlier run is computed in batches of genes, as a
+matrix product of standardized profiles, and genes are assigned
+with the rules of Genes.reassign_to_best_fit (modules are
+visited in eigengene file order; an unclassified gene joins a
+module if kME >= minKMEtoStay, and moves to a later module
+if its kME there is higher and the correlation p-value is
+below reassignThreshold)
+
+correlations with missing values use pairwise-complete
+observations and p-values the number of non-missing samples
+of each gene, as in WGCNA corAndPvalue
+'''
+
+from __future__ import print_function
+
+import logging
+import os
+from time import strftime
+
+import numpy as np
+
+from .analysis import critical_correlation
+from .io.matrix import iter_matrix_chunks, read_header, read_matrix, write_matrix
+from .io.utils import read_membership, warning, write_table, xstr
+from .reassign import reassign_to_modules
+from .standardized import StandardizedProfiles
+
+CLASSIFY_BATCH_GENES = 5000 # genes read and classified per batch
+CLASSIFIED_PREFIX = 'classified-'
+
+
+def result_prefix(args):
+    '''
+    output file prefix of the run result used as the reference:
+    final- or merged-<finalMergeCutHeight>-
+    '''
+    if args.result == 'final':
+        return 'final-'
+    return 'merged-' + str(args.finalMergeCutHeight) + '-'
+
+
+class Classifier(object):
+    '''
+    assign genes missing from an existing iterativeWGCNA
+    result to its modules
+    '''
+
+    def __init__(self, args):
+        self.args = args
+        self.logger = logging.getLogger('iterativeWGCNA.Classifier')
+        logging.basicConfig(filename=os.path.join(self.args.workingDir,
+                                                  'classify-iterativeWGCNA.log'),
+                            filemode='w', format='%(levelname)s: %(message)s',
+                            level=logging.DEBUG)
+        prefix = result_prefix(args)
+        self.membershipFile = os.path.join(args.workingDir, prefix + 'membership.txt')
+        self.eigengeneFile = os.path.join(args.workingDir, prefix + 'eigengenes.txt')
+        self.outputPrefix = os.path.join(args.workingDir, CLASSIFIED_PREFIX + prefix)
+
+
+    def log(self, message):
+        '''
+        log, and print if verbose
+        '''
+        self.logger.info(message)
+        if self.args.verbose:
+            warning(message)
+
+
+    def sample_columns(self, eigengeneSamples):
+        '''
+        index of each eigengene sample in the input file
+        '''
+        _, samples = read_header(self.args.inputFile)
+        index = dict((sample, i) for i, sample in enumerate(samples))
+        missing = [sample for sample in eigengeneSamples if sample not in index]
+        if missing:
+            raise ValueError("Samples of the eigengenes missing from "
+                             + self.args.inputFile + ": " + ', '.join(missing[:10])
+                             + (" ..." if len(missing) > 10 else ""))
+        return [index[sample] for sample in eigengeneSamples]
+
+
+    def run(self):
+        '''
+        classify the new genes; writes the updated membership
+        (existing and new genes) and the kME of the new genes
+        to every module
+
+        returns the number of new genes classified
+        '''
+        self.logger.info(strftime("%c"))
+        minKMEtoStay = self.args.minKMEtoStay
+        reassignThreshold = self.args.reassignThreshold
+        self.log("Reference: " + self.membershipFile + ", " + self.eigengeneFile)
+        self.log("minKMEtoStay = " + str(minKMEtoStay)
+                 + "; reassignThreshold = " + str(reassignThreshold))
+
+        header, membership = read_membership(self.membershipFile)
+        modules, eigengeneSamples, eigengenes = read_matrix(self.eigengeneFile)
+        columns = self.sample_columns(eigengeneSamples)
+        eigengenes = StandardizedProfiles(modules, eigengenes)
+        self.log("Loaded " + str(len(membership)) + " genes and "
+                 + str(len(modules)) + " module eigengenes")
+
+        kmeFile = self.outputPrefix + 'kme.txt'
+        if os.path.exists(kmeFile):
+            os.remove(kmeFile)
+
+        newCount = 0
+        classifiedCount = 0
+        blank = [xstr(None)] * (len(header) - 3) # e.g., Filter
+        for genes, values in iter_matrix_chunks(self.args.inputFile, self.args.batchSize):
+            new = [i for i, gene in enumerate(genes) if gene not in membership]
+            if not new:
+                continue
+            genes = [genes[i] for i in new]
+            values = values[new][:, columns]
+            profiles = StandardizedProfiles(genes, values)
+            kME = profiles.correlation(other=eigengenes)
+            significant = np.abs(kME) > critical_correlation(
+                reassignThreshold, profiles.sample_counts())[:, None]
+            assigned, assignedKME, _ = reassign_to_modules(kME, significant, minKMEtoStay)
+
+            for gene, m, geneKME in zip(genes, assigned, assignedKME):
+                if m < 0:
+                    membership[gene] = [gene, 'UNCLASSIFIED', xstr(float('NaN'))] + blank
+                else:
+                    membership[gene] = [gene, modules[m], xstr(float(geneKME))] + blank
+                    classifiedCount = classifiedCount + 1
+            write_matrix(kmeFile, 'Gene', genes, modules, kME, append=True)
+            newCount = newCount + len(genes)
+
+        write_table(self.outputPrefix + 'membership.txt', header, membership.values())
+        self.log("Classified " + str(classifiedCount) + " of " + str(newCount) + " new genes")
+        if newCount > 0:
+            self.log("Wrote " + self.outputPrefix + "membership.txt and " + kmeFile)
+        self.logger.info(strftime("%c"))
+        return classifiedCount
@@ -9,8 +9,30 @@ and validating command line arguments
 import re
 import argparse
 from os import getcwd
+from collections import OrderedDict
 from .io.utils import warning
 
+def cast_parameter_value(value):
+    '''
+    for argument parsing;
+    casts a string parameter value to a boolean,
+    integer, or float where possible
+    '''
+    # Test and cast for booleans
+    if value.upper() in ['TRUE', 'T']:
+        return True
+    elif value.upper() in ['FALSE', 'F']:
+        return False
+    # Test and cast for integer
+    elif value.isdigit():
+        return int(value)
+    # Test and cast for float
+    elif re.match("^\d+?\.\d+?$", value):
+        return float(value)
+
+    return value
+
+
 def parameter_list(strValue):
     '''
     for argument parsing;
@@ -23,24 +45,28 @@ def parameter_list(strValue):
 
     for p in pairs:
         name, value = p.split('=')
-
-        # Test and cast for booleans
-        if value.upper() in ['TRUE', 'T']:
-            params[name] = True
-        elif value.upper() in ['FALSE', 'F']:
-            params[name] = False
-        # Test and cast for integer
-        elif value.isdigit():
-            params[name] = int(value)
-        # Test and cast for float
-        elif re.match("^\d+?\.\d+?$", value):
-            params[name] = float(value)
-        else:
-            params[name] = value
+        params[name] = cast_parameter_value(value)
 
     return params
 
 
+def parameter_grid(strValue):
+    '''
+    for argument parsing;
+    converts a comma separated list of 'param=value1|value2' pairs
+    into an ordered param:[values] hash
+    '''
+
+    grid = OrderedDict()
+    pairs = strValue.split(',')
+
+    for p in pairs:
+        name, values = p.split('=')
+        grid[name] = [cast_parameter_value(v) for v in values.split('|')]
+
+    return grid
+
+
 def restricted_float(x):
     '''
     for argument parsing; restricts float value from 0 to 1
@@ -51,6 +77,16 @@ def restricted_float(x):
     return x
 
 
+def compression_level(x):
+    '''
+    for argument parsing; restricts compression level to integers from 0 to 9
+    '''
+    x = int(x)
+    if x < 0 or x > 9:
+        raise argparse.ArgumentTypeError("%r not in range [0, 9]"%(x,))
+    return x
+
+
 def summaryHelpEpilog():
     '''
     text for help epilog for
@@ -110,9 +146,10 @@ numericLabels=TRUE
     return inputFileFormatHelp + '\n\n' + wgcnaParametersHelp
 
 
-def parse_command_line_args(program='iterativeWGCNA', description='perform iterativeWGCNA analysis'):
+def run_argument_parser(program='iterativeWGCNA', description='perform iterativeWGCNA analysis'):
     '''
-    parse command line args
+    build the argument parser for options
+    shared by all modes that run iterativeWGCNA
     '''
 
     parser = argparse.ArgumentParser(prog=program,
@@ -140,6 +177,12 @@ def parse_command_line_args(program='iterativeWGCNA', description='perform itera
     parser.add_argument('--debug',
                         help="print debugging messages",
                         action='store_true')
+
+    parser.add_argument('--profile',
+                        help="profile calls across the Python/R boundary;\n"
+                        + "writes a Chrome trace-event file (iterativeWGCNA-trace.json)\n"
+                        + "and logs call counts, time, and bytes converted",
+                        action='store_true')
     
     parser.add_argument('-p', '--wgcnaParameters',
                         metavar='<param list>',
@@ -149,10 +192,103 @@ def parse_command_line_args(program='iterativeWGCNA', description='perform itera
                         + "see WGCNA manual & more info below",
                         type=parameter_list)
 
+    parser.add_argument('--minVariance',
+                        metavar='<variance>',
+                        help="prefilter: exclude genes whose expression variance\n"
+                        + "is below this value before the first pass",
+                        type=float)
+
+    parser.add_argument('--minMAD',
+                        metavar='<MAD>',
+                        help="prefilter: exclude genes whose median absolute deviation\n"
+                        + "is below this value before the first pass",
+                        type=float)
+
+    parser.add_argument('--minMean',
+                        metavar='<mean>',
+                        help="prefilter: exclude genes whose mean expression\n"
+                        + "is below this value before the first pass",
+                        type=float)
+
+    parser.add_argument('--maxMissingFraction',
+                        metavar='<fraction>',
+                        help="prefilter: exclude genes with a larger fraction of\n"
+                        + "missing (NA) values before the first pass",
+                        type=restricted_float)
+
+    parser.add_argument('--sampleProjection',
+                        metavar='<variance fraction>',
+                        help="for very wide inputs: run all correlations on the\n"
+                        + "projection of the standardized profiles onto the leading\n"
+                        + "sample-space components retaining this fraction of the\n"
+                        + "variance (e.g., 0.9); the correlation error is logged",
+                        type=restricted_float)
+
+    parser.add_argument('--projectedInput',
+                        help="for inputs too large for memory: convert the input to a\n"
+                        + "binary (.npy) cache and compute the sample projection from\n"
+                        + "it in chunks of samples; only the projected profiles are\n"
+                        + "loaded into R (requires --sampleProjection)",
+                        action='store_true')
+
+    parser.add_argument('--binaryCache',
+                        metavar='<file>',
+                        help="binary cache file for --projectedInput;\n"
+                        + "default: <inputFile>.npy")
+
+    parser.add_argument('--minNeighborCorrelation',
+                        metavar='<r>',
+                        help="at the start of each pass, exclude genes whose\n"
+                        + "maximum absolute correlation to any other\n"
+                        + "pass gene is below this value",
+                        type=restricted_float)
+
+    parser.add_argument('--progress',
+                        help="print a status line with the current pass and iteration,\n"
+                        + "genes in play, fraction classified, and estimated time\n"
+                        + "remaining after each iteration (see iterativeWGCNA-status.json)",
+                        action='store_true')
+
+    parser.add_argument('--dryRun', '--dry-run',
+                        dest='dryRun',
+                        help="estimate peak memory and run time for each iteration\n"
+                        + "from the input dimensions and a quick timing calibration\n"
+                        + "on a sample of the data, then exit without running;\n"
+                        + "warns if maxBlockSize does not fit in available memory",
+                        action='store_true')
+
+    parser.add_argument('--autoBlockSize',
+                        help="choose maxBlockSize for each iteration from the number of\n"
+                        + "genes and samples and the available memory (respecting\n"
+                        + "cgroup/container limits); a single block is used whenever\n"
+                        + "the iteration genes fit; overrides maxBlockSize in --wgcnaParameters",
+                        action='store_true')
+
+    parser.add_argument('--memoryLimit',
+                        metavar='<Mb>',
+                        help="memory (Mb) available to WGCNA for --autoBlockSize;\n"
+                        + "default: detected available memory",
+                        type=float)
+
+    parser.add_argument('--memoryRetries',
+                        metavar='<n retries>',
+                        help="number of times an iteration is retried with a smaller\n"
+                        + "block size when R is unable to allocate memory; default: 3",
+                        default=3,
+                        type=int)
+
     parser.add_argument('--enableWGCNAThreads',
                         help="enable WGCNA to use threading;\nsee WGCNA manual",
                         action='store_true')
 
+    parser.add_argument('--threads',
+                        metavar='<n threads>',
+                        help="total thread budget, divided among WGCNA (nThreads),\n"
+                        + "the R and NumPy BLAS, and compression workers; capped by\n"
+                        + "the available CPUs (cgroup CPU quota); the split is logged;\n"
+                        + "overrides --enableWGCNAThreads",
+                        type=int)
+
     parser.add_argument('--skipSaveBlocks',
                         help="do not save WGCNA blockwise modules for each iteration;\n"
                         + "NOTE: without blocks summary graphics cannot be generated.\n"
@@ -160,21 +296,334 @@ def parse_command_line_args(program='iterativeWGCNA', description='perform itera
                         action='store_true')
 
     parser.add_argument('--gzipTOMs',
-                        help="gzip TOM RData files\n",
+                        help="compress TOM RData files\n"
+                        + "(gzip unless --compressionCodec is specified)",
                         action='store_true')
 
+    parser.add_argument('--compressBlocks',
+                        help="compress wgcna-blocks RData files",
+                        action='store_true')
+
+    parser.add_argument('--compressionCodec',
+                        help="codec used to compress TOM and block files; default: gzip",
+                        choices=['gzip', 'bz2', 'lzma'],
+                        default='gzip')
+
+    parser.add_argument('--compressionLevel',
+                        metavar='<level>',
+                        help="compression level [0, 9] (lzma preset); default: 6",
+                        default=6,
+                        type=compression_level)
+
+    parser.add_argument('--compressionProcesses',
+                        metavar='<n processes>',
+                        help="number of worker processes used to compress files\n"
+                        + "in the background; default: 2",
+                        default=2,
+                        type=int)
+
     parser.add_argument('-f', '--finalMergeCutHeight',
                         help="cut height for final merge (after iterations are assembled)",
                         default=0.05,
                         metavar='<cut height>',
                         type=restricted_float)
 
+    return parser
+
+
+def parse_command_line_args(program='iterativeWGCNA', description='perform iterativeWGCNA analysis'):
+    '''
+    parse command line args
+    '''
+
+    parser = run_argument_parser(program, description)
+
     args = parser.parse_args()
     args.wgcnaParameters = set_wgcna_parameter_defaults(args.wgcnaParameters, args.skipSaveBlocks)
 
     return args
 
 
+def parse_sweep_command_line_args():
+    '''
+    parse command line args for a parameter sweep
+    '''
+
+    parser = run_argument_parser(program='iterativeWGCNA: Parameter Sweep',
+                                 description='run iterativeWGCNA for each configuration '
+                                 + 'in a parameter grid')
+
+    parser.add_argument('-g', '--grid',
+                        metavar='<param grid>',
+                        help="comma separated list of param=value1|value2 pairs;\n"
+                        + "one configuration is run for each combination of values\n"
+                        + "e.g., power=6|8,minKMEtoStay=0.7|0.8,finalMergeCutHeight=0.05|0.1\n"
+                        + "finalMergeCutHeight is applied to the final merge, all other\n"
+                        + "parameters are passed to WGCNA's blockwiseModules function",
+                        type=parameter_grid,
+                        required=True)
+
+    parser.add_argument('--processes',
+                        metavar='<n processes>',
+                        help="number of worker processes; each worker loads R once\n"
+                        + "and runs configurations in turn; default: 2",
+                        default=2,
+                        type=int)
+
+    # WGCNA parameter defaults are set per configuration
+    # so that derived defaults (e.g., minCoreKME) follow the grid
+    return parser.parse_args()
+
+
+def parse_batch_command_line_args():
+    '''
+    parse command line args for a batch of runs
+    '''
+
+    parser = argparse.ArgumentParser(prog='iterativeWGCNA: Batch',
+                                     description="run iterativeWGCNA for each job in a manifest "
+                                     + "on a pool of worker processes",
+                                     formatter_class=argparse.RawTextHelpFormatter)
+
+    parser.add_argument('-m', '--manifest',
+                        metavar='<manifest file>',
+                        help="tab-delimited file with header and one job per line:\n"
+                        + "inputFile<tab>workingDir<tab>options\n"
+                        + "where options (optional) are iterativeWGCNA command line options,\n"
+                        + "e.g., -p power=8,minKMEtoStay=0.7 -f 0.1 --skipSaveBlocks;\n"
+                        + "relative paths are resolved relative to the manifest directory",
+                        required=True)
+
+    parser.add_argument('-o', '--workingDir',
+                        help="where the batch log and summary will be saved",
+                        metavar='<output dir>',
+                        default=getcwd())
+
+    parser.add_argument('-v', '--verbose',
+                        help="print status messages",
+                        action='store_true')
+
+    parser.add_argument('--processes',
+                        metavar='<n processes>',
+                        help="number of worker processes; each worker loads R and WGCNA\n"
+                        + "once and runs jobs in turn; default: 2",
+                        default=2,
+                        type=int)
+
+    parser.add_argument('--threads',
+                        metavar='<n threads>',
+                        help="total thread budget, shared equally by the worker\n"
+                        + "processes (capped by the available CPUs / cgroup CPU quota);\n"
+                        + "limits the --threads of each job",
+                        type=int)
+
+    return parser.parse_args()
+
+
+def parse_server_command_line_args():
+    '''
+    parse command line args for the job server
+    '''
+
+    parser = argparse.ArgumentParser(prog='iterativeWGCNA: Server',
+                                     description="run a local (localhost only) job server "
+                                     + "with warm iterativeWGCNA worker processes",
+                                     formatter_class=argparse.RawTextHelpFormatter)
+
+    parser.add_argument('--port',
+                        metavar='<port>',
+                        help="port to listen on (127.0.0.1 only); default: 8765",
+                        default=8765,
+                        type=int)
+
+    parser.add_argument('-o', '--workingDir',
+                        help="where the server log will be saved",
+                        metavar='<output dir>',
+                        default=getcwd())
+
+    parser.add_argument('-v', '--verbose',
+                        help="print status messages",
+                        action='store_true')
+
+    parser.add_argument('--processes',
+                        metavar='<n processes>',
+                        help="number of worker processes (maximum number of jobs run\n"
+                        + "concurrently); each worker loads R and WGCNA once; default: 2",
+                        default=2,
+                        type=int)
+
+    parser.add_argument('--threads',
+                        metavar='<n threads>',
+                        help="total thread budget, shared equally by the worker\n"
+                        + "processes (capped by the available CPUs / cgroup CPU quota);\n"
+                        + "limits the --threads of each job",
+                        type=int)
+
+    parser.add_argument('--maxQueuedJobs',
+                        metavar='<n jobs>',
+                        help="maximum number of jobs queued or running; further\n"
+                        + "submissions are rejected; default: 100",
+                        default=100,
+                        type=int)
+
+    parser.add_argument('--maxCompletedJobs',
+                        metavar='<n jobs>',
+                        help="number of finished jobs whose status and events are\n"
+                        + "kept (oldest are forgotten first); default: 100",
+                        default=100,
+                        type=int)
+
+    return parser.parse_args()
+
+
+def parse_report_command_line_args():
+    '''
+    parse command line args for deferred report generation
+    '''
+
+    parser = argparse.ArgumentParser(prog='iterativeWGCNA: Report',
+                                     description="render plots (e.g., kME histograms) "
+                                     + "from the run record of an iterativeWGCNA run",
+                                     formatter_class=argparse.RawTextHelpFormatter)
+
+    parser.add_argument('-o', '--workingDir',
+                        help="directory containing output from the iterativeWGCNA run;\n"
+                        + "plots will be saved alongside the run output",
+                        metavar='<output dir>',
+                        default=getcwd())
+
+    parser.add_argument('-v', '--verbose',
+                        help="print status messages",
+                        action='store_true')
+
+    parser.add_argument('--processes',
+                        metavar='<n processes>',
+                        help="number of worker processes used to render plots; default: 2",
+                        default=2,
+                        type=int)
+
+    return parser.parse_args()
+
+
+def parse_classify_command_line_args():
+    '''
+    parse command line args for classifying new genes
+    against the modules of an existing run
+    '''
+
+    parser = argparse.ArgumentParser(prog='iterativeWGCNA: Classify New Genes',
+                                     description="assign genes missing from an existing "
+                                     + "iterativeWGCNA result to its modules by eigengene "
+                                     + "connectivity (kME), without rerunning the analysis",
+                                     formatter_class=argparse.RawTextHelpFormatter)
+
+    parser.add_argument('-i', '--inputFile',
+                        metavar='<gene expression file>',
+                        help="expression profiles of the new genes (same format as the\n"
+                        + "iterativeWGCNA input; must include the samples of the run);\n"
+                        + "genes already in the membership file are skipped",
+                        required=True)
+
+    parser.add_argument('-o', '--workingDir',
+                        help="directory containing output from the iterativeWGCNA run;\n"
+                        + "results are written alongside (prefixed with classified-)",
+                        metavar='<output dir>',
+                        default=getcwd())
+
+    parser.add_argument('-v', '--verbose',
+                        help="print status messages",
+                        action='store_true')
+
+    parser.add_argument('--result',
+                        choices=['final', 'merged'],
+                        help="classify against the final- (before merge) or the\n"
+                        + "merged-<finalMergeCutHeight>- modules; default: merged",
+                        default='merged')
+
+    parser.add_argument('-f', '--finalMergeCutHeight',
+                        help="cut height of the merged result; default: 0.05",
+                        default=0.05,
+                        metavar='<cut height>',
+                        type=restricted_float)
+
+    parser.add_argument('--minKMEtoStay',
+                        help="minimum kME for assigning an unclassified gene to a module\n"
+                        + "(use the value from the run); default: 0.8",
+                        default=0.80,
+                        metavar='<minKMEtoStay>',
+                        type=restricted_float)
+
+    parser.add_argument('--reassignThreshold',
+                        help="p-value threshold for moving a gene to a module with higher\n"
+                        + "kME (use the value from the run); default: 0.05",
+                        default=0.05,
+                        metavar='<p-value>',
+                        type=restricted_float)
+
+    parser.add_argument('--batchSize',
+                        metavar='<n genes>',
+                        help="genes read and classified per batch; default: 5000",
+                        default=5000,
+                        type=int)
+
+    return parser.parse_args()
+
+
+def parse_update_command_line_args():
+    '''
+    parse command line args for folding new samples into
+    the eigengenes and kME of an existing run
+    '''
+
+    parser = argparse.ArgumentParser(prog='iterativeWGCNA: Update Samples',
+                                     description="incrementally update module eigengenes "
+                                     + "and kME of an existing iterativeWGCNA result "
+                                     + "with appended samples",
+                                     formatter_class=argparse.RawTextHelpFormatter)
+
+    parser.add_argument('-n', '--newSamples',
+                        metavar='<gene expression file>',
+                        help="expression profiles of the new samples (same format as the\n"
+                        + "iterativeWGCNA input; rows are matched by gene ID)")
+
+    parser.add_argument('-i', '--inputFile',
+                        metavar='<gene expression file>',
+                        help="input file of the run; required for the first update only,\n"
+                        + "to compute the per-gene sufficient statistics")
+
+    parser.add_argument('-o', '--workingDir',
+                        help="directory containing output from the iterativeWGCNA run;\n"
+                        + "results are written alongside (prefixed with updated-)",
+                        metavar='<output dir>',
+                        default=getcwd())
+
+    parser.add_argument('-v', '--verbose',
+                        help="print status messages",
+                        action='store_true')
+
+    parser.add_argument('--result',
+                        choices=['final', 'merged'],
+                        help="update the final- (before merge) or the\n"
+                        + "merged-<finalMergeCutHeight>- modules; default: merged",
+                        default='merged')
+
+    parser.add_argument('-f', '--finalMergeCutHeight',
+                        help="cut height of the merged result; default: 0.05",
+                        default=0.05,
+                        metavar='<cut height>',
+                        type=restricted_float)
+
+    parser.add_argument('--driftTolerance',
+                        help="flag modules whose folded-in eigengene differs from the\n"
+                        + "first principal component of their members over the new\n"
+                        + "samples by more than this (1 - |r|); default: 0.2",
+                        default=0.2,
+                        metavar='<tolerance>',
+                        type=restricted_float)
+
+    return parser.parse_args()
+
+
 def set_wgcna_parameter_defaults(params, skipSaveBlocks):
     '''
     set default values for WGCNA blockwiseModules
@@ -9,8 +9,11 @@ from __future__ import print_function
 import logging
 
 import rpy2.robjects as ro
-from .r.imports import base, stats, rsnippets
-from .io.utils import write_data_frame
+from .r.imports import rsnippets
+from .io.utils import write_matrix
+from .io.matrix import read_matrix
+from .r.conversion import array2frame, frame2array
+from .standardized import StandardizedProfiles
 from .wgcna import WgcnaManager
 
 class Eigengenes(object):
@@ -21,9 +24,35 @@ class Eigengenes(object):
     def __init__(self, matrix=None, debug=False):
         self.debug = debug
         self.logger = logging.getLogger('iterativeWGCNA.Eigengenes')
+        self.__standardized = None
         self.matrix = matrix
 
 
+    @property
+    def matrix(self):
+        '''
+        the eigengene matrix (R data frame; modules x samples)
+        '''
+        return self.__matrix
+
+
+    @matrix.setter
+    def matrix(self, matrix):
+        self.__matrix = matrix
+        self.__standardized = None
+
+
+    def standardized(self):
+        '''
+        standardized eigengenes for correlations (see
+        standardized.py); computed once per eigengene matrix
+        '''
+        if self.__standardized is None:
+            self.__standardized = StandardizedProfiles(list(self.matrix.rownames),
+                                                       frame2array(self.matrix))
+        return self.__standardized
+
+
     def extract_from_blocks(self, iteration, blocks, samples):
         '''
         extract eigenenges from blockwise WGCNA results
@@ -51,8 +80,24 @@ class Eigengenes(object):
         '''
         loads eigengenes from file into an R DataFrame
         '''
-        self.matrix = ro.DataFrame.from_csvfile(fileName, sep='\t',
-                                                header=True, row_names=1)
+        modules, samples, values = read_matrix(fileName)
+        self.load_matrix(modules, samples, values)
+
+
+    def load_matrix(self, modules, samples, values):
+        '''
+        loads eigengenes from a (modules x samples) array
+        '''
+        self.matrix = array2frame(values, modules, samples)
+
+
+    def snapshot(self):
+        '''
+        returns (modules, samples, values) copy of the
+        eigengene matrix for writing without R
+        '''
+        return (list(self.matrix.rownames), list(self.matrix.colnames),
+                frame2array(self.matrix))
 
 
     def write(self, prefix=''):
@@ -60,7 +105,8 @@ class Eigengenes(object):
         writes the eigengene matrix to file
         '''
         fileName = prefix + 'eigengenes.txt'
-        write_data_frame(self.matrix, fileName, 'Module')
+        modules, samples, values = self.snapshot()
+        write_matrix(fileName, 'Module', modules, samples, values)
 
 
     def similarity(self, module=None):
@@ -71,23 +117,18 @@ class Eigengenes(object):
         if no module is specified, calculate the similarity matrix
         between all eigengenes
         '''
-        if module is None:
-            sim = base().as_data_frame(stats().cor(base().t(self.matrix)))
-        else:
-            sim = base().as_data_frame(stats().cor(base().t(self.matrix), \
-                                            base().t(self.matrix.rx(module, True))))
-        return sim
+        modules = list(self.matrix.rownames)
+        columns = modules if module is None else [module]
+        sim = self.standardized().correlation(None, columns)
+        return array2frame(sim, modules, columns)
 
 
     def correlation(self, m1, m2):
         '''
         calculate correlation between two module eigengenes
         '''
-        e1 = self.get_module_eigengene(m1)
-        e2 = self.get_module_eigengene(m2)
-        cor = base().as_data_frame(stats().cor(base().t(e1), base().t(e2)))
-        cor = round(cor.rx(1, 1)[0], 1)
-        return cor
+        cor = self.standardized().correlation([m1], [m2])
+        return round(float(cor[0, 0]), 1)
 
 
     def equal(self, m1, m2, threshold=0.0):
@@ -151,13 +192,14 @@ class Eigengenes(object):
         self.matrix = self.extract_subset(modules)
 
 
-    def recalculate(self, profiles, membership, power=6):
+    def recalculate(self, profiles, membership, power=6, samples=None):
         '''
         recalculate eigengenes given membership
-        and profiles
+        and profiles; samples default to those of
+        the current eigengene matrix
         '''
         manager = WgcnaManager(profiles, {'power':power}, debug=self.debug)
 
         self.matrix = rsnippets.extractRecalculatedEigengenes(
             manager.module_eigengenes(membership.values()),
-            self.samples())
+            self.samples() if samples is None else samples)
@@ -0,0 +1,231 @@
+# pylint: disable=invalid-name
+'''
+run cost estimator (--dry-run): reads only the dimensions
+of the input (from the binary cache if there is one), times
+the two dominant block computations (gene-gene correlation and
+the TOM matrix product) on a sample of the data, and estimates
+the peak memory and run time of each iteration
+
+the first pass runs on all genes; each later pass runs on the
+residual (unclassified) genes of the previous one. Within a
+pass, the first iteration drops 1 - ITERATION_RETAIN_FRACTION of
+its genes and the fraction dropped by each following iteration
+shrinks geometrically (as in the progress ETA model) until the
+pass converges; the genes left are classified. Later passes are
+projected until fewer than MIN_PASS_GENES (or 2 x minModuleSize)
+genes remain, but a run stops early if a pass classifies no
+genes, so the run time is reported as a range: the first pass
+alone (lower bound) to all projected passes (upper bound)
+
+cost model, per block of b genes and m samples:
+    correlation/adjacency:  b^2 x m multiply-adds
+    TOM:                    b^3 multiply-adds
+    memory:                 see resources.estimate_block_memory
+'''
+
+from __future__ import print_function
+
+from time import perf_counter
+
+import numpy as np
+
+from .io.binary import binary_cache_file, is_current, read_cache_dimensions
+from .io.matrix import count_lines, iter_matrix_chunks, read_header
+from .io.utils import warning
+from .progress import DEFAULT_DROP_DECAY, MIN_PASS_GENES
+from .resources import available_cpus, available_memory, choose_block_size, \
+    estimate_block_memory, max_block_size, BYTES_PER_VALUE, MEMORY_FRACTION, \
+    WGCNA_MAX_BLOCK_SIZE
+from .screen import standardize_rows
+
+CALIBRATION_GENES = 1000 # genes sampled for the timing calibration
+CALIBRATION_REPEATS = 3 # best of
+INPUT_COPIES = 3 # input held by Python, as an R data frame, and transposed for WGCNA
+# assumed fraction of genes retained by the first iteration of a pass
+ITERATION_RETAIN_FRACTION = 0.6
+MAX_ESTIMATED_ITERATIONS = 10
+MAX_ESTIMATED_PASSES = 10
+
+
+def input_dimensions(args):
+    '''
+    returns (gene count, sample count, cache file or None),
+    without reading the expression values
+    '''
+    cacheFile = binary_cache_file(args)
+    if is_current(cacheFile, args.inputFile):
+        geneCount, sampleCount = read_cache_dimensions(cacheFile)
+        return geneCount, sampleCount, cacheFile
+    _, samples = read_header(args.inputFile)
+    return max(count_lines(args.inputFile) - 1, 0), len(samples), None
+
+
+def calibration_sample(args, cacheFile, geneCount=CALIBRATION_GENES):
+    '''
+    expression values of (up to) the first geneCount genes
+    '''
+    if cacheFile is not None:
+        return np.array(np.load(cacheFile, mmap_mode='r')[:geneCount], dtype=np.float64)
+    for _, chunk in iter_matrix_chunks(args.inputFile, chunkRows=geneCount):
+        return chunk
+    return np.zeros((0, 0))
+
+
+def best_time(function, repeats=CALIBRATION_REPEATS):
+    '''
+    shortest wall time (seconds) of repeated calls
+    '''
+    times = []
+    for _ in range(repeats):
+        start = perf_counter()
+        function()
+        times.append(perf_counter() - start)
+    return min(times)
+
+
+def calibrate(values, power=6):
+    '''
+    time correlation and TOM-like products on a sample;
+    returns seconds per correlation multiply-add (genes^2 x samples)
+    and per TOM multiply-add (genes^3)
+    '''
+    standardized = standardize_rows(values)
+    geneCount, sampleCount = standardized.shape
+    if geneCount < 2 or sampleCount < 2:
+        raise ValueError("too few genes or samples to calibrate")
+    correlationTime = best_time(lambda: np.dot(standardized, standardized.T))
+    adjacency = np.abs(np.dot(standardized, standardized.T)) ** power
+    tomTime = best_time(lambda: np.dot(adjacency, adjacency))
+    return (correlationTime / (float(geneCount) ** 2 * sampleCount),
+            tomTime / float(geneCount) ** 3)
+
+
+def iteration_cost(geneCount, sampleCount, blockSize, correlationRate, tomRate):
+    '''
+    estimated (blocks, seconds, peak bytes) for an iteration
+    '''
+    blockSize = min(blockSize, geneCount)
+    blockCount = -(-geneCount // blockSize)
+    sizes = [blockSize] * (blockCount - 1) + [geneCount - blockSize * (blockCount - 1)]
+    seconds = sum(correlationRate * b * b * sampleCount + tomRate * b ** 3 for b in sizes)
+    memory = estimate_block_memory(blockSize, sampleCount) \
+             + INPUT_COPIES * BYTES_PER_VALUE * geneCount * sampleCount
+    return blockCount, seconds, memory
+
+
+def pass_iterations(geneCount, minModuleSize):
+    '''
+    modeled gene counts of the iterations of a pass on geneCount
+    genes; returns (list of gene counts, genes classified by the pass)
+    '''
+    counts = []
+    genes = geneCount
+    dropFraction = 1.0 - ITERATION_RETAIN_FRACTION
+    while genes >= 2 * minModuleSize and len(counts) < MAX_ESTIMATED_ITERATIONS:
+        counts.append(genes)
+        dropped = int(genes * dropFraction)
+        if dropped == 0: # converged
+            break
+        genes = genes - dropped
+        dropFraction = dropFraction * DEFAULT_DROP_DECAY
+    return counts, genes if counts else 0
+
+
+def run_passes(geneCount, minModuleSize):
+    '''
+    modeled passes of a run: list of the iteration gene counts
+    of each pass, the first on all genes and each later one on
+    the residuals of the previous pass
+    '''
+    passes = []
+    genes = geneCount
+    while genes >= max(MIN_PASS_GENES, 2 * minModuleSize) \
+          and len(passes) < MAX_ESTIMATED_PASSES:
+        counts, classified = pass_iterations(genes, minModuleSize)
+        if classified == 0:
+            break
+        passes.append(counts)
+        genes = genes - classified
+    return passes
+
+
+def format_duration(seconds):
+    '''
+    seconds as h:mm:ss
+    '''
+    seconds = int(round(seconds))
+    return "%d:%02d:%02d" % (seconds // 3600, (seconds % 3600) // 60, seconds % 60)
+
+
+def format_memory(memory):
+    '''
+    bytes as Mb
+    '''
+    return str(int(round(memory / 1048576.0))) + " Mb"
+
+
+def dry_run(args):
+    '''
+    print the cost estimate for a run; returns False if
+    the configured block size does not fit in memory
+    '''
+    geneCount, sampleCount, cacheFile = input_dimensions(args)
+    print("Input: " + args.inputFile + ("" if cacheFile is None
+                                         else " (binary cache: " + cacheFile + ")"))
+    print(str(geneCount) + " genes x " + str(sampleCount) + " samples")
+
+    sample = calibration_sample(args, cacheFile)
+    power = args.wgcnaParameters.get('power', 6)
+    correlationRate, tomRate = calibrate(sample, power)
+    print("Calibration (" + str(sample.shape[0]) + " genes): "
+          + "%.3g s per 1e9 correlation operations, " % (correlationRate * 1e9)
+          + "%.3g s per 1e9 TOM operations" % (tomRate * 1e9))
+
+    memory = args.memoryLimit * 1048576.0 if args.memoryLimit is not None \
+             else available_memory()
+    fits = True
+    if not args.autoBlockSize:
+        blockSize = args.wgcnaParameters.get('maxBlockSize', WGCNA_MAX_BLOCK_SIZE)
+        blockMemory = estimate_block_memory(min(blockSize, geneCount), sampleCount)
+        # the same margin as choose_block_size (via max_block_size)
+        if memory is not None and blockMemory > MEMORY_FRACTION * memory:
+            fits = False
+            warning("WARNING: maxBlockSize = " + str(blockSize) + " needs an estimated "
+                    + format_memory(blockMemory) + " per block, but only "
+                    + format_memory(MEMORY_FRACTION * memory) + " ("
+                    + str(int(100 * MEMORY_FRACTION)) + "% of "
+                    + format_memory(memory) + " available) may be used; use maxBlockSize <= "
+                    + str(max_block_size(sampleCount, memory)) + " or --autoBlockSize")
+
+    print('\t'.join(('Iteration', 'Genes', 'maxBlockSize', 'Blocks',
+                     'Peak Memory', 'Time (h:mm:ss)')))
+    passSeconds = []
+    peakMemory = 0
+    minModuleSize = args.wgcnaParameters.get('minModuleSize', 20)
+    for passCount, counts in enumerate(run_passes(geneCount, minModuleSize), 1):
+        seconds = 0.0
+        for iteration, genes in enumerate(counts, 1):
+            if args.autoBlockSize:
+                blockSize, _ = choose_block_size(genes, sampleCount, args.memoryLimit)
+            blockCount, iterationSeconds, peak = iteration_cost(genes, sampleCount, blockSize,
+                                                                correlationRate, tomRate)
+            seconds = seconds + iterationSeconds
+            peakMemory = max(peakMemory, peak)
+            print('\t'.join(('P' + str(passCount) + '_I' + str(iteration), str(genes),
+                             str(min(blockSize, genes)), str(blockCount), format_memory(peak),
+                             format_duration(iterationSeconds))))
+        passSeconds.append(seconds)
+
+    if passSeconds:
+        print("Estimated run time: " + format_duration(passSeconds[0]) + " (first pass only) to "
+              + format_duration(sum(passSeconds)) + " (all " + str(len(passSeconds))
+              + " projected passes); peak memory " + format_memory(peakMemory))
+    else:
+        print("Too few genes for a module (minModuleSize = " + str(minModuleSize) + ")")
+    print("Assumes " + str(int(100 * ITERATION_RETAIN_FRACTION)) + "% of genes are retained "
+          + "by the first iteration of each pass (and a shrinking fraction dropped by each "
+          + "following iteration); excludes pre-clustering of multi-block iterations; "
+          + "timings are for the NumPy BLAS on " + str(available_cpus()) + " CPUs")
+    if memory is not None:
+        print("Available memory: " + format_memory(memory))
+    return fits
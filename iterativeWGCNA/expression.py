@@ -5,17 +5,45 @@ functions for manipulating expression profile matrices
 '''
 
 import rpy2.robjects as ro
+from .r.conversion import frame2array
+from .standardized import StandardizedProfiles
 
 class Expression(object):
     '''
     store and manipulate expression profile matrix
     '''
     def __init__(self, data):
+        self.__standardized = None
         self.profiles = data
         self.size = len(self.profiles)
         return None
 
 
+    @property
+    def profiles(self):
+        '''
+        the expression profile matrix (R data frame)
+        '''
+        return self.__profiles
+
+
+    @profiles.setter
+    def profiles(self, data):
+        self.__profiles = data
+        self.__standardized = None
+
+
+    def standardized(self):
+        '''
+        standardized profiles for correlations (see
+        standardized.py); computed once per profile matrix
+        '''
+        if self.__standardized is None:
+            self.__standardized = StandardizedProfiles(self.genes(),
+                                                       frame2array(self.profiles))
+        return self.__standardized
+
+
     def genes(self):
         '''
         return genes (row names)
@@ -59,6 +87,16 @@ class Expression(object):
         return self.profiles.rx(ro.StrVector(genes), True)
 
 
+    def snapshot(self, genes):
+        '''
+        returns (genes, samples, values) copy of the
+        expression data for a list of genes
+        for writing without R
+        '''
+        return (list(genes), list(self.samples()),
+                frame2array(self.gene_expression(genes)))
+
+
     def residual_expression(self, unclassifiedGenes):
         '''
         subsets expression data
@@ -9,14 +9,21 @@ import logging
 from collections import OrderedDict
 from collections import Counter
 
+import numpy as np
 import rpy2.robjects as ro
 
 # from .expression import Expression
-from .analysis import calculate_kME
+from .analysis import calculate_kME, critical_correlation
 from .eigengenes import Eigengenes
-from .r.imports import wgcna, stats, base, rsnippets, grdevices
-from .io.utils import xstr
-from .r.manager import RManager
+from .r.imports import rsnippets
+from .io.utils import read_membership, xstr, write_table
+from .reassign import reassign_to_modules
+from .report import plot_kme_histogram
+
+MEMBERSHIP_HEADER = ('Gene', 'Module', 'kME')
+FILTERED_MEMBERSHIP_HEADER = MEMBERSHIP_HEADER + ('Filter',) # if genes were prefiltered
+ITERATION_COUNTS_HEADER = ('N Input Genes', 'N Classified Genes',
+                           'N Residual Genes', 'N Detected Modules')
 
 class Genes(object):
     '''
@@ -35,10 +42,12 @@ class Genes(object):
         self.profiles = exprData
         self.genes = OrderedDict((geneId, {'module': 'UNCLASSIFIED',
                                            'kME':float('NaN'),
-                                           'iteration': None})
+                                           'iteration': None,
+                                           'filter': None})
                                  for geneId in self.profiles.genes())
 
         self.size = len(self.genes)
+        self.filteredCount = 0
         self.iteration = None
         self.debug = debug
 
@@ -164,9 +173,8 @@ class Genes(object):
         return kME for all assignments made
         during current iteration
         '''
-        iterationGenes = self.__extract_iteration_genes(iteration)
-        geneKME = self.__extract_kME()
-        return [kME for gene, kME in geneKME.items() if gene in iterationGenes]
+        return [membership['kME'] for membership in self.genes.values()
+                if membership['iteration'] == iteration]
 
 
     def get_module_kME(self, targetModule):
@@ -205,19 +213,20 @@ class Genes(object):
             return False
 
 
-    def __update_module_kME(self, module, eigengene, genes=None):
+    def __update_module_kME(self, module, eigengenes, genes=None, eigengene=None):
         '''
         update member gene eigengene connectivity (kME)
-        for specified module and eigengene
+        for specified module and the eigengene of the
+        module named by eigengene (default: the same module)
         '''
         members = self.get_module_members(module)
-        memberKME = calculate_kME(self.profiles.gene_expression(members),
-                                  eigengene, False)
+        memberKME = calculate_kME(self.profiles, eigengenes, members,
+                                  [module if eigengene is None else eigengene])[:, 0]
 
-        for gene in memberKME.rownames:
+        for gene, kME in zip(members, memberKME):
             if genes is not None:
                 if gene in genes:
-                    self.__update_kME(gene, round(memberKME.rx(gene, 1)[0], 2))
+                    self.__update_kME(gene, round(float(kME), 2))
 
 
     def update_kME(self, eigengenes, genes=None):
@@ -226,45 +235,100 @@ class Genes(object):
         '''
         modules = self.get_modules()
         for m in modules:
-            moduleEigengene = eigengenes.get_module_eigengene(m)
-            self.__update_module_kME(m, moduleEigengene, genes)
+            self.__update_module_kME(m, eigengenes, genes)
 
 
-    def write(self, prefix='', iteration=None):
+    def mark_filtered(self, reasons):
         '''
-        writes the membership and eigengene connectivity
-        to files
+        record genes excluded by the prefilter (gene -> reason);
+        filtered genes stay UNCLASSIFIED and are never
+        considered for classification
+        '''
+        for gene, reason in reasons.items():
+            self.__update_module(gene, 'UNCLASSIFIED')
+            self.genes[gene]['filter'] = reason
+        self.filteredCount = self.filteredCount + len(reasons)
+
+
+    def is_filtered(self, gene):
+        '''
+        returns True if the gene was excluded by the prefilter
+        '''
+        return self.genes[gene]['filter'] is not None
+
+
+    def membership_header(self):
+        '''
+        header of the membership files; includes the filter
+        reason column if genes were prefiltered
+        '''
+        return FILTERED_MEMBERSHIP_HEADER if self.filteredCount > 0 else MEMBERSHIP_HEADER
+
+
+    def snapshot_membership(self, iteration=None):
+        '''
+        returns the membership and eigengene connectivity
+        as a list of (gene, module, kME) string tuples
+        (plus the filter reason if genes were prefiltered)
         filtering for specific iteration if specified
         '''
         summaryGenes = None
         if iteration is None:
             summaryGenes = self.genes
         else:
-            iterationGenes = self.__extract_iteration_genes(iteration)
+            iterationGenes = set(self.__extract_iteration_genes(iteration))
             summaryGenes = OrderedDict((gene, membership) for gene, membership
                                        in self.genes.items()
                                        if gene in iterationGenes
                                        and membership['module'] != 'UNCLASSIFIED')
 
-        with open(prefix + 'membership.txt', 'w') as f:
-            print('\t'.join(('Gene', 'Module', 'kME')), file=f)
-            for g in summaryGenes:
-                print('\t'.join((g, self.genes[g]['module'], xstr(self.genes[g]['kME']))), file=f)
+        if self.filteredCount > 0:
+            return [(g, self.genes[g]['module'], xstr(self.genes[g]['kME']),
+                     xstr(self.genes[g]['filter'])) for g in summaryGenes]
+        return [(g, self.genes[g]['module'], xstr(self.genes[g]['kME'])) for g in summaryGenes]
+
+
+    def write(self, prefix='', iteration=None):
+        '''
+        writes the membership and eigengene connectivity
+        to files
+        filtering for specific iteration if specified
+        '''
+        write_table(prefix + 'membership.txt', self.membership_header(),
+                    self.snapshot_membership(iteration))
         return None
 
 
+    def iteration_counts(self):
+        '''
+        returns the iteration summary counts:
+        input, classified, and residual genes, and detected modules
+        '''
+        numClassifiedGenes = self.count_classified_genes()
+        return (self.size,
+                numClassifiedGenes,
+                self.size - numClassifiedGenes,
+                self.count_modules(self.get_classified_genes()))
+
+
     def write_iteration_counts(self, prefix=''):
         '''
         print iteration summary
         '''
-        with open(prefix + 'summary.txt', 'w') as f:
-            print('\t'.join(('N Input Genes', 'N Classified Genes',
-                             'N Residual Genes', 'N Detected Modules')), file=f)
-            numClassifiedGenes = self.count_classified_genes()
-            print('\t'.join((str(self.size),
-                             str(numClassifiedGenes),
-                             str(self.size - numClassifiedGenes),
-                             str(self.count_modules(self.get_classified_genes())))), file=f)
+        write_table(prefix + 'summary.txt', ITERATION_COUNTS_HEADER, [self.iteration_counts()])
+
+
+    def histogram_kme(self, iteration, prefix=''):
+        '''
+        returns the kME values plotted in the kme histogram:
+        all classified genes for final/merged results,
+        otherwise genes classified in the specified iteration
+        '''
+        if 'final' in prefix or 'merge' in prefix:
+            return [membership['kME'] for membership in self.genes.values()
+                    if membership['module'] != 'UNCLASSIFIED']
+
+        return self.get_iteration_kME(iteration)
 
 
     def plot_kme_histogram(self, iteration, prefix='', vline=0.80):
@@ -272,21 +336,8 @@ class Genes(object):
         generate kme histogram for genes classified in
         current iteration
         '''
-        kmeVector = None
-        if 'final' in prefix or 'merge' in prefix:
-            classifiedGenes = self.get_classified_genes()
-            geneKME = self.__extract_kME()
-            kmeVector = [kME for gene, kME in geneKME.items() if gene in classifiedGenes]
-        else:
-            kmeVector = self.get_iteration_kME(iteration)
-
-        if kmeVector is not None:
-            if len(kmeVector) != 0:
-                manager = RManager(kmeVector)
-                grdevices().pdf(prefix + "kme_histogram.pdf")
-                manager.histogram(vline, {'main': 'Gene -> Assigned Module kME for iteration ' + iteration,
-                                          'xlab': 'kME', 'ylab':'Gene Count'})
-                grdevices().dev_off()
+        plot_kme_histogram(self.histogram_kme(iteration, prefix),
+                           iteration, prefix + "kme_histogram.pdf", vline)
 
 
     def count_module_members(self, genes=None):
@@ -338,10 +389,11 @@ class Genes(object):
     def get_unclassified_genes(self):
         '''
         get unclassified genes
+        (excluding genes removed by the prefilter)
         '''
-        membership = self.__extract_modules()
-        unclassifiedGenes = [gene for gene, module in membership.items()
-                             if module == 'UNCLASSIFIED']
+        unclassifiedGenes = [gene for gene, membership in self.genes.items()
+                             if membership['module'] == 'UNCLASSIFIED'
+                             and membership['filter'] is None]
         return unclassifiedGenes
 
 
@@ -454,7 +506,7 @@ class Genes(object):
                 for g in memberGenes:
                     self.__update_module(g, m2)
                     self.__update_classified_iteration(g, 'FINAL_MERGE')
-                self.__update_module_kME(m1, eigengenes.get_module_eigengene(m2))
+                self.__update_module_kME(m1, eigengenes, eigengene=m2)
 
                 modules = self.get_modules()
                 classifiedGeneMembership = self.get_gene_membership(classifiedGenes)
@@ -486,67 +538,68 @@ class Genes(object):
 
         returns a count of the number of reassigned genes
         '''
-        count = 0
         modules = self.get_modules()
-        for m in modules:
-            # calculate kME of all genes to the module eigengene
-            moduleEigengene = eigengenes.get_module_eigengene(m)
-            moduleKME = calculate_kME(self.profiles.expression(), moduleEigengene, True)
-
-            # for each gene not assigned to the current module, test fit
-            for g in self.genes:
-                currentModule = self.get_module(g)
-                if currentModule != m:
-                    kME = self.get_kME(g)
-                    newKME = round(moduleKME.rx2('cor').rx(g, 1)[0], 2)
-                    pvalue = moduleKME.rx2('p').rx(g, 1)[0]
-
-                    if (currentModule == "UNCLASSIFIED" \
-                        and newKME >= minKMEtoStay) \
-                        or (newKME > kME \
-                        and pvalue < reassignThreshold):
-
-                        self.__update_module(g, m)
-                        self.__update_kME(g, newKME)
-                        count = count + 1
+        genes = [g for g in self.genes if not self.is_filtered(g)]
+        # kME of all genes to all module eigengenes, and the |kME|
+        # above which the correlation p-value < reassignThreshold
+        kME = calculate_kME(self.profiles, eigengenes, genes, modules)
+        significant = np.abs(kME) > critical_correlation(
+            reassignThreshold, self.profiles.standardized().sample_counts(genes))[:, None]
+
+        moduleIndex = dict((m, i) for i, m in enumerate(modules))
+        current = np.array([moduleIndex.get(self.get_module(g), -1) for g in genes])
+        currentKME = [self.get_kME(g) for g in genes]
+        assigned, assignedKME, count = reassign_to_modules(kME, significant, minKMEtoStay,
+                                                           current, currentKME)
+        # a gene never returns to a module it left, so every
+        # reassigned gene ends in a different module
+        for g in np.nonzero(assigned != current)[0]:
+            self.__update_module(genes[g], modules[assigned[g]])
+            self.__update_kME(genes[g], float(assignedKME[g]))
 
         return count
 
 
     def load_membership(self, fileName=None):
         '''
-        loads membership
+        loads membership, kME and (if genes were prefiltered)
+        the filter reason of each gene, so that genes excluded
+        by the prefilter stay excluded; the file is parsed
+        natively (see io.utils.read_membership), so gene ids
+        are not altered by R
         '''
         if fileName is None:
             fileName = "final-membership.txt"
 
-        membership = ro.DataFrame.from_csvfile(fileName, sep='\t',
-                                               header=True, row_names=1, as_is=True)
+        header, membership = read_membership(fileName)
+        index = header.index('Module')
+        kMEIndex = header.index('kME')
+        filterIndex = header.index('Filter') if 'Filter' in header else None
 
         if self.debug:
-            self.logger.debug("Loaded membership from file " + fileName + "; see R-log")
-            ro.r("print('Loaded membership from file -- head of file:')")
-            self.logger.debug(membership.head())
-
-        index = membership.names.index('Module') + 1 # add 1 b/c of python/rpy2/R inconsistency
-
-        if self.debug:
-            self.logger.debug("Adjusted index of Module column: " + str(index))
+            self.logger.debug("Loaded membership from file " + fileName
+                              + " (" + str(len(membership)) + " genes)")
 
         classifiedCount = 0
         unclassifiedCount = 0
+        filtered = {}
         for g in self.genes:
-            gStr = ro.StrVector([str(g)])
-            # strange, but necessary so that rpy2 will treat numeric gene ids as strings
-            # python str() conversion did not work
-
-            module = membership.rx(gStr[0], index)[0]
+            row = membership[g]
+            module = row[index]
 
             if module == 'UNCLASSIFIED':
                 unclassifiedCount = unclassifiedCount + 1
             else:
                 classifiedCount = classifiedCount + 1
             self.__update_module(g, module)
+            kME = row[kMEIndex]
+            self.__update_kME(g, float('NaN') if kME in ('', 'NA') else float(kME))
+            if filterIndex is not None and row[filterIndex] != '':
+                filtered[g] = row[filterIndex]
+
+        self.mark_filtered(filtered)
 
         self.logger.info("Loaded " + str(classifiedCount) + " classified genes")
         self.logger.info("Loaded " + str(unclassifiedCount) + " unclassified genes")
+        if filtered:
+            self.logger.info("Loaded " + str(len(filtered)) + " genes excluded by the prefilter")
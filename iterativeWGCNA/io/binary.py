@@ -0,0 +1,115 @@
+# pylint: disable=invalid-name
+'''
+binary (.npy) cache of an expression matrix, for inputs
+too large to hold in memory: the tab-delimited input is
+converted once, block by block, and then memory-mapped;
+row and column labels are kept in a tab-delimited sidecar
+file (<cache>.labels; first line: samples, then one gene
+per line)
+
+NOTE: this module must not import R
+'''
+
+import os
+
+import numpy as np
+
+from .matrix import CHUNK_ROWS, count_lines, iter_matrix_chunks, read_header
+
+LABELS_SUFFIX = '.labels'
+
+
+def binary_cache_file(args):
+    '''
+    cache file for the input: the --binaryCache file if
+    specified, otherwise <inputFile>.npy (or the input
+    itself if it is a .npy file)
+    '''
+    if getattr(args, 'binaryCache', None) is not None:
+        return args.binaryCache
+    if args.inputFile.endswith('.npy'):
+        return args.inputFile
+    return args.inputFile + '.npy'
+
+
+def is_current(cacheFile, inputFile):
+    '''
+    True if the cache (and its labels) exist and
+    are not older than the input file
+    '''
+    if not os.path.exists(cacheFile) or not os.path.exists(cacheFile + LABELS_SUFFIX):
+        return False
+    if cacheFile == inputFile or not os.path.exists(inputFile):
+        return True
+    return os.path.getmtime(cacheFile) >= os.path.getmtime(inputFile)
+
+
+def write_binary_cache(inputFile, cacheFile, chunkRows=CHUNK_ROWS):
+    '''
+    convert a tab-delimited matrix to a .npy file (float64,
+    genes x samples) without holding the matrix in memory
+    '''
+    _, samples = read_header(inputFile)
+    rowCount = max(count_lines(inputFile) - 1, 0)
+    tmpFile = cacheFile + '.tmp'
+    values = np.lib.format.open_memmap(tmpFile, mode='w+', dtype=np.float64,
+                                       shape=(rowCount, len(samples)))
+    genes = []
+    for names, chunk in iter_matrix_chunks(inputFile, chunkRows):
+        values[len(genes):len(genes) + len(names)] = chunk
+        genes.extend(names)
+    values.flush()
+    del values
+
+    if len(set(genes)) != len(genes):
+        os.remove(tmpFile)
+        raise ValueError("Duplicate row labels (e.g., gene IDs) in " + inputFile)
+    if len(genes) < rowCount:
+        # blank lines in the input; rewrite without the unused rows
+        source = np.load(tmpFile, mmap_mode='r')
+        trimmed = np.lib.format.open_memmap(tmpFile + '.trim', mode='w+', dtype=np.float64,
+                                            shape=(len(genes), len(samples)))
+        for start in range(0, len(genes), chunkRows):
+            end = min(start + chunkRows, len(genes))
+            trimmed[start:end] = source[start:end]
+        trimmed.flush()
+        del source, trimmed
+        os.replace(tmpFile + '.trim', tmpFile)
+
+    with open(cacheFile + LABELS_SUFFIX, 'w') as f:
+        f.write('\t'.join(samples) + '\n')
+        f.write(''.join(gene + '\n' for gene in genes))
+    os.replace(tmpFile, cacheFile)
+
+
+def read_cache_labels(cacheFile):
+    '''
+    returns (genes, samples) from the labels sidecar file
+    '''
+    with open(cacheFile + LABELS_SUFFIX) as f:
+        samples = f.readline().rstrip('\n').split('\t')
+        genes = [line.rstrip('\n') for line in f]
+    return genes, samples
+
+
+def read_cache_dimensions(cacheFile):
+    '''
+    returns (gene count, sample count) of the cached matrix
+    (reads the .npy header only)
+    '''
+    return np.load(cacheFile, mmap_mode='r').shape
+
+
+def open_binary_cache(inputFile, cacheFile):
+    '''
+    returns (genes, samples, values), where values is a read-only
+    memory map of the cached matrix; the cache is (re)built
+    from the input file if it is missing or out of date
+    '''
+    if not is_current(cacheFile, inputFile):
+        write_binary_cache(inputFile, cacheFile)
+    genes, samples = read_cache_labels(cacheFile)
+    values = np.load(cacheFile, mmap_mode='r')
+    if values.shape != (len(genes), len(samples)):
+        raise ValueError("Binary cache " + cacheFile + " does not match its labels")
+    return genes, samples, values
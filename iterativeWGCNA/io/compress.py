@@ -0,0 +1,164 @@
+# pylint: disable=invalid-name
+'''
+streaming, verified compression of large output files
+(e.g., TOM and wgcna-blocks .RData files)
+
+NOTE: this module must not import R (directly or through
+other iterativeWGCNA modules); its functions run in
+worker processes that never touch the embedded R
+'''
+
+import bz2
+import gzip
+import logging
+import lzma
+import multiprocessing
+import os
+import zlib
+
+from ..resources import thread_environment
+
+CHUNK_SIZE = 4 * 1024 * 1024 # 4 MB
+
+# codec -> (open function, name of compression level argument, file extension)
+CODECS = {'gzip': (gzip.open, 'compresslevel', '.gz'),
+          'bz2': (bz2.open, 'compresslevel', '.bz2'),
+          'lzma': (lzma.open, 'preset', '.xz')}
+
+
+def archive_name(fileName, codec):
+    '''
+    name of the compressed file
+    '''
+    return fileName + CODECS[codec][2]
+
+
+def open_archive(fileName, mode, codec, level=None):
+    '''
+    open a compressed file using the specified codec
+    '''
+    openFunction, levelArg, _ = CODECS[codec]
+    if level is None:
+        return openFunction(fileName, mode)
+    if codec == 'bz2':
+        level = max(level, 1) # bz2 does not support level 0
+    return openFunction(fileName, mode, **{levelArg: level})
+
+
+def stream_checksum(stream):
+    '''
+    crc32 and length of a stream, read in fixed-size chunks
+    '''
+    checksum = 0
+    length = 0
+    chunk = stream.read(CHUNK_SIZE)
+    while chunk:
+        checksum = zlib.crc32(chunk, checksum)
+        length = length + len(chunk)
+        chunk = stream.read(CHUNK_SIZE)
+    return checksum, length
+
+
+def compress_file(fileName, codec='gzip', level=6):
+    '''
+    compress a file in fixed-size chunks, verify the archive
+    by decompressing it, and only then remove the original
+
+    returns (fileName, original size, compressed size)
+    '''
+    archive = archive_name(fileName, codec)
+    partial = archive + '.part'
+
+    checksum = 0
+    length = 0
+    with open(fileName, 'rb') as plainFile:
+        with open_archive(partial, 'wb', codec, level) as zipFile:
+            chunk = plainFile.read(CHUNK_SIZE)
+            while chunk:
+                checksum = zlib.crc32(chunk, checksum)
+                length = length + len(chunk)
+                zipFile.write(chunk)
+                chunk = plainFile.read(CHUNK_SIZE)
+
+    with open_archive(partial, 'rb', codec) as zipFile:
+        verified = stream_checksum(zipFile) == (checksum, length)
+
+    if not verified:
+        os.remove(partial)
+        raise IOError("Verification of compressed file failed; original retained: " + fileName)
+
+    os.rename(partial, archive)
+    os.remove(fileName)
+    return fileName, length, os.path.getsize(archive)
+
+
+def matching_files(directory, pattern):
+    '''
+    files in the directory whose names contain the pattern,
+    excluding archives and partially written archives
+    '''
+    extensions = tuple(ext for _, _, ext in CODECS.values()) + ('.part',)
+    return [os.path.join(directory, fileName) for fileName in sorted(os.listdir(directory))
+            if pattern in fileName and not fileName.endswith(extensions)]
+
+
+class Compressor(object):
+    '''
+    compress files on a pool of worker processes
+    while the main computation continues
+    '''
+
+    def __init__(self, codec='gzip', level=6, processes=2):
+        self.logger = logging.getLogger('iterativeWGCNA.Compressor')
+        self.codec = codec
+        self.level = level
+        self.pending = []
+        # spawn, not fork: R is already running in this process,
+        # and a forked copy of it (and of its BLAS/OpenMP thread
+        # pools) is not safe to use; the workers only run
+        # compress_file and are limited to a single BLAS/OpenMP
+        # thread (the variables are read when the worker starts)
+        with thread_environment(1):
+            self.pool = multiprocessing.get_context('spawn').Pool(processes=processes)
+
+
+    def submit(self, directory, pattern):
+        '''
+        queue compression of all files in the directory
+        whose names contain the pattern
+        '''
+        for fileName in matching_files(directory, pattern):
+            self.pending.append((fileName,
+                                 self.pool.apply_async(compress_file,
+                                                       (fileName, self.codec, self.level))))
+
+
+    def wait(self):
+        '''
+        wait for all queued files to be compressed;
+        returns a list of error messages
+        '''
+        errors = []
+        try:
+            for fileName, result in self.pending:
+                try:
+                    _, originalSize, compressedSize = result.get()
+                    self.logger.info("Compressed " + fileName + " (" + str(originalSize)
+                                     + " -> " + str(compressedSize) + " bytes)")
+                except (IOError, OSError, EOFError, zlib.error, lzma.LZMAError) as err:
+                    errors.append("Unable to compress " + fileName + ": " + str(err))
+        finally:
+            self.pending = []
+        return errors
+
+
+    def close(self):
+        '''
+        wait for pending work and shut down the pool;
+        returns a list of error messages
+        '''
+        try:
+            return self.wait()
+        finally:
+            self.pool.close()
+            self.pool.join()
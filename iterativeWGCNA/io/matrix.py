@@ -0,0 +1,173 @@
+# pylint: disable=invalid-name
+'''
+native reading and writing of tab-delimited numeric matrices
+(e.g., gene expression profiles and eigengenes)
+
+rows are parsed in chunks directly into a preallocated float
+array; row and column labels are kept exactly as in the file
+(no R-style "X" prefixes or '-' to '.' substitution)
+
+NOTE: this module must not import R; it is used
+on the output writer thread and in worker processes
+'''
+
+import gzip
+import os
+import re
+from itertools import islice
+
+import numpy as np
+
+CHUNK_ROWS = 2000 # rows parsed per call to the numpy parser
+READ_BUFFER = 4 * 1024 * 1024 # 4 MB
+WRITE_BUFFER = 4 * 1024 * 1024
+
+# R writes missing values as NA and, like R, empty numeric
+# fields are read as missing; numpy's parser expects nan
+MISSING_VALUE = re.compile(r'\t(?:NA|"NA"|)(?=[\t\r\n]|$)')
+
+
+def open_text(fileName, mode='r'):
+    '''
+    open a (possibly gzipped) text file
+    '''
+    if fileName.endswith('.gz'):
+        return gzip.open(fileName, mode + 't')
+    return open(fileName, mode, buffering=READ_BUFFER)
+
+
+def count_lines(fileName):
+    '''
+    count newline-terminated lines (plus a final
+    unterminated line) in fixed-size binary chunks
+    '''
+    opener = gzip.open if fileName.endswith('.gz') else open
+    count = 0
+    last = b'\n'
+    with opener(fileName, 'rb') as f:
+        chunk = f.read(READ_BUFFER)
+        while chunk:
+            count = count + chunk.count(b'\n')
+            last = chunk[-1:]
+            chunk = f.read(READ_BUFFER)
+    return count + (0 if last == b'\n' else 1)
+
+
+def unquote(value):
+    '''
+    remove surrounding double quotes from a label
+    '''
+    if len(value) > 1 and value[0] == '"' and value[-1] == '"':
+        return value[1:-1]
+    return value
+
+
+def read_header(fileName):
+    '''
+    returns (row label, column names) from the header;
+    as in R, if the header has one field fewer than the data
+    rows, all header fields are column names
+    '''
+    with open_text(fileName) as f:
+        header = [unquote(field) for field in f.readline().rstrip('\r\n').split('\t')]
+        firstRow = f.readline().rstrip('\r\n').split('\t')
+    if len(header) == len(firstRow) - 1:
+        return None, header
+    return header[0], header[1:]
+
+
+def iter_matrix_chunks(fileName, chunkRows=CHUNK_ROWS):
+    '''
+    iterate over a tab-delimited numeric matrix with a header
+    row and row labels in the first column, in blocks of rows
+
+    yields (rowNames, values) for each block, where values
+    is a float64 array; NA and empty values are read as NaN
+    '''
+    _, colNames = read_header(fileName)
+    colCount = len(colNames)
+    valueColumns = range(1, colCount + 1)
+
+    with open_text(fileName) as f:
+        f.readline() # header
+        lineNumber = 1
+        while True:
+            lines = list(islice(f, chunkRows))
+            if not lines:
+                break
+            chunkStart = lineNumber + 1
+            lineNumber = lineNumber + len(lines)
+            lines = [line for line in lines if line.strip()]
+            if not lines:
+                continue
+
+            names = [unquote(line.split('\t', 1)[0]) for line in lines]
+            lines = [MISSING_VALUE.sub('\tnan', line) for line in lines]
+            try:
+                chunk = np.loadtxt(lines, delimiter='\t', usecols=valueColumns,
+                                   dtype=np.float64, ndmin=2, comments=None)
+            except (ValueError, IndexError) as err:
+                raise ValueError("Unable to parse " + fileName + " (lines "
+                                 + str(chunkStart) + "-" + str(lineNumber)
+                                 + "; expected " + str(colCount) + " numeric values "
+                                 + "per row): " + str(err))
+            yield names, chunk
+
+
+def read_matrix(fileName, chunkRows=CHUNK_ROWS):
+    '''
+    read a tab-delimited numeric matrix with a header
+    row and row labels in the first column
+
+    returns (rowNames, colNames, values) where values
+    is a float64 array; NA and empty values are read as NaN
+    '''
+    _, colNames = read_header(fileName)
+    # allocate for the maximum number of rows; trimmed
+    # below if there are blank lines
+    values = np.empty((max(count_lines(fileName) - 1, 0), len(colNames)), dtype=np.float64)
+    rowNames = []
+    for names, chunk in iter_matrix_chunks(fileName, chunkRows):
+        start = len(rowNames)
+        values[start:start + len(names)] = chunk
+        rowNames.extend(names)
+
+    if len(set(rowNames)) != len(rowNames):
+        raise ValueError("Duplicate row labels (e.g., gene IDs) in " + fileName)
+
+    return rowNames, colNames, values[:len(rowNames)]
+
+
+def format_rows(rowNames, values, formatString):
+    '''
+    format a block of matrix rows as tab-delimited text
+    '''
+    if np.isnan(values).any():
+        # numeric fields only; the row names are left as is
+        return ''.join(name + '\t' + (formatString % tuple(row)).replace('nan', 'NA') + '\n'
+                       for name, row in zip(rowNames, values.tolist()))
+    return ''.join(name + '\t' + (formatString % tuple(row)) + '\n'
+                   for name, row in zip(rowNames, values.tolist()))
+
+
+def write_matrix(fileName, rowLabel, rowNames, colNames, values,
+                 chunkRows=CHUNK_ROWS, append=False):
+    '''
+    write numeric matrix to file; an existing file is
+    overwritten unless append is set, in which case
+    the rows are added to it (without a header)
+
+    values are written with 15 significant digits (as written
+    by R) in buffered blocks of rows; NaN is written as NA
+    '''
+    values = np.asarray(values, dtype=np.float64)
+    newFile = not (append and os.path.exists(fileName))
+    formatString = '\t'.join(['%.15g'] * len(colNames))
+    rowNames = list(rowNames)
+
+    with open(fileName, 'w' if newFile else 'a', buffering=WRITE_BUFFER) as f:
+        if newFile:
+            f.write('\t'.join((rowLabel,) + tuple(colNames)) + '\n')
+        for start in range(0, len(rowNames), chunkRows):
+            end = start + chunkRows
+            f.write(format_rows(rowNames[start:end], values[start:end], formatString))
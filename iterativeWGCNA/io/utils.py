@@ -4,27 +4,14 @@ I/O Utils
 from __future__ import print_function
 from __future__ import with_statement
 
+import csv
+from collections import OrderedDict
 from sys import stderr
 from math import isnan
 import os
 import re
 from subprocess import check_call
-import gzip
-
-import rpy2.robjects as ro
-from ..r.imports import rsnippets
-
-def bulk_gzip(directory, pattern):
-    '''
-    gzip all files in the directory that match the pattern
-    '''
-    for filename in os.listdir(directory):
-        if pattern in filename:
-            with open(os.path.join(directory, filename), 'rb') as plain_file:
-                with gzip.open(os.path.join(directory, filename + '.gz'), 'wb') as zip_file:
-                    zip_file.writelines(plain_file)
-
-            os.remove(os.path.join(directory, filename)) # remove the old file
+from .matrix import read_matrix, write_matrix
 
 
 def xstr(value):
@@ -63,59 +50,60 @@ def create_dir(dirName):
 
 def write_data_frame(df, fileName, rowLabel):
     '''
-    write data frame to file; creates new file
+    write numeric data frame to file; creates new file
     if none exists, otherwise appends new eigengenes
     to existing file
     '''
-    try:
-        os.stat(fileName)
-    except OSError:
-        header = (rowLabel,) + tuple(df.colnames)
-        with open(fileName, 'w') as f:
-            print('\t'.join(header), file=f)
-    finally:
-        df.to_csvfile(fileName, quote=False, sep='\t', col_names=False, append=True)
+    from ..r.conversion import frame2array # R is not needed to read membership
+    write_matrix(fileName, rowLabel, list(df.rownames), list(df.colnames),
+                 frame2array(df), append=True)
+
+
+def write_table(fileName, header, rows):
+    '''
+    write tab-delimited rows (with header) to a new file
+    '''
+    with open(fileName, 'w') as f:
+        print('\t'.join(header), file=f)
+        for row in rows:
+            print('\t'.join(str(value) for value in row), file=f)
+
+
+def read_membership(fileName):
+    '''
+    read a membership file (as written by write_table); returns
+    (header, OrderedDict of gene -> row, as a list of strings)
+    '''
+    with open(fileName) as f:
+        reader = csv.reader(f, delimiter='\t', quoting=csv.QUOTE_NONE)
+        header = next(reader)
+        membership = OrderedDict((row[0], row) for row in reader if row)
+    return header, membership
+
 
-        
 def read_data(fileName):
     '''
-    read gene expression data into a data frame
-    and convert numeric (integer) data to real
+    read gene expression data into a (real-valued) data frame;
+    the file is parsed natively (see matrix.read_matrix) so that
+    gene and sample IDs are not altered by R
     '''
-    data = ro.DataFrame.from_csvfile(fileName, sep='\t', header=True, row_names=1)
-    return rsnippets.numeric2real(data)
+    from ..r.conversion import array2frame
+    genes, samples, values = read_matrix(fileName)
+    return array2frame(values, genes, samples)
 
 
-def transpose_file_contents(fileName, rowLabel):
+def repair_gene_id(geneId):
     '''
-    read in a file to a dataframe, transpose, and output
-    use this instead of R transforms b/c R will concatenate
-    an "X" to gene ids starting with a number
+    undo R's alterations to gene ids
     '''
-    with open(fileName, 'r') as f:
-        content = [line.rstrip().split() for line in f]
+    # b/c rpy2 replaces '-' in gene symbols with '.'
+    if '.' in geneId:
+        geneId = geneId.replace('.', '-')
 
-    header = True
-    with open(fileName, 'w') as f:
-        for line in zip(*content):
-            if header:
-                line = list(line)
-                line[0] = rowLabel
-                line = tuple(line)
-                header = False
-
-            # b/c rpy2 replaces '-' in gene symbols with '.'
-            if '.' in line[0]:
-                line = list(line)
-                line[0] = line[0].replace('.', '-')
-                line = tuple(line)
-
-            # b/c R tacks an X on to gene names that start
-            # with a #
-            if re.search('^X\d', line[0]) is not None:
-                print(line[0], file=stderr)
-                line = list(line)
-                line[0] = re.sub('^X', '', line[0])
-                line = tuple(line)
-
-            print('\t'.join(line), file=f)
+    # b/c R tacks an X on to gene names that start
+    # with a #
+    if re.search(r'^X\d', geneId) is not None:
+        print(geneId, file=stderr)
+        geneId = re.sub('^X', '', geneId)
+
+    return geneId
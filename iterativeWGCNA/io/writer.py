@@ -0,0 +1,68 @@
+# pylint: disable=invalid-name
+# pylint: disable=broad-except
+'''
+background writer for iteration output
+'''
+
+import logging
+import threading
+import traceback
+from queue import Queue
+
+class OutputWriter(object):
+    '''
+    performs file output on a background thread so that
+    writes overlap with the next iteration's computation
+
+    tasks are (function, args) pairs operating on Python
+    snapshots of the results; R must not be called from a task
+    (the embedded R is not thread-safe)
+
+    the queue is bounded, so submit() blocks when the writer
+    falls too far behind, limiting the memory held by snapshots
+    '''
+
+    def __init__(self, maxQueueSize=4):
+        self.logger = logging.getLogger('iterativeWGCNA.OutputWriter')
+        self.queue = Queue(maxsize=maxQueueSize)
+        self.errors = []
+        self.thread = threading.Thread(target=self.__run, name='iterativeWGCNA-writer')
+        self.thread.daemon = True
+        self.thread.start()
+
+
+    def __run(self):
+        '''
+        process tasks until the stop signal (None) is received
+        '''
+        while True:
+            task = self.queue.get()
+            try:
+                if task is None:
+                    return
+                function, args = task
+                function(*args)
+            except Exception:
+                self.errors.append(traceback.format_exc())
+            finally:
+                self.queue.task_done()
+
+
+    def submit(self, function, *args):
+        '''
+        queue function(*args) for execution on the writer thread
+        '''
+        if not self.thread.is_alive():
+            raise RuntimeError("Output writer has been closed")
+        self.queue.put((function, args))
+
+
+    def close(self):
+        '''
+        flush the queue and stop the writer thread;
+        returns a list of formatted tracebacks for failed tasks
+        '''
+        if self.thread.is_alive():
+            self.queue.put(None)
+            self.thread.join()
+        return self.errors
@@ -8,19 +8,41 @@ main application
 
 from __future__ import print_function
 
+import gc
 import logging
 import sys
 import os
-from time import strftime
+from collections import Counter, OrderedDict
+from time import strftime, time
 
 import rpy2.robjects as ro
-from .genes import Genes
+from rpy2.rinterface_lib.embedded import RRuntimeError
+from rpy2.robjects.packages import PackageNotInstalledError
+from .genes import Genes, ITERATION_COUNTS_HEADER
 from .expression import Expression
 from .eigengenes import Eigengenes
 from .network import Network
 from .wgcna import WgcnaManager
-from .io.utils import create_dir, read_data, warning, write_data_frame, bulk_gzip
-from .r.imports import base, wgcna, rsnippets
+from .io.utils import create_dir, read_data, warning, write_matrix, write_table
+from .io.writer import OutputWriter
+from .io.compress import Compressor, matching_files
+from .report import append_record, RECORD_FILE
+from .metrics import Metrics, METRICS_FILE
+from .progress import ProgressReporter, STATUS_FILE
+from .prefilter import prefilter_enabled, filter_reasons
+from .screen import screen_isolated_genes
+from .projection import project_samples, component_labels, correlation_error, \
+    ERROR_SAMPLE_GENES
+from .resources import choose_block_size, estimate_block_memory, \
+    is_allocation_failure, reduced_block_size, thread_budget, WGCNA_MAX_BLOCK_SIZE, \
+    numpy_blas_threads, threadpool_limits
+from .streaming import StreamingProfiles, map_gene_chunks, sample_eigengenes
+from .standardized import StandardizedProfiles
+from .io.binary import binary_cache_file, open_binary_cache
+from .r.imports import base, wgcna, rsnippets, rhpcblasctl
+from .r.conversion import array2frame
+from .r.manager import RManager
+from .r import profiler
 
 
 class IterativeWGCNA(object):
@@ -29,20 +51,47 @@ class IterativeWGCNA(object):
 
     flag report = True when generating
     result from existing output
+
+    data: optional pre-loaded expression data frame
+    to use instead of reading args.inputFile
+
+    if args.workingDir is None, no files are written (results
+    are only kept in memory; see api.py) and R output is discarded
     '''
 
-    def __init__(self, args, report=False):
+    def __init__(self, args, report=False, data=None):
         self.args = args
-        create_dir(self.args.workingDir)
-        if not report:
-            self.__verify_clean_working_dir()
+        self.initialDir = os.getcwd()
+        self.rLogger = None
+        self.writer = None
+        self.compressor = None
+        self.listeners = []
+        self.error = None # exception raised by run(), if any
+        self.writeOutput = self.args.workingDir is not None
+        if self.writeOutput:
+            create_dir(self.args.workingDir)
+            if not report:
+                self.__verify_clean_working_dir()
+
+        if not report and (self.writeOutput or getattr(self.args, 'progress', False)):
+            statusFile = os.path.join(os.path.abspath(self.args.workingDir), STATUS_FILE) \
+                         if self.writeOutput else None
+            self.add_listener(ProgressReporter(statusFile,
+                                               terminal=getattr(self.args, 'progress', False)))
 
         if report == 'merge':
             self.args.enableWGCNAThreads = False
+            self.args.threads = None
+        self.threadBudget = None # division of --threads among the stages
+        self.blockSize = None # maxBlockSize of the last blockwiseModules call
 
         self.__initialize_log(report)
         self.logger.info(strftime("%c"))
 
+        if self.args.profile:
+            profiler.enable([RManager, WgcnaManager, Genes, Eigengenes, Expression,
+                             StandardizedProfiles])
+
         self.__initialize_R(report)
         if not report:
             self.__log_parameters()
@@ -56,7 +105,14 @@ class IterativeWGCNA(object):
         # initialize Genes object
         # to store results
         self.profiles = None
-        self.__load_expression_profiles()
+        self.sampleProfiles = None # input profiles, if analyzed in a projected space
+        self.projectionError = None # (max, RMS) correlation error of the projection
+        self.inputMatrix = None # memory-mapped input (--projectedInput)
+        self.inputSamples = None
+        self.sampleBasis = None # samples x components basis of a streamed projection
+        self.metrics = Metrics(fileName=METRICS_FILE if self.writeOutput else None,
+                               rMemory=self.__r_memory_used)
+        self.__load_expression_profiles(data)
         self.__log_input_data()
         self.genes = Genes(self.profiles, debug=self.args.debug)
         self.eigengenes = Eigengenes(debug=args.debug)
@@ -68,6 +124,45 @@ class IterativeWGCNA(object):
             self.iteration = None # unique label for iteration
             self.algorithmConverged = False
             self.passConverged = False
+            # eigengenes of all modules detected so far
+            # (module -> values, in sample order)
+            self.eigengeneHistory = OrderedDict()
+            self.eigengeneSamples = None
+            if not self.writeOutput:
+                self.args.skipSaveBlocks = True
+                self.args.wgcnaParameters['saveTOMs'] = False
+            elif self.args.gzipTOMs or self.args.compressBlocks:
+                self.compressor = Compressor(self.args.compressionCodec,
+                                             self.args.compressionLevel,
+                                             self.args.compressionProcesses)
+            if self.writeOutput:
+                self.writer = OutputWriter()
+
+
+    def add_listener(self, listener):
+        '''
+        register a function to be called with a dict describing
+        each progress event (run, iteration, pass, final, merged);
+        each event has an 'event' type and 'time' plus
+        event-specific counts
+        '''
+        self.listeners.append(listener)
+
+
+    def __notify(self, event, **fields):
+        '''
+        send a progress event to all listeners; listener
+        errors are logged and do not interrupt the run
+        '''
+        if not self.listeners:
+            return
+        fields['event'] = event
+        fields['time'] = time()
+        for listener in self.listeners:
+            try:
+                listener(fields)
+            except Exception:
+                self.logger.exception("Error reporting progress event: " + event)
 
 
     def __verify_clean_working_dir(self):
@@ -76,7 +171,7 @@ class IterativeWGCNA(object):
         iterativeWGCNA output files
         exits to avoid accidental overwrite of earlier runs
         '''
-        conflictingFiles = set(('final-eigengenes.txt', 'final-membership.txt', 'eigengenes.txt'))
+        conflictingFiles = set(('final-eigengenes.txt', 'final-membership.txt'))
         files = set(os.listdir(self.args.workingDir))
         if len(files.intersection(conflictingFiles)) > 0:
             warning("Working Directory: " + self.args.workingDir \
@@ -84,6 +179,136 @@ class IterativeWGCNA(object):
             sys.exit(1)
 
 
+    def __prefilter_genes(self, genes):
+        '''
+        exclude genes that fail the prefilter thresholds
+        (variance, MAD, mean, missing values); returns the
+        genes that pass
+        '''
+        thresholds = lambda values: filter_reasons(values, self.args.minVariance,
+                                                   self.args.minMAD, self.args.minMean,
+                                                   self.args.maxMissingFraction)
+        if self.inputMatrix is not None:
+            # the prefilter is applied first, to all genes (in input order)
+            genes = list(genes)
+            reasons = map_gene_chunks(self.inputMatrix, thresholds)
+        else:
+            genes, _, values = self.profiles.snapshot(genes)
+            reasons = thresholds(values)
+        filtered = OrderedDict((gene, reason) for gene, reason in zip(genes, reasons)
+                               if reason is not None)
+        self.genes.mark_filtered(filtered)
+
+        message = "Prefilter: excluded " + str(len(filtered)) + " of " + str(len(genes)) \
+                  + " genes " + str(dict(Counter(filtered.values())))
+        self.logger.info(message)
+        if self.args.verbose:
+            warning(message)
+        return [gene for gene, reason in zip(genes, reasons) if reason is None]
+
+
+    def __project_samples(self):
+        '''
+        replace the expression profiles with their projection
+        onto the leading sample-space components; the input
+        profiles are kept for calculating output eigengenes
+        '''
+        genes, _, values = self.profiles.snapshot(self.profiles.genes())
+        projected, componentCount, explained = project_samples(values,
+                                                               self.args.sampleProjection)
+        self.projectionError = correlation_error(values, projected)
+        del values
+
+        self.sampleProfiles = self.profiles
+        self.profiles = Expression(array2frame(projected, genes,
+                                               component_labels(componentCount)))
+        self.genes.profiles = self.profiles
+        self.__log_projection(len(genes), len(self.sampleProfiles.samples()),
+                              componentCount, explained)
+
+
+    def __project_input(self, genes, samples, matrix):
+        '''
+        project the memory-mapped input onto the leading
+        sample-space components, streaming over chunks of
+        samples; only the projected profiles are loaded into R
+        '''
+        profiles = StreamingProfiles(matrix)
+        projected, componentCount, explained, self.sampleBasis = \
+            profiles.project_samples(self.args.sampleProjection)
+        self.projectionError = profiles.correlation_error(projected, ERROR_SAMPLE_GENES)
+
+        self.inputMatrix = matrix
+        self.inputSamples = samples
+        self.profiles = Expression(array2frame(projected, genes,
+                                               component_labels(componentCount)))
+        self.__log_projection(len(genes), len(samples), componentCount, explained)
+
+
+    def __log_projection(self, geneCount, sampleCount, componentCount, explained):
+        '''
+        log the size and correlation error of the sample projection
+        '''
+        message = "Sample projection: " + str(sampleCount) \
+                  + " samples -> " + str(componentCount) + " components (" \
+                  + str(round(100 * explained, 1)) + "% of variance); correlation error: " \
+                  + "max = " + str(round(self.projectionError[0], 4)) \
+                  + ", RMS = " + str(round(self.projectionError[1], 4)) \
+                  + " (" + str(min(geneCount, ERROR_SAMPLE_GENES)) + " sampled genes)"
+        self.logger.info(message)
+        if self.args.verbose:
+            warning(message)
+
+
+    def output_eigengenes(self):
+        '''
+        returns (modules, samples, values) for the current
+        eigengenes; if the analysis ran on projected profiles,
+        eigengenes are recalculated from the input profiles
+        so that they are reported per sample
+        '''
+        if self.sampleBasis is not None:
+            classifiedGenes = self.genes.get_classified_genes()
+            membership = self.genes.get_gene_membership(classifiedGenes)
+            modules = sorted(set(membership.values()))
+            _, _, projected = self.profiles.snapshot(classifiedGenes)
+            return (modules, list(self.inputSamples),
+                    sample_eigengenes(projected, self.sampleBasis,
+                                      [membership[g] for g in classifiedGenes], modules))
+
+        if self.sampleProfiles is None:
+            return self.eigengenes.snapshot()
+
+        classifiedGenes = self.genes.get_classified_genes()
+        eigengenes = Eigengenes(debug=self.args.debug)
+        eigengenes.recalculate(self.sampleProfiles.gene_expression(classifiedGenes),
+                               self.genes.get_gene_membership(classifiedGenes),
+                               samples=self.sampleProfiles.samples())
+        return eigengenes.snapshot()
+
+
+    def __screen_pass_genes(self, genes):
+        '''
+        exclude genes with no neighbor correlated at
+        |r| >= minNeighborCorrelation from the pass;
+        screened genes remain UNCLASSIFIED (and are screened
+        again with the residuals of the next pass)
+        '''
+        standardized = self.profiles.standardized()
+        rows = standardized.rows(genes)
+        keep = screen_isolated_genes(standardized.standardized[rows],
+                                     self.args.minNeighborCorrelation)
+        passGenes = [gene for gene, kept in zip(genes, keep) if kept]
+
+        message = "Pass " + str(self.passCount) + " neighbor screen: excluded " \
+                  + str(len(genes) - len(passGenes)) + " of " + str(len(genes)) \
+                  + " genes (max |r| < " + str(self.args.minNeighborCorrelation) + ")"
+        self.logger.info(message)
+        if self.args.verbose:
+            warning(message)
+        return passGenes
+
+
     def run_pass(self, passGenes):
         '''
         run a single pass of iterative WGCNA
@@ -91,30 +316,39 @@ class IterativeWGCNA(object):
         '''
 
         passDirectory = 'pass' + str(self.passCount)
-        create_dir(passDirectory)
-        write_data_frame(self.profiles.gene_expression(passGenes),
-                         os.path.join(passDirectory, 'initial-pass-expression-set.txt'),
-                         'Gene')
+        if self.writeOutput:
+            create_dir(passDirectory)
+            with self.metrics.stage('write_output'):
+                genes, samples, values = self.profiles.snapshot(passGenes)
+                self.writer.submit(write_matrix,
+                                   os.path.join(passDirectory, 'initial-pass-expression-set.txt'),
+                                   'Gene', genes, samples, values)
 
         iterationGenes = passGenes
 
         while not self.passConverged:
             self.run_iteration(iterationGenes)
 
-            moduleCount = self.genes.count_modules(iterationGenes)
-            classifiedGeneCount = self.genes.count_classified_genes(iterationGenes)
+            with self.metrics.stage('count_genes'):
+                moduleCount = self.genes.count_modules(iterationGenes)
+                classifiedGeneCount = self.genes.count_classified_genes(iterationGenes)
 
             self.write_run_summary(len(iterationGenes), classifiedGeneCount)
+            self.__notify('iteration', iteration=self.iteration, passCount=self.passCount,
+                          iterationCount=self.iterationCount, genes=len(iterationGenes),
+                          classified=classifiedGeneCount, modules=moduleCount)
 
             # if there are no residuals
             # (classified gene count = number of genes input)
             # then the pass has converged
             if classifiedGeneCount == len(iterationGenes):
                 self.passConverged = True
-                self.__summarize_classification(passDirectory + '/')
+                with self.metrics.stage('write_output'):
+                    self.__summarize_classification(passDirectory + '/')
             else:
                 # run again with genes classified in current pass
-                iterationGenes = self.genes.get_classified_genes(iterationGenes)
+                with self.metrics.stage('count_genes'):
+                    iterationGenes = self.genes.get_classified_genes(iterationGenes)
                 self.iterationCount = self.iterationCount + 1
 
             # if no modules were detected,
@@ -135,12 +369,30 @@ class IterativeWGCNA(object):
 
         # genes involved in current iteration
         passGenes = self.profiles.genes()
+        if prefilter_enabled(self.args):
+            with self.metrics.stage('prefilter'), self.__numpy_blas_threads():
+                passGenes = self.__prefilter_genes(passGenes)
+        if self.args.sampleProjection is not None and self.inputMatrix is None:
+            with self.metrics.stage('sample_projection'), self.__numpy_blas_threads():
+                self.__project_samples()
 
         while not self.algorithmConverged:
+            if self.args.minNeighborCorrelation is not None:
+                with self.metrics.stage('neighbor_screen'), self.__numpy_blas_threads():
+                    passGenes = self.__screen_pass_genes(passGenes)
+                if len(passGenes) == 0:
+                    # no gene has a neighbor; nothing left to classify
+                    self.algorithmConverged = True
+                    self.logger.info("No genes passed the neighbor screen. Classification complete.")
+                    break
+
             self.run_pass(passGenes)
             classifiedGeneCount = self.genes.count_classified_genes(passGenes)
             self.__log_pass_completion()
             self.__log_gene_counts(len(passGenes), classifiedGeneCount)
+            self.__notify('pass', passCount=self.passCount, genes=len(passGenes),
+                          classified=classifiedGeneCount,
+                          totalClassified=self.genes.count_classified_genes())
 
             if not self.algorithmConverged:
                 # set residuals as new gene list
@@ -155,25 +407,39 @@ class IterativeWGCNA(object):
 
         self.iteration = 'FINAL'
         self.genes.iteration = self.iteration
+        self.metrics.begin_iteration(self.iteration, self.genes.size)
         self.__log_gene_counts(self.genes.size, self.genes.count_classified_genes())
-        self.__summarize_classification('final-')
+        with self.metrics.stage('write_output'):
+            self.__summarize_classification('final-')
 
         # output current eigengenes for all modules, not just ones from last pass
-        self.eigengenes.load_matrix_from_file('eigengenes.txt')
-        modules = self.genes.get_modules()
-        self.eigengenes.update_to_subset(modules)
-        self.eigengenes.write('final-')
+        with self.metrics.stage('load_eigengenes'):
+            self.__load_eigengene_history()
+            modules = self.genes.get_modules()
+            self.eigengenes.update_to_subset(modules)
+        with self.metrics.stage('write_output'):
+            self.__write_eigengenes('final-', self.output_eigengenes())
+        self.__notify('final', genes=self.genes.size,
+                      classified=self.genes.count_classified_genes(),
+                      modules=len(self.genes.get_modules()))
 
         self.iteration = 'MERGED'
         self.genes.iteration = self.iteration
-        self.merge_close_modules()
-        self.reassign_genes_to_best_fit_module()
+        self.metrics.begin_iteration(self.iteration, self.genes.size)
+        with self.metrics.stage('merge_close_modules'):
+            self.merge_close_modules()
+        with self.metrics.stage('reassign_to_best_fit'), self.__numpy_blas_threads():
+            self.reassign_genes_to_best_fit_module()
 
         self.__log_gene_counts(self.genes.size, self.genes.count_classified_genes())
 
-        self.__summarize_classification('merged-' + str(self.args.finalMergeCutHeight) + '-')
-        self.eigengenes.write('merged-' + str(self.args.finalMergeCutHeight) + '-')
-        os.remove("eigengenes.txt")
+        with self.metrics.stage('write_output'):
+            self.__summarize_classification('merged-' + str(self.args.finalMergeCutHeight) + '-')
+            self.__write_eigengenes('merged-' + str(self.args.finalMergeCutHeight) + '-',
+                                    self.output_eigengenes())
+        self.__notify('merged', genes=self.genes.size,
+                      classified=self.genes.count_classified_genes(),
+                      modules=len(self.genes.get_modules()))
 
 
     def merge_close_modules_from_output(self):
@@ -202,20 +468,92 @@ class IterativeWGCNA(object):
         '''
         main function --> makes calls to run iterativeWGCNA,
         catches errors, and logs time
+
+        returns True if the run completed successfully
         '''
 
+        success = False
+        self.__notify('start', genes=self.genes.size, samples=self.sample_count())
         try:
             self.run_iterative_wgcna()
             # self.summarize_results() # can cause memory issues so, removing
-            self.logger.info('iterativeWGCNA: SUCCESS')
-        except Exception:
+            with self.metrics.stage('flush_output'):
+                success = self.__close_output()
+            if success:
+                self.logger.info('iterativeWGCNA: SUCCESS')
+        except Exception as err:
+            self.error = err
+            self.__close_output()
             if self.logger is not None:
                 self.logger.exception('iterativeWGCNA: FAIL')
             else:
                 raise
         finally:
+            self.metrics.end_iteration()
+            self.__log_metrics_summary()
+            if self.args.profile and self.writeOutput:
+                self.__export_profile()
             if self.logger is not None:
                 self.logger.info(strftime("%c"))
+            self.__notify('end', success=success)
+
+        return success
+
+
+    def __close_output(self):
+        '''
+        wait for pending compression, flush pending output and
+        stop the background writer;
+        logs any errors and returns False if there were any
+        '''
+        errors = []
+        if self.compressor is not None:
+            errors.extend(self.compressor.close())
+            self.compressor = None
+
+        if self.writer is not None:
+            errors.extend(self.writer.close())
+            self.writer = None
+
+        for error in errors:
+            self.logger.error("Error writing output:\n" + error)
+        if errors:
+            self.logger.error('iterativeWGCNA: FAIL (' + str(len(errors)) + ' output errors)')
+            if self.args.verbose:
+                warning(str(len(errors)) + " errors writing output; see log")
+        return len(errors) == 0
+
+
+    def close(self):
+        '''
+        release the R sink and log file handlers and restore
+        the original working directory so that
+        another run can be started in the same process
+        '''
+        if self.compressor is not None:
+            self.compressor.close()
+            self.compressor = None
+
+        if self.writer is not None:
+            self.writer.close()
+            self.writer = None
+
+        if self.args.profile:
+            profiler.disable()
+
+        if self.rLogger is not None:
+            base().sink(type='message')
+            base().sink()
+            base().close(self.rLogger)
+            self.rLogger = None
+
+        if self.writeOutput: # otherwise, the handlers belong to the caller
+            rootLogger = logging.getLogger()
+            for handler in list(rootLogger.handlers):
+                rootLogger.removeHandler(handler)
+                handler.close()
+
+        base().setwd(self.initialDir)
 
 
     def reassign_genes_to_best_fit_module(self):
@@ -245,7 +583,10 @@ class IterativeWGCNA(object):
         modules = self.genes.get_modules()
         self.__log_final_modules(modules)
 
-        self.eigengenes.load_matrix_from_file(prefix + 'eigengenes.txt')
+        if prefix == '':
+            self.__load_eigengene_history()
+        else:
+            self.eigengenes.load_matrix_from_file(prefix + 'eigengenes.txt')
         self.eigengenes.update_to_subset(modules)
 
         self.eigengenes = self.genes.merge_close_modules(self.eigengenes,
@@ -259,67 +600,220 @@ class IterativeWGCNA(object):
         self.__generate_iteration_label()
 
         iterationDir = os.path.join('pass' + str(self.passCount), 'i' + str(self.iterationCount))
-        create_dir(iterationDir)
+        if self.writeOutput:
+            create_dir(iterationDir)
 
         if self.args.verbose:
             warning("Iteration: " + self.iteration)
 
         self.genes.iteration = self.iteration
-        iterationProfiles = self.profiles.gene_expression(iterationGenes)
+        self.metrics.begin_iteration(self.iteration, len(iterationGenes))
+        with self.metrics.stage('subset_expression'):
+            iterationProfiles = self.profiles.gene_expression(iterationGenes)
 
-        blocks = self.run_blockwise_wgcna(iterationProfiles, iterationDir)
+        with self.metrics.stage('blockwise_modules'):
+            blocks = self.__run_blockwise_wgcna_with_recovery(iterationProfiles, iterationDir)
         if not self.args.skipSaveBlocks:
-            rsnippets.saveBlockResult(blocks, iterationProfiles,
-                                      os.path.join(iterationDir, 'wgcna-blocks.RData'))
-            if self.args.gzipTOMs:
-                bulk_gzip(iterationDir, 'TOM')
+            with self.metrics.stage('write_output'):
+                rsnippets.saveBlockResult(blocks, iterationProfiles,
+                                          os.path.join(iterationDir, 'wgcna-blocks.RData'))
+                if self.args.gzipTOMs:
+                    self.compressor.submit(os.path.abspath(iterationDir), 'TOM')
+                if self.args.compressBlocks:
+                    self.compressor.submit(os.path.abspath(iterationDir), 'wgcna-blocks.RData')
 
 
         # update eigengenes from blockwise result
         # if eigengenes are present (modules detected), evaluate
         # fitness and update gene module membership
-        self.eigengenes.extract_from_blocks(self.iteration, blocks,
-                                            self.profiles.samples())
+        with self.metrics.stage('extract_eigengenes'):
+            self.eigengenes.extract_from_blocks(self.iteration, blocks,
+                                                self.profiles.samples())
 
         if not self.eigengenes.is_empty():
-            self.eigengenes.write() # need to keep single file across all iterations
-            self.eigengenes.write(iterationDir + '/')
+            with self.metrics.stage('write_output'):
+                snapshot = self.eigengenes.snapshot()
+                # need to keep eigengenes across all iterations
+                self.__add_eigengene_history(snapshot)
+                self.__write_eigengenes(iterationDir + '/', snapshot)
 
             # extract membership from blocks and calc eigengene connectivity
-            self.genes.update_membership(iterationGenes, blocks)
-            self.genes.update_kME(self.eigengenes, iterationGenes)
-            self.__summarize_classification(os.path.join(iterationDir, 'wgcna-'))
-
-            self.genes.evaluate_fit(self.args.wgcnaParameters['minKMEtoStay'],
-                                    iterationGenes)
-            self.genes.remove_small_modules(self.args.wgcnaParameters['minModuleSize'])
-            self.__summarize_classification(os.path.join(iterationDir, ''), True)
+            with self.metrics.stage('update_membership'):
+                self.genes.update_membership(iterationGenes, blocks)
+            with self.metrics.stage('update_kME'), self.__numpy_blas_threads():
+                self.genes.update_kME(self.eigengenes, iterationGenes)
+            with self.metrics.stage('write_output'):
+                self.__summarize_classification(os.path.join(iterationDir, 'wgcna-'))
+
+            with self.metrics.stage('evaluate_fit'):
+                self.genes.evaluate_fit(self.args.wgcnaParameters['minKMEtoStay'],
+                                        iterationGenes)
+            with self.metrics.stage('remove_small_modules'):
+                self.genes.remove_small_modules(self.args.wgcnaParameters['minModuleSize'])
+            with self.metrics.stage('write_output'):
+                self.__summarize_classification(os.path.join(iterationDir, ''), True)
 
 
     def __summarize_classification(self, prefix, inclCounts=False):
         '''
         output gene summaries for the iteration
-        incl: text summary of iteration, updated gene membership, kme histogram
+        incl: text summary of iteration, updated gene membership,
+        kme histogram data (see __record_classification)
         '''
+        if self.writer is None:
+            return
         if 'final' in prefix or 'merge' in prefix:
-            self.genes.write(prefix)
+            membership = self.genes.snapshot_membership()
         else:
-            self.genes.write(prefix, self.iteration)
-        self.genes.plot_kme_histogram(self.iteration, prefix,
-                                      self.args.wgcnaParameters['minKMEtoStay'])
+            membership = self.genes.snapshot_membership(self.iteration)
+        self.writer.submit(write_table, prefix + 'membership.txt',
+                           self.genes.membership_header(), membership)
+        self.__record_classification(prefix, inclCounts)
         if inclCounts:
-            self.genes.write_iteration_counts(prefix)
+            self.writer.submit(write_table, prefix + 'summary.txt',
+                               ITERATION_COUNTS_HEADER, [self.genes.iteration_counts()])
+
+
+    def __record_classification(self, prefix, inclCounts=False):
+        '''
+        add the data needed to plot the kme histogram
+        (and, after pruning or final assembly, the membership history)
+        to the run record; plots are rendered separately by the report command
+        '''
+        self.writer.submit(append_record, RECORD_FILE,
+                           {'type': 'kme', 'iteration': self.iteration,
+                            'file': prefix + 'kme_histogram.pdf',
+                            'vline': self.args.wgcnaParameters['minKMEtoStay'],
+                            'kME': self.genes.histogram_kme(self.iteration, prefix)})
+
+        if inclCounts or 'final' in prefix or 'merge' in prefix:
+            moduleSizes = self.genes.count_module_members()
+            classifiedCount = self.genes.size - moduleSizes.pop('UNCLASSIFIED', 0)
+            self.writer.submit(append_record, RECORD_FILE,
+                               {'type': 'membership', 'iteration': self.iteration,
+                                'classified': classifiedCount,
+                                'modules': dict(moduleSizes)})
+
+
+    def __write_eigengenes(self, prefix='', snapshot=None):
+        '''
+        queue a snapshot of the current eigengenes for output
+        '''
+        if self.writer is None:
+            return
+        modules, samples, values = snapshot if snapshot is not None \
+                                   else self.eigengenes.snapshot()
+        self.writer.submit(write_matrix, prefix + 'eigengenes.txt',
+                           'Module', modules, samples, values)
+
+
+    def __add_eigengene_history(self, snapshot):
+        '''
+        keep the eigengenes detected in an iteration
+        '''
+        modules, samples, values = snapshot
+        self.eigengeneSamples = samples
+        for module, row in zip(modules, values):
+            self.eigengeneHistory[module] = row
+
+
+    def __load_eigengene_history(self):
+        '''
+        set the eigengene matrix to the eigengenes of all
+        modules detected in any iteration
+        '''
+        modules = list(self.eigengeneHistory.keys())
+        self.eigengenes.load_matrix(modules, self.eigengeneSamples,
+                                    [self.eigengeneHistory[m] for m in modules])
 
 
-    def run_blockwise_wgcna(self, exprData, workingDir):
+    def run_blockwise_wgcna(self, exprData, workingDir, blockSize=None):
         '''
         run WGCNA
+
+        blockSize: optional maxBlockSize for this call only
+        (overrides --wgcnaParameters and --autoBlockSize)
+
+        the maxBlockSize actually used is kept in self.blockSize
         '''
-        manager = WgcnaManager(exprData, self.args.wgcnaParameters)
+        params = self.args.wgcnaParameters
+        if blockSize is not None:
+            params = dict(params)
+            params['maxBlockSize'] = blockSize
+        manager = WgcnaManager(exprData, params)
         manager.set_parameter('saveTOMFileBase', os.path.join(workingDir, self.iteration + '-TOM'))
+        if self.args.autoBlockSize and blockSize is None:
+            manager.set_parameter('maxBlockSize', self.__choose_block_size(exprData))
+        self.blockSize = manager.params.get('maxBlockSize', WGCNA_MAX_BLOCK_SIZE)
         return manager.blockwise_modules()
 
 
+    def __run_blockwise_wgcna_with_recovery(self, exprData, workingDir):
+        '''
+        run WGCNA; if R is unable to allocate memory, collect
+        garbage and retry the iteration with a smaller block size
+        (up to --memoryRetries times); results of completed
+        iterations are unaffected
+        '''
+        blockSize = None
+        retryCount = 0
+        while True:
+            try:
+                return self.run_blockwise_wgcna(exprData, workingDir, blockSize)
+            except (RRuntimeError, MemoryError) as err:
+                if not is_allocation_failure(err) or retryCount >= self.args.memoryRetries:
+                    raise
+
+                # the block size of the failed attempt (possibly
+                # chosen by --autoBlockSize)
+                geneCount = base().nrow(exprData)[0]
+                failedSize = min(geneCount, self.blockSize)
+                blockSize = reduced_block_size(failedSize)
+                if blockSize is None:
+                    self.logger.error("Iteration " + self.iteration + ": unable to allocate "
+                                      + "memory with maxBlockSize = " + str(failedSize)
+                                      + "; block size cannot be reduced further")
+                    raise
+
+                retryCount = retryCount + 1
+                message = "Iteration " + self.iteration + ": R memory allocation failed with " \
+                          + "maxBlockSize = " + str(failedSize) + " (" + str(err).strip() + "); " \
+                          + "retrying (" + str(retryCount) + " of " + str(self.args.memoryRetries) \
+                          + ") with maxBlockSize = " + str(blockSize)
+                self.logger.warning(message)
+                if self.args.verbose:
+                    warning(message)
+
+                # discard TOMs from the failed attempt and release memory
+                if os.path.isdir(workingDir):
+                    for fileName in matching_files(workingDir, self.iteration + '-TOM'):
+                        os.remove(fileName)
+                wgcna().collectGarbage()
+                gc.collect()
+
+
+    def __choose_block_size(self, exprData):
+        '''
+        choose the largest block size that fits in
+        available memory for the iteration genes
+        '''
+        geneCount = base().nrow(exprData)[0]
+        sampleCount = base().ncol(exprData)[0]
+        blockSize, memory = choose_block_size(geneCount, sampleCount, self.args.memoryLimit)
+
+        message = "Iteration " + self.iteration + ": maxBlockSize = " + str(blockSize) \
+                  + (" (single block)" if blockSize >= geneCount
+                     else " (" + str(-(-geneCount // blockSize)) + " blocks)")
+        if memory is not None:
+            message = message + "; estimated block memory " \
+                      + str(int(estimate_block_memory(blockSize, sampleCount) / 1048576)) \
+                      + " Mb of " + str(int(memory / 1048576)) + " Mb available"
+        self.logger.info(message)
+        if self.args.verbose:
+            warning(message)
+        return blockSize
+
+
     def __generate_iteration_label(self):
         '''
         generates the unique label for the iteration
@@ -327,24 +821,94 @@ class IterativeWGCNA(object):
         self.iteration = 'P' + str(self.passCount) + '_I' + str(self.iterationCount)
 
 
-    def __load_expression_profiles(self):
+    def __load_expression_profiles(self, data=None):
+        if data is not None:
+            self.profiles = Expression(data)
+            return
+
+        if self.args.projectedInput:
+            self.__load_projected_input()
+            return
+
         # gives a weird R error that I'm having trouble catching
         # when it fails
         # TODO: identify the exact exception
         try:
-            self.profiles = Expression(read_data(self.args.inputFile))
+            self.metrics.begin_iteration('LOAD')
+            with self.metrics.stage('read_data'):
+                self.profiles = Expression(read_data(self.args.inputFile))
         except:
-            self.logger.error("Unable to open input file: " + self.args.inputFile)
+            self.logger.error("Unable to open input file: " + self.args.inputFile
+                              + " (" + str(sys.exc_info()[1]) + ")")
             sys.exit(1)
 
 
+    def __load_projected_input(self):
+        '''
+        --projectedInput: memory-map the input from its binary cache
+        (built on first use) and load only its projection into R
+        '''
+        if self.args.sampleProjection is None:
+            self.logger.error("--projectedInput requires --sampleProjection: "
+                              + "blockwiseModules needs the full profiles in memory")
+            warning("--projectedInput requires --sampleProjection")
+            sys.exit(1)
+
+        cacheFile = binary_cache_file(self.args)
+        try:
+            self.metrics.begin_iteration('LOAD')
+            with self.metrics.stage('read_data'):
+                genes, samples, matrix = open_binary_cache(self.args.inputFile, cacheFile)
+        except (IOError, OSError, ValueError) as err:
+            self.logger.error("Unable to open input file: " + self.args.inputFile
+                              + " (" + str(err) + ")")
+            sys.exit(1)
+
+        self.logger.info("Projecting input from binary cache: " + cacheFile)
+        with self.metrics.stage('sample_projection'), self.__numpy_blas_threads():
+            self.__project_input(genes, samples, matrix)
+
+
+    def __export_profile(self):
+        '''
+        write the Chrome trace file and log the profile summary
+        '''
+        profiler.PROFILER.export(profiler.TRACE_FILE)
+        summary = profiler.PROFILER.summary()
+        self.logger.info("Profile (see " + profiler.TRACE_FILE + "):")
+        for line in summary:
+            self.logger.info(line)
+        if self.args.verbose:
+            warning('\n'.join(summary))
+
+
+    def __r_memory_used(self, full=True):
+        '''
+        total memory (Mb) used by R; full=False
+        runs only a minor garbage collection
+        '''
+        return rsnippets.memoryUsed(full)[0]
+
+
+    def __log_metrics_summary(self):
+        '''
+        log the per-stage timing and memory summary
+        '''
+        if not self.metrics.totals:
+            return
+        summary = self.metrics.summary()
+        self.logger.info("Stage timing and memory" + (" (see " + self.metrics.fileName + "):"
+                                                      if self.metrics.fileName is not None else ":"))
+        for line in summary:
+            self.logger.info(line)
+        if self.args.verbose:
+            warning('\n'.join(summary))
+
+
     def __initialize_R(self, logType='run'):
         '''
         initialize R workspace and logs
         '''
-        # set working directory
-        base().setwd(self.args.workingDir)
-
         # suppress warnings
         ro.r['options'](warn=-1)
 
@@ -353,13 +917,71 @@ class IterativeWGCNA(object):
         if logType == 'merge':
             logFile = 'adjust-merge-' + str(self.args.finalMergeCutHeight) + '-' + logFile
 
-        rLogger = base().file(logFile, open='wt')
-        base().sink(rLogger, type=base().c('output', 'message'))
+        if self.writeOutput:
+            # set working directory
+            base().setwd(self.args.workingDir)
+        else:
+            logFile = os.devnull
+
+        self.rLogger = base().file(logFile, open='wt')
+        base().sink(self.rLogger, type=base().c('output', 'message'))
 
-        if self.args.enableWGCNAThreads:
+        if getattr(self.args, 'threads', None) is not None:
+            self.__apply_thread_budget()
+        elif self.args.enableWGCNAThreads:
             wgcna().enableWGCNAThreads()
 
 
+    def __apply_thread_budget(self):
+        '''
+        divide --threads among WGCNA, the R and NumPy BLAS, and the
+        compression workers (within the cgroup CPU quota) and log the split
+        '''
+        compressing = self.args.gzipTOMs or self.args.compressBlocks
+        split = thread_budget(self.args.threads,
+                              self.args.compressionProcesses if compressing else 0)
+        self.threadBudget = split
+
+        if split['wgcnaThreads'] > 1:
+            wgcna().enableWGCNAThreads(nThreads=split['wgcnaThreads'])
+        else:
+            wgcna().disableWGCNAThreads()
+        self.args.enableWGCNAThreads = split['wgcnaThreads'] > 1
+
+        try:
+            blasctl = rhpcblasctl()
+            blasctl.blas_set_num_threads(split['rBLASThreads'])
+            blasctl.omp_set_num_threads(split['rBLASThreads'])
+            rBLAS = str(split['rBLASThreads'])
+        except (PackageNotInstalledError, RRuntimeError):
+            rBLAS = "not set (install the RhpcBLASctl R package to limit R BLAS threads)"
+
+        numpyBLAS = str(split['numpyBLASThreads']) if threadpool_limits is not None \
+                    else "not set (install threadpoolctl to limit NumPy BLAS threads)"
+        if compressing:
+            self.args.compressionProcesses = split['compressionProcesses']
+
+        self.logger.info("Thread budget: " + str(split['budget']) + " of "
+                         + str(split['availableCPUs']) + " available CPUs (cgroup CPU quota "
+                         + "and affinity); requested: " + str(self.args.threads))
+        self.logger.info("  blockwiseModules, kME, merge (WGCNA nThreads): "
+                         + str(split['wgcnaThreads']))
+        self.logger.info("  R BLAS threads: " + rBLAS)
+        self.logger.info("  NumPy BLAS threads (prefilter, neighbor screen, projection, "
+                         + "kME; while R is idle): " + numpyBLAS)
+        self.logger.info("  background compression processes: "
+                         + str(split['compressionProcesses']))
+
+
+    def __numpy_blas_threads(self):
+        '''
+        context manager that gives a NumPy stage the
+        NumPy BLAS threads of the thread budget (if any)
+        '''
+        return numpy_blas_threads(self.threadBudget['numpyBLASThreads']
+                                  if self.threadBudget is not None else None)
+
+
     def __initialize_log(self, logType='run'):
         '''
         initialize log by setting path and file format
@@ -370,11 +992,14 @@ class IterativeWGCNA(object):
         elif logType == 'merge':
             logName = 'adjust-merge-' + str(self.args.finalMergeCutHeight) + '-' + logName
 
-        logging.basicConfig(filename=self.args.workingDir + '/' + logName,
-                            filemode='w', format='%(levelname)s: %(message)s',
-                            level=logging.DEBUG)
+        # without output, messages go to the handlers (if any)
+        # configured by the calling application
+        if self.writeOutput:
+            logging.basicConfig(filename=self.args.workingDir + '/' + logName,
+                                filemode='w', format='%(levelname)s: %(message)s',
+                                level=logging.DEBUG)
 
-        logging.captureWarnings(True)
+            logging.captureWarnings(True)
         self.logger = logging.getLogger(__name__)
 
 
@@ -395,17 +1020,38 @@ class IterativeWGCNA(object):
         directory name
         '''
 
-        self.logger.info("Working directory: " + self.args.workingDir)
+        self.logger.info("Working directory: " + str(self.args.workingDir))
         self.logger.info("Saving blocks for each iteration? "
                          + ("FALSE" if self.args.skipSaveBlocks else "TRUE"))
         self.logger.info("Merging final modules if cutHeight <= " + str(self.args.finalMergeCutHeight))
+        if self.args.gzipTOMs or self.args.compressBlocks:
+            self.logger.info("Compressing " + ("TOMs " if self.args.gzipTOMs else "")
+                             + ("blocks " if self.args.compressBlocks else "")
+                             + "with " + self.args.compressionCodec
+                             + " (level " + str(self.args.compressionLevel) + ") on "
+                             + str(self.args.compressionProcesses) + " processes")
+        if self.args.autoBlockSize:
+            self.logger.info("Choosing maxBlockSize for each iteration from available memory"
+                             + (" (limit: " + str(self.args.memoryLimit) + " Mb)"
+                                if self.args.memoryLimit is not None else ""))
+        if prefilter_enabled(self.args):
+            self.logger.info("Prefiltering genes: minVariance = " + str(self.args.minVariance)
+                             + "; minMAD = " + str(self.args.minMAD)
+                             + "; minMean = " + str(self.args.minMean)
+                             + "; maxMissingFraction = " + str(self.args.maxMissingFraction))
+        if self.args.sampleProjection is not None:
+            self.logger.info("Projecting samples onto components retaining "
+                             + str(self.args.sampleProjection) + " of the variance")
+        if self.args.minNeighborCorrelation is not None:
+            self.logger.info("Screening each pass for genes with max |r| to any other gene < "
+                             + str(self.args.minNeighborCorrelation))
         self.logger.info("Allowing WGCNA Threads? "
                          + ("TRUE" if self.args.enableWGCNAThreads else "FALSE"))
         self.logger.info("Running WGCNA with the following params:")
         self.logger.info(self.args.wgcnaParameters)
 
         if self.args.verbose:
-            warning("Working directory: " + self.args.workingDir)
+            warning("Working directory: " + str(self.args.workingDir))
             warning("Allowing WGCNA Threads? "
                     + ("TRUE" if self.args.enableWGCNAThreads else "FALSE"))
             warning("Merging final modules if cutHeight <= " + str(self.args.finalMergeCutHeight))
@@ -413,16 +1059,26 @@ class IterativeWGCNA(object):
             warning(self.args.wgcnaParameters)
 
 
+    def sample_count(self):
+        '''
+        number of input samples (the profiles loaded
+        into R may be projected)
+        '''
+        if self.inputSamples is not None:
+            return len(self.inputSamples)
+        return self.profiles.ncol()
+
+
     def __log_input_data(self):
         '''
         log input details
         '''
         self.logger.info("Loaded file: " + self.args.inputFile)
-        self.logger.info(str(self.profiles.ncol()) + " Samples")
+        self.logger.info(str(self.sample_count()) + " Samples")
         self.logger.info(str(self.profiles.nrow()) + " Genes")
         if self.args.verbose:
             warning("Loaded file: " + self.args.inputFile)
-            warning(str(self.profiles.ncol()) + " Samples")
+            warning(str(self.sample_count()) + " Samples")
             warning(str(self.profiles.nrow()) + " Genes")
 
 
@@ -464,6 +1120,17 @@ class IterativeWGCNA(object):
         '''
         writes the number of kept and dropped genes at the end of an iteration
         '''
+        if self.writer is None:
+            return
+        self.writer.submit(self.__append_run_summary,
+                           (self.iteration, str(initial), str(fit), str(initial - fit)))
+
+
+    def __append_run_summary(self, row):
+        '''
+        append a row to the run summary file;
+        runs on the output writer thread
+        '''
         fileName = 'iterative-wgcna-run-summary.txt'
         try:
             os.stat(fileName)
@@ -473,5 +1140,4 @@ class IterativeWGCNA(object):
                 print('\t'.join(header), file=f)
         finally:
             with open(fileName, 'a') as f:
-                print('\t'.join((self.iteration, str(initial),
-                                 str(fit), str(initial - fit))), file=f)
+                print('\t'.join(row), file=f)
@@ -0,0 +1,155 @@
+# pylint: disable=invalid-name
+'''
+per-stage timing and memory instrumentation
+'''
+
+from __future__ import print_function
+
+import json
+import logging
+import os
+import resource
+from collections import OrderedDict
+from contextlib import contextmanager
+from time import time
+
+METRICS_FILE = 'iterative-wgcna-metrics.jsonl'
+
+
+def current_rss():
+    '''
+    current resident set size (Mb) of the Python process
+    (which includes the embedded R); falls back on the
+    peak RSS where /proc is not available
+    '''
+    try:
+        with open('/proc/self/statm') as f:
+            pages = int(f.read().split()[1])
+        return pages * os.sysconf('SC_PAGE_SIZE') / 1048576.0
+    except (IOError, OSError, ValueError, IndexError):
+        return peak_rss()
+
+
+def peak_rss():
+    '''
+    peak resident set size (Mb) of the Python process
+    '''
+    # ru_maxrss is in kilobytes on Linux, bytes on macOS
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return maxrss / (1048576.0 if os.uname()[0] == 'Darwin' else 1024.0)
+
+
+class Metrics(object):
+    '''
+    times each stage of a run and records the Python RSS and
+    the R memory use after it; R memory is read with a minor
+    garbage collection after each stage (cheap, but it may count
+    some unreachable older objects) and a full collection at the
+    end of each iteration; one record per iteration is appended
+    to the metrics file as a line of JSON
+
+    fileName: metrics file; if None, records are not written
+    rMemory: optional function returning the total memory (Mb)
+    used by R; called with full=False after each stage
+    '''
+
+    def __init__(self, fileName=METRICS_FILE, rMemory=None):
+        self.logger = logging.getLogger('iterativeWGCNA.Metrics')
+        self.fileName = fileName
+        self.rMemory = rMemory
+        self.record = None
+        self.totals = OrderedDict()
+        self.maxRMb = None
+
+
+    def begin_iteration(self, iteration, geneCount=None):
+        '''
+        start a new record; writes the previous record if one is open
+        '''
+        self.end_iteration()
+        self.record = OrderedDict((('iteration', iteration),
+                                   ('genes', geneCount),
+                                   ('seconds', 0.0),
+                                   ('stages', OrderedDict())))
+
+
+    def end_iteration(self):
+        '''
+        read R memory use (after a full garbage collection)
+        and write the current record to the metrics file
+        '''
+        if self.record is None:
+            return
+        if self.rMemory is not None:
+            rMb = self.rMemory()
+            self.record['rMb'] = round(rMb, 1)
+            self.maxRMb = rMb if self.maxRMb is None else max(self.maxRMb, rMb)
+        if self.fileName is not None:
+            with open(self.fileName, 'a') as f:
+                print(json.dumps(self.record), file=f)
+        self.record = None
+
+
+    @contextmanager
+    def stage(self, name):
+        '''
+        time a stage; usage: with metrics.stage('name'): ...
+        repeated stages within an iteration are accumulated
+        '''
+        start = time()
+        try:
+            yield
+        finally:
+            self.__add(name, time() - start)
+
+
+    def __add(self, name, seconds):
+        '''
+        add stage timing and memory to the current record
+        and to the run totals
+        '''
+        rss = current_rss()
+        rMb = self.rMemory(full=False) if self.rMemory is not None else None
+
+        if self.record is None:
+            self.begin_iteration(None)
+
+        stage = self.record['stages'].setdefault(name, OrderedDict((('calls', 0),
+                                                                    ('seconds', 0.0))))
+        stage['calls'] = stage['calls'] + 1
+        stage['seconds'] = round(stage['seconds'] + seconds, 3)
+        stage['rssMb'] = round(rss, 1)
+        stage['peakRssMb'] = round(peak_rss(), 1)
+        if rMb is not None:
+            stage['rMb'] = round(rMb, 1)
+            self.maxRMb = rMb if self.maxRMb is None else max(self.maxRMb, rMb)
+        self.record['seconds'] = round(self.record['seconds'] + seconds, 3)
+
+        total = self.totals.setdefault(name, {'calls': 0, 'seconds': 0.0, 'rssMb': 0.0,
+                                              'rMb': None})
+        total['calls'] = total['calls'] + 1
+        total['seconds'] = total['seconds'] + seconds
+        total['rssMb'] = max(total['rssMb'], rss)
+        if rMb is not None:
+            total['rMb'] = rMb if total['rMb'] is None else max(total['rMb'], rMb)
+
+
+    def summary(self):
+        '''
+        returns the summary table as a list of lines:
+        per stage calls, total time, share of time,
+        max Python RSS and max R memory (Mb); and
+        the max R memory of the run
+        '''
+        runTime = sum(total['seconds'] for total in self.totals.values())
+        lines = ['%-24s %8s %12s %7s %10s %10s' % ('Stage', 'Calls', 'Seconds', '%',
+                                                   'Max RSS', 'Max R')]
+        for name, total in sorted(self.totals.items(), key=lambda x: -x[1]['seconds']):
+            share = 100.0 * total['seconds'] / runTime if runTime > 0 else 0.0
+            rMb = '%10.1f' % total['rMb'] if total['rMb'] is not None else '%10s' % 'NA'
+            lines.append('%-24s %8d %12.1f %7.1f %10.1f %s'
+                         % (name, total['calls'], total['seconds'], share, total['rssMb'], rMb))
+        lines.append('%-24s %8s %12.1f' % ('TOTAL', '', runTime))
+        if self.maxRMb is not None:
+            lines.append('Max R memory (Mb): %.1f' % self.maxRMb)
+        return lines
@@ -361,7 +361,8 @@ class Network(object):
 
         manager = WgcnaManager(self.profiles.gene_expression(self.classifiedGenes),
                                self.args.wgcnaParameters)
-        manager.adjacency('signed', True, True) # signed, but filter negatives & self-refs
+        # signed, but filter negatives & self-refs
+        manager.adjacency('signed', True, True, profiles=self.profiles)
         self.adjacency = base().as_data_frame(manager.adjacencyMatrix)
         self.weightedAdjacency = self.adjacency
 
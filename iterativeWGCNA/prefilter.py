@@ -0,0 +1,65 @@
+# pylint: disable=invalid-name
+'''
+vectorized prefilter: flags genes that are unlikely to be
+classified (near-constant, lowly expressed or mostly missing)
+so they can be excluded before the first blockwiseModules call
+'''
+
+import warnings
+
+import numpy as np
+
+# filter reasons, in the order they are tested
+# (a gene is assigned the first reason that applies)
+MISSING = 'missing'
+LOW_MEAN = 'lowMean'
+LOW_VARIANCE = 'lowVariance'
+LOW_MAD = 'lowMAD'
+
+
+def prefilter_enabled(args):
+    '''
+    True if any prefilter threshold is set
+    '''
+    return any(getattr(args, option, None) is not None
+               for option in ('minVariance', 'minMAD', 'minMean', 'maxMissingFraction'))
+
+
+def median_absolute_deviation(values):
+    '''
+    per-row median absolute deviation (unscaled), ignoring NaN
+    '''
+    medians = np.nanmedian(values, axis=1)
+    return np.nanmedian(np.abs(values - medians[:, None]), axis=1)
+
+
+def filter_reasons(values, minVariance=None, minMAD=None, minMean=None,
+                   maxMissingFraction=None):
+    '''
+    evaluate the prefilter thresholds for each row (gene) of a
+    genes x samples array; NaN values are treated as missing
+
+    returns a list with the reason each gene was filtered
+    (None for genes that pass)
+    '''
+    values = np.asarray(values, dtype=np.float64)
+    reasons = np.full(values.shape[0], None, dtype=object)
+
+    def flag(failed, reason):
+        reasons[failed & (reasons == None)] = reason # pylint: disable=singleton-comparison
+
+    # statistics of all-missing rows are NaN; these fail
+    # any threshold that is set (comparisons are written
+    # so that NaN fails)
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', RuntimeWarning)
+        if maxMissingFraction is not None:
+            flag(~(np.isnan(values).mean(axis=1) <= maxMissingFraction), MISSING)
+        if minMean is not None:
+            flag(~(np.nanmean(values, axis=1) >= minMean), LOW_MEAN)
+        if minVariance is not None:
+            flag(~(np.nanvar(values, axis=1, ddof=1) >= minVariance), LOW_VARIANCE)
+        if minMAD is not None:
+            flag(~(median_absolute_deviation(values) >= minMAD), LOW_MAD)
+
+    return reasons.tolist()
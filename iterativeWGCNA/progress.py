@@ -0,0 +1,256 @@
+# pylint: disable=invalid-name
+'''
+progress reporting: a listener for IterativeWGCNA progress
+events that keeps a JSON status file (and, optionally, a
+terminal status line) up to date with the current pass and
+iteration, the genes in play, the fraction of genes classified,
+and estimated times remaining
+
+ETA model: iteration time is proportional to the square of the
+number of genes in the iteration; the rate (seconds per gene^2)
+is fit to the completed iterations. Within a pass, the fraction
+of genes dropped by each iteration is assumed to shrink
+geometrically (at the rate observed so far) until the pass
+converges; each later pass runs on the residuals of the
+previous one, assumed to classify the same fraction of its
+genes as the last completed pass
+
+updates are made once per event (i.e., once per iteration),
+so reporting adds nothing measurable to a run
+'''
+
+from __future__ import print_function
+
+import json
+import os
+import sys
+from collections import OrderedDict
+
+STATUS_FILE = 'iterativeWGCNA-status.json'
+
+DEFAULT_DROP_DECAY = 0.5 # decay of the fraction of genes dropped per iteration
+DEFAULT_PASS_CLASSIFIED = 0.5 # fraction of genes classified by a pass
+MIN_PASS_GENES = 40 # passes on fewer genes are not modeled
+MAX_MODELED_STEPS = 100
+
+
+def format_duration(seconds):
+    '''
+    seconds as h:mm:ss (or '?' if unknown)
+    '''
+    if seconds is None:
+        return '?'
+    seconds = int(round(seconds))
+    return "%d:%02d:%02d" % (seconds // 3600, (seconds % 3600) // 60, seconds % 60)
+
+
+class ProgressReporter(object):
+    '''
+    progress event listener (see IterativeWGCNA.add_listener)
+    '''
+
+    def __init__(self, statusFile=None, terminal=False, stream=None):
+        self.statusFile = statusFile
+        self.terminal = terminal
+        self.stream = stream if stream is not None else sys.stderr
+        self.totalGenes = None
+        self.startTime = None
+        self.lastTime = None
+        self.passStart = None
+        self.passGenes = None
+        self.classifiedBeforePass = 0
+        self.currentGenes = None
+        self.currentClassified = 0
+        self.dropFractions = [] # fraction of genes dropped by each iteration in the pass
+        self.passClassified = DEFAULT_PASS_CLASSIFIED
+        self.costWeight = 0.0 # sum of genes^2 of completed iterations
+        self.costTime = 0.0 # and their elapsed time
+        self.status = OrderedDict((('state', 'starting'), ('pass', None), ('iteration', None)))
+
+
+    def __call__(self, event):
+        handler = getattr(self, 'on_' + event['event'], None)
+        if handler is None:
+            return
+        handler(event)
+        self.lastTime = event['time']
+        self.write_status(event)
+
+
+    def on_start(self, event):
+        '''
+        run started
+        '''
+        self.totalGenes = event['genes']
+        self.currentGenes = event['genes']
+        self.startTime = event['time']
+        self.status['state'] = 'running'
+        self.status['pass'] = 1
+
+
+    def on_iteration(self, event):
+        '''
+        iteration completed: update the cost model
+        '''
+        if event['iterationCount'] == 1:
+            self.passStart = self.lastTime
+            self.passGenes = event['genes']
+            self.dropFractions = []
+
+        elapsed = event['time'] - self.lastTime
+        self.costWeight += float(event['genes']) ** 2
+        self.costTime += elapsed
+        self.dropFractions.append(1.0 - float(event['classified']) / max(event['genes'], 1))
+        self.currentGenes = event['classified']
+        self.currentClassified = event['classified']
+
+        self.status['pass'] = event['passCount']
+        self.status['iteration'] = event['iteration']
+        self.status['lastIterationSeconds'] = round(elapsed, 1)
+
+
+    def on_pass(self, event):
+        '''
+        pass completed: the next pass runs on the residuals
+        '''
+        if event['genes'] > 0:
+            self.passClassified = float(event['classified']) / event['genes']
+        self.classifiedBeforePass = event['totalClassified']
+        self.currentClassified = 0
+        self.currentGenes = self.totalGenes - event['totalClassified']
+        self.dropFractions = []
+        self.passStart = event['time']
+        self.passGenes = self.currentGenes
+        self.status['pass'] = event['passCount'] + 1
+        self.status['iteration'] = None
+
+
+    def on_final(self, event):
+        '''
+        iterations complete; merging close modules
+        '''
+        self.status['state'] = 'merging'
+        self.classifiedBeforePass = event['classified']
+        self.currentClassified = 0
+        self.currentGenes = 0
+
+
+    def on_merged(self, event):
+        '''
+        merge complete
+        '''
+        self.status['state'] = 'writing output'
+        self.classifiedBeforePass = event['classified']
+
+
+    def on_end(self, event):
+        '''
+        run complete
+        '''
+        self.status['state'] = 'complete' if event['success'] else 'failed'
+        self.currentGenes = 0
+
+
+    def rate(self):
+        '''
+        fitted seconds per gene^2, or None before the first iteration
+        '''
+        return self.costTime / self.costWeight if self.costWeight > 0 else None
+
+
+    def remaining_pass_cost(self, genes):
+        '''
+        modeled sum of genes^2 over the remaining iterations of the
+        current pass, starting with an iteration on genes
+        '''
+        drop = self.dropFractions[-1] if self.dropFractions else 1.0 - self.passClassified
+        decay = DEFAULT_DROP_DECAY
+        if len(self.dropFractions) > 1 and self.dropFractions[-2] > 0:
+            decay = min(self.dropFractions[-1] / self.dropFractions[-2], 0.95)
+
+        cost = 0.0
+        for _ in range(MAX_MODELED_STEPS):
+            if genes < 1:
+                break
+            cost += float(genes) ** 2
+            drop = drop * decay
+            if drop * genes < 1: # converged: no more genes dropped
+                break
+            genes = genes * (1.0 - drop)
+        return cost
+
+
+    def remaining_run_cost(self, passCost, passGenes):
+        '''
+        modeled cost of the current pass plus later passes
+        '''
+        cost = passCost
+        genes = passGenes * (1.0 - self.passClassified)
+        for _ in range(MAX_MODELED_STEPS):
+            if genes < MIN_PASS_GENES or self.passClassified <= 0:
+                break
+            cost += self.remaining_pass_cost(genes)
+            genes = genes * (1.0 - self.passClassified)
+        return cost
+
+
+    def estimate(self):
+        '''
+        (seconds remaining in the pass, seconds remaining in the run)
+        '''
+        rate = self.rate()
+        if rate is None or self.status.get('state') != 'running' or not self.currentGenes:
+            return None, None
+        passCost = self.remaining_pass_cost(self.currentGenes)
+        return rate * passCost, rate * self.remaining_run_cost(passCost, self.passGenes
+                                                               or self.currentGenes)
+
+
+    def write_status(self, event):
+        '''
+        update the status file and terminal line
+        '''
+        classified = self.classifiedBeforePass + self.currentClassified
+        passEta, runEta = self.estimate()
+        self.status['genesInPlay'] = self.currentGenes
+        self.status['classifiedGenes'] = classified
+        self.status['totalGenes'] = self.totalGenes
+        self.status['fractionClassified'] = round(float(classified) / self.totalGenes, 4) \
+                                            if self.totalGenes else None
+        self.status['elapsedSeconds'] = round(event['time'] - self.startTime, 1) \
+                                        if self.startTime is not None else None
+        self.status['passEtaSeconds'] = round(passEta, 1) if passEta is not None else None
+        self.status['runEtaSeconds'] = round(runEta, 1) if runEta is not None else None
+        self.status['updated'] = event['time']
+
+        if self.statusFile is not None:
+            tmpFile = self.statusFile + '.tmp'
+            with open(tmpFile, 'w') as f:
+                json.dump(self.status, f)
+            os.replace(tmpFile, self.statusFile)
+
+        if self.terminal:
+            self.print_status(passEta, runEta)
+
+
+    def print_status(self, passEta, runEta):
+        '''
+        one-line summary on the terminal (rewritten in place on a tty)
+        '''
+        status = self.status
+        line = "[" + status['state'] + "] pass " + str(status['pass']) \
+               + (" " + status['iteration'] if status['iteration'] else "") \
+               + " | genes in play: " + str(status['genesInPlay']) \
+               + " | classified: " + str(status['classifiedGenes']) + "/" \
+               + str(status['totalGenes']) \
+               + (" (%.1f%%)" % (100 * status['fractionClassified'])
+                  if status['fractionClassified'] is not None else "") \
+               + " | ETA pass: " + format_duration(passEta) \
+               + ", run: " + format_duration(runEta)
+        if self.stream.isatty():
+            self.stream.write('\r' + line + '\033[K')
+            if status['state'] in ('complete', 'failed'):
+                self.stream.write('\n')
+        else:
+            self.stream.write(line + '\n')
+        self.stream.flush()
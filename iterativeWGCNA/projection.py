@@ -0,0 +1,101 @@
+# pylint: disable=invalid-name
+'''
+low-rank sample-space projection for very wide inputs
+(many samples): each gene profile is standardized and
+projected onto the leading right singular vectors (found
+by randomized SVD) that retain a given fraction of the
+variance; correlations are then computed over the
+components instead of the samples
+
+the projected profiles are written as [Y, -Y] (each
+component and its reflection), so every projected profile
+has mean zero and the Pearson correlation of two projected
+profiles is the cosine of their projections
+'''
+
+import numpy as np
+
+from .screen import standardize_rows
+
+INITIAL_RANK = 64 # components in the first randomized SVD; doubled as needed
+OVERSAMPLES = 10
+POWER_ITERATIONS = 2
+PROJECTION_SEED = 1234 # fixed, so runs are reproducible
+ERROR_SAMPLE_GENES = 2000 # genes sampled to estimate the approximation error
+
+
+def randomized_svd(matrix, rank, seed=PROJECTION_SEED):
+    '''
+    approximate truncated SVD (Halko et al. 2011) with
+    rank + OVERSAMPLES random probes and power iterations;
+    returns (U, s, Vt) with rank + OVERSAMPLES components
+    (at most the smaller matrix dimension)
+    '''
+    probes = min(rank + OVERSAMPLES, min(matrix.shape))
+    rng = np.random.default_rng(seed)
+    basis = np.dot(matrix, rng.standard_normal((matrix.shape[1], probes)))
+    basis, _ = np.linalg.qr(basis)
+    for _ in range(POWER_ITERATIONS):
+        basis, _ = np.linalg.qr(np.dot(matrix.T, basis))
+        basis, _ = np.linalg.qr(np.dot(matrix, basis))
+
+    u, s, vt = np.linalg.svd(np.dot(basis.T, matrix), full_matrices=False)
+    return np.dot(basis, u), s, vt
+
+
+def project_samples(values, varianceFraction, seed=PROJECTION_SEED):
+    '''
+    standardize the rows (genes) of a genes x samples array and
+    project them onto the fewest leading components retaining
+    varianceFraction of the total variance
+
+    returns (projected, componentCount, explained) where projected
+    is the genes x (2 x componentCount) array [Y, -Y] and
+    explained is the fraction of the variance retained
+    '''
+    standardized = standardize_rows(values)
+    totalVariance = np.einsum('ij,ij->', standardized, standardized)
+    maxRank = min(standardized.shape)
+
+    rank = min(INITIAL_RANK, maxRank)
+    while True:
+        u, s, _ = randomized_svd(standardized, rank, seed)
+        explained = np.cumsum(s ** 2) / totalVariance if totalVariance > 0 \
+                    else np.ones(len(s))
+        if explained[-1] >= varianceFraction or len(s) >= maxRank:
+            break
+        rank = min(2 * rank, maxRank)
+
+    componentCount = min(int(np.searchsorted(explained, varianceFraction)) + 1, len(s))
+    projection = u[:, :componentCount] * s[:componentCount]
+    return (np.hstack((projection, -projection)), componentCount,
+            float(explained[componentCount - 1]))
+
+
+def component_labels(componentCount):
+    '''
+    column labels of the projected profiles
+    '''
+    labels = ['PC' + str(i + 1) for i in range(componentCount)]
+    return labels + [label + '_neg' for label in labels]
+
+
+def correlation_error(values, projected, sampleSize=ERROR_SAMPLE_GENES, seed=PROJECTION_SEED):
+    '''
+    compare exact gene-gene correlations with those of the
+    projected profiles for a random sample of genes
+
+    returns (max absolute error, root mean squared error)
+    over the off-diagonal correlations
+    '''
+    rng = np.random.default_rng(seed)
+    geneCount = values.shape[0]
+    sample = np.sort(rng.choice(geneCount, min(sampleSize, geneCount), replace=False))
+    if len(sample) < 2:
+        return 0.0, 0.0
+
+    exact = standardize_rows(values[sample])
+    approximate = standardize_rows(projected[sample])
+    errors = np.dot(exact, exact.T) - np.dot(approximate, approximate.T)
+    errors = errors[~np.eye(len(sample), dtype=bool)]
+    return float(np.abs(errors).max()), float(np.sqrt(np.mean(errors ** 2)))
@@ -0,0 +1,38 @@
+'''
+conversions between R data frames and numpy arrays
+'''
+
+import numpy as np
+import rpy2.robjects as ro
+from rpy2.robjects import numpy2ri
+from rpy2.robjects.conversion import localconverter
+from .imports import base, rsnippets
+
+
+def array2frame(values, rowNames, colNames):
+    '''
+    convert a 2-D numpy array to an R data frame
+    with the specified row (gene) and column (sample) names
+    '''
+    with localconverter(ro.default_converter + numpy2ri.converter):
+        matrix = ro.conversion.py2rpy(np.asarray(values, dtype=np.float64))
+    return rsnippets.matrix2frame(matrix, ro.StrVector(rowNames), ro.StrVector(colNames))
+
+
+def array2matrix(values, rowNames, colNames):
+    '''
+    convert a 2-D numpy array to an R matrix
+    with the specified row and column names
+    '''
+    with localconverter(ro.default_converter + numpy2ri.converter):
+        matrix = ro.conversion.py2rpy(np.asarray(values, dtype=np.float64))
+    return rsnippets.labelMatrix(matrix, ro.StrVector(rowNames), ro.StrVector(colNames))
+
+
+def frame2array(df):
+    '''
+    convert a numeric R data frame to a 2-D numpy array
+    '''
+    matrix = base().as_matrix(df)
+    with localconverter(ro.default_converter + numpy2ri.converter):
+        return np.asarray(ro.conversion.rpy2py(matrix), dtype=np.float64)
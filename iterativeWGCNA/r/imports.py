@@ -2,30 +2,36 @@
 imports from R; wrapped in functions
 to ensure warning messages go to the R log
 '''
-from rpy2.robjects.packages import importr, SignatureTranslatedAnonymousPackage
+from rpy2.robjects.packages import SignatureTranslatedAnonymousPackage
 from .snippets import FUNCTIONS
+from .profiler import RPackageProxy, import_package
 
-rsnippets = SignatureTranslatedAnonymousPackage(FUNCTIONS, 'rsnippets')
+rsnippets = RPackageProxy(SignatureTranslatedAnonymousPackage(FUNCTIONS, 'rsnippets'),
+                          'rsnippets')
 
 def base():
-    return importr('base')
+    return import_package('base')
 
 
 def wgcna():
-    return importr('WGCNA')
+    return import_package('WGCNA')
 
 
 def stats():
-    return importr('stats')
+    return import_package('stats')
 
 
 def graphics():
-    return importr('graphics')
+    return import_package('graphics')
 
 
 def grdevices():
-    return importr('grDevices')
+    return import_package('grDevices')
 
 
 def pheatmap():
-    return importr('pheatmap')
+    return import_package('pheatmap')
+
+
+def rhpcblasctl():
+    return import_package('RhpcBLASctl')
@@ -0,0 +1,248 @@
+# pylint: disable=invalid-name
+# pylint: disable=protected-access
+# pylint: disable=broad-except
+'''
+opt-in profiling of calls across the Python/R boundary
+
+when enabled, calls to R functions (through the wrappers in
+r/imports.py), rpy2 vector construction and rx/rx2 extraction,
+and the methods of the R manager and result-tracking classes
+are timed; call counts, cumulative time and (estimated) bytes
+converted are accumulated and each call is recorded as a
+Chrome trace event (view in chrome://tracing or Perfetto)
+'''
+
+from __future__ import print_function
+
+import json
+import logging
+import os
+import threading
+from collections import OrderedDict
+from functools import wraps
+from time import perf_counter
+
+import rpy2.robjects as ro
+from rpy2.robjects import vectors
+from rpy2.robjects.packages import importr
+
+TRACE_FILE = 'iterativeWGCNA-trace.json'
+MAX_EVENTS = 1000000 # beyond this only totals are accumulated
+
+
+def estimate_bytes(obj):
+    '''
+    rough size (bytes) of data passed to or returned from R
+    '''
+    try:
+        if isinstance(obj, vectors.DataFrame):
+            return obj.nrow * obj.ncol * 8
+        if isinstance(obj, (vectors.Vector, list, tuple)):
+            return len(obj) * 8
+        if hasattr(obj, 'nbytes'): # numpy
+            return int(obj.nbytes)
+    except Exception: # e.g., length of a vector that is not yet initialized
+        pass
+    return 0
+
+
+class Profiler(object):
+    '''
+    accumulate call statistics and trace events
+    '''
+
+    def __init__(self):
+        self.logger = logging.getLogger('iterativeWGCNA.Profiler')
+        self.active = False
+        self.events = []
+        self.droppedEvents = 0
+        self.totals = OrderedDict()
+        self.patched = []
+        self.origin = perf_counter()
+        self.pid = os.getpid()
+
+
+    def reset(self):
+        '''
+        clear recorded events and totals
+        '''
+        self.events = []
+        self.droppedEvents = 0
+        self.totals = OrderedDict()
+        self.origin = perf_counter()
+        self.pid = os.getpid()
+
+
+    def wrap(self, function, name, category):
+        '''
+        return a timed version of function
+        '''
+        profiler = self
+
+        @wraps(function)
+        def timed(*args, **kwargs):
+            if not profiler.active:
+                return function(*args, **kwargs)
+            start = perf_counter()
+            result = function(*args, **kwargs)
+            end = perf_counter()
+            nbytes = sum(estimate_bytes(a) for a in args) \
+                     + sum(estimate_bytes(a) for a in kwargs.values()) \
+                     + estimate_bytes(result)
+            profiler.add(name, category, start, end, nbytes)
+            return result
+
+        return timed
+
+
+    def add(self, name, category, start, end, nbytes=0):
+        '''
+        record a completed call
+        '''
+        total = self.totals.get(name)
+        if total is None:
+            total = self.totals[name] = {'category': category, 'calls': 0,
+                                         'seconds': 0.0, 'bytes': 0}
+        total['calls'] = total['calls'] + 1
+        total['seconds'] = total['seconds'] + (end - start)
+        total['bytes'] = total['bytes'] + nbytes
+
+        if len(self.events) < MAX_EVENTS:
+            self.events.append({'name': name, 'cat': category, 'ph': 'X',
+                                'ts': (start - self.origin) * 1e6,
+                                'dur': (end - start) * 1e6,
+                                'pid': self.pid, 'tid': threading.current_thread().ident,
+                                'args': {'bytes': nbytes}})
+        else:
+            self.droppedEvents = self.droppedEvents + 1
+
+
+    def patch(self, owner, attribute, name, category):
+        '''
+        replace owner.attribute with a timed version
+        (restored by unpatch_all)
+        '''
+        # original is None if the attribute is inherited
+        original = owner.__dict__.get(attribute)
+        function = getattr(owner, attribute) if original is None \
+                   else original.__func__ if isinstance(original, (staticmethod, classmethod)) \
+                   else original
+        timed = self.wrap(function, name, category)
+        if isinstance(original, staticmethod):
+            timed = staticmethod(timed)
+        elif isinstance(original, classmethod):
+            timed = classmethod(timed)
+        setattr(owner, attribute, timed)
+        self.patched.append((owner, attribute, original))
+
+
+    def instrument_class(self, cls, category='python'):
+        '''
+        time all methods defined by a class (excluding dunder methods)
+        '''
+        for attribute, value in list(cls.__dict__.items()):
+            if attribute.startswith('__') or isinstance(value, property):
+                continue
+            if callable(value) or isinstance(value, (staticmethod, classmethod)):
+                # strip name mangling from private methods for readability
+                label = attribute.replace('_' + cls.__name__ + '__', '__')
+                self.patch(cls, attribute, cls.__name__ + '.' + label, category)
+
+
+    def unpatch_all(self):
+        '''
+        restore all patched attributes
+        '''
+        for owner, attribute, original in reversed(self.patched):
+            if original is None:
+                delattr(owner, attribute)
+            else:
+                setattr(owner, attribute, original)
+        self.patched = []
+
+
+    def export(self, fileName=TRACE_FILE):
+        '''
+        write the Chrome trace event file
+        '''
+        trace = {'traceEvents': self.events,
+                 'displayTimeUnit': 'ms',
+                 'otherData': {'droppedEvents': self.droppedEvents,
+                               'totals': self.totals}}
+        with open(fileName, 'w') as f:
+            json.dump(trace, f)
+
+
+    def summary(self, limit=25):
+        '''
+        returns the top calls by cumulative time as a list of lines
+        '''
+        lines = ['%-48s %-8s %10s %12s %14s' % ('Call', 'Category', 'Calls',
+                                                 'Seconds', 'Bytes')]
+        ranked = sorted(self.totals.items(), key=lambda x: -x[1]['seconds'])
+        for name, total in ranked[:limit]:
+            lines.append('%-48s %-8s %10d %12.3f %14d'
+                         % (name[:48], total['category'], total['calls'],
+                            total['seconds'], total['bytes']))
+        return lines
+
+
+PROFILER = Profiler()
+
+
+class RPackageProxy(object):
+    '''
+    forwards attribute access to an R package (importr or
+    rsnippets); when profiling is enabled, function calls are timed
+    '''
+
+    def __init__(self, package, name):
+        self._package = package
+        self._name = name
+
+
+    def __getattr__(self, attribute):
+        value = getattr(self._package, attribute)
+        if PROFILER.active and callable(value):
+            return PROFILER.wrap(value, self._name + '.' + attribute, 'R')
+        return value
+
+
+def import_package(name):
+    '''
+    import an R package (timing the import when profiling)
+    and wrap it in a proxy
+    '''
+    if not PROFILER.active:
+        return RPackageProxy(importr(name), name)
+
+    start = perf_counter()
+    package = importr(name)
+    PROFILER.add('importr.' + name, 'import', start, perf_counter())
+    return RPackageProxy(package, name)
+
+
+def enable(classes=None):
+    '''
+    start profiling; instruments rpy2 vector construction and
+    extraction, and the methods of the specified classes
+    '''
+    PROFILER.reset()
+    for vectorType in (ro.StrVector, ro.FloatVector, ro.IntVector):
+        PROFILER.patch(vectorType, '__init__', vectorType.__name__, 'convert')
+    for delegator in ('ExtractDelegator', 'DoubleExtractDelegator'):
+        if hasattr(vectors, delegator):
+            PROFILER.patch(getattr(vectors, delegator), '__call__',
+                           'rx2' if delegator.startswith('Double') else 'rx', 'convert')
+    if classes is not None:
+        for cls in classes:
+            PROFILER.instrument_class(cls)
+    PROFILER.active = True
+
+
+def disable():
+    '''
+    stop profiling and remove instrumentation
+    '''
+    PROFILER.active = False
+    PROFILER.unpatch_all()
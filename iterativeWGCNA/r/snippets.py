@@ -10,6 +10,36 @@ numeric2real <- function(df) {
      df * 1.0
 }
 
+# label the rows and columns of a numeric matrix
+# without R name mangling
+labelMatrix <- function(m, rowNames, colNames) {
+    dimnames(m) <- list(rowNames, colNames)
+    m
+}
+
+# convert a numeric matrix to a data frame
+# labeling rows and columns without R name mangling
+matrix2frame <- function(m, rowNames, colNames) {
+    df <- as.data.frame(m)
+    row.names(df) <- rowNames
+    colnames(df) <- colNames
+    df
+}
+
+# total memory (Mb) used by R; runs a full garbage collection,
+# or (full = FALSE) a cheaper collection of the youngest generation
+memoryUsed <- function(full = TRUE) {
+    sum(gc(full = full)[, 2])
+}
+
+# clear the global environment, close all connections
+# (restoring sink diversions) and release memory
+resetWorkspace <- function() {
+    rm(list=ls(envir=globalenv(), all.names=TRUE), envir=globalenv())
+    closeAllConnections()
+    invisible(gc())
+}
+
 # return 1-matrix
 dissMatrix <- function(df) {
     1.0 - df
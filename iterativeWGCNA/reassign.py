@@ -0,0 +1,48 @@
+# pylint: disable=invalid-name
+'''
+reassignment of genes to the best-fitting module, shared by
+Genes.reassign_to_best_fit and the classify add-on
+
+modules are visited in order; a gene not in the module joins
+it if the gene is unclassified and its (rounded) kME is at
+least minKMEtoStay, or if its kME is higher than its current
+kME and the correlation is significant
+
+NOTE: this module must not import R
+'''
+
+import numpy as np
+
+
+def reassign_to_modules(kME, significant, minKMEtoStay, current=None, currentKME=None):
+    '''
+    apply the reassignment rules to every gene
+
+    kME: genes x modules array of (unrounded) kME
+    significant: genes x modules boolean array, True where the
+    correlation p-value is below the reassign threshold
+    current: module index of each gene (-1 if unclassified;
+    default: all unclassified)
+    currentKME: kME of each gene in its current module
+    (default: NaN)
+
+    returns (module index or -1, kME rounded to 2 decimals,
+    number of reassignments)
+    '''
+    geneCount, moduleCount = kME.shape
+    current = np.full(geneCount, -1) if current is None else np.array(current)
+    currentKME = np.full(geneCount, np.nan) if currentKME is None \
+                 else np.array(currentKME, dtype=np.float64)
+    newKME = np.round(kME, 2)
+
+    count = 0
+    with np.errstate(invalid='ignore'):
+        for i in range(moduleCount):
+            # for each gene not assigned to the current module, test fit
+            reassign = (current != i) \
+                       & (((current < 0) & (newKME[:, i] >= minKMEtoStay))
+                          | ((newKME[:, i] > currentKME) & significant[:, i]))
+            current[reassign] = i
+            currentKME[reassign] = newKME[reassign, i]
+            count = count + int(reassign.sum())
+    return current, currentKME, count
@@ -0,0 +1,143 @@
+# pylint: disable=invalid-name
+'''
+deferred report generation
+
+the main run records only the data needed for plots
+(kME vectors per iteration and membership history)
+in a compact run record; plots are rendered later,
+in parallel worker processes, from that record
+'''
+
+from __future__ import print_function
+
+import json
+import logging
+import multiprocessing
+import os
+from time import strftime
+
+import rpy2.robjects as ro
+from .r.manager import RManager
+from .r.imports import grdevices
+from .io.utils import warning
+from .resources import available_cpus
+
+RECORD_FILE = 'iterativeWGCNA-run-record.jsonl'
+MEMBERSHIP_HISTORY_FILE = 'membership-history.pdf'
+
+
+def append_record(fileName, record):
+    '''
+    append a record (dict) to the run record
+    as a single line of JSON
+    '''
+    with open(fileName, 'a') as f:
+        print(json.dumps(record), file=f)
+
+
+def load_records(fileName):
+    '''
+    load all records from the run record
+    '''
+    with open(fileName) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def plot_kme_histogram(kmeVector, iteration, fileName, vline=0.80):
+    '''
+    plot a histogram of gene -> assigned module kME
+    '''
+    if kmeVector is not None:
+        if len(kmeVector) != 0:
+            manager = RManager(kmeVector)
+            grdevices().pdf(fileName)
+            manager.histogram(vline, {'main': 'Gene -> Assigned Module kME for iteration ' + iteration,
+                                      'xlab': 'kME', 'ylab':'Gene Count'})
+            grdevices().dev_off()
+
+
+def plot_membership_history(history, fileName):
+    '''
+    plot number of classified genes and modules
+    after each iteration
+    '''
+    labels = ro.StrVector([record['iteration'] for record in history])
+    params = {'names.arg': labels, 'las': 2, 'cex.names': 0.6,
+              'border': ro.NA_Logical}
+
+    grdevices().pdf(fileName)
+    manager = RManager(ro.IntVector([record['classified'] for record in history]),
+                       dict(params, main='Classified Genes'))
+    manager.barchart()
+    manager = RManager(ro.IntVector([len(record['modules']) for record in history]),
+                       dict(params, main='Modules'))
+    manager.barchart()
+    grdevices().dev_off()
+
+
+def render(task):
+    '''
+    pool task: render a single plot;
+    returns the name of the file generated
+    '''
+    plotType, fileName, data = task
+    if plotType == 'kme':
+        plot_kme_histogram(data['kME'], data['iteration'], fileName, data['vline'])
+    elif plotType == 'membership':
+        plot_membership_history(data, fileName)
+    return fileName
+
+
+class Report(object):
+    '''
+    render plots from the run record of
+    an existing iterativeWGCNA run
+    '''
+
+    def __init__(self, args):
+        self.args = args
+        self.logger = logging.getLogger('iterativeWGCNA.Report')
+        logging.basicConfig(filename=os.path.join(self.args.workingDir,
+                                                  'report-iterativeWGCNA.log'),
+                            filemode='w', format='%(levelname)s: %(message)s',
+                            level=logging.DEBUG)
+
+
+    def tasks(self):
+        '''
+        build plot tasks from the run record
+        '''
+        records = load_records(os.path.join(self.args.workingDir, RECORD_FILE))
+
+        tasks = [('kme', os.path.join(self.args.workingDir, record['file']), record)
+                 for record in records if record['type'] == 'kme']
+
+        history = [record for record in records if record['type'] == 'membership']
+        if len(history) != 0:
+            tasks.append(('membership',
+                          os.path.join(self.args.workingDir, MEMBERSHIP_HISTORY_FILE),
+                          history))
+        return tasks
+
+
+    def run(self):
+        '''
+        render all plots on a pool of worker processes
+        '''
+        self.logger.info(strftime("%c"))
+        tasks = self.tasks()
+        self.logger.info("Rendering " + str(len(tasks)) + " plots")
+        if self.args.verbose:
+            warning("Rendering " + str(len(tasks)) + " plots")
+
+        # spawn, not fork, so each worker embeds its own R instance
+        context = multiprocessing.get_context('spawn')
+        pool = context.Pool(processes=max(1, min(self.args.processes, available_cpus())))
+        try:
+            for fileName in pool.imap_unordered(render, tasks):
+                self.logger.info("Generated " + fileName)
+        finally:
+            pool.close()
+            pool.join()
+
+        self.logger.info(strftime("%c"))
@@ -0,0 +1,323 @@
+# pylint: disable=invalid-name
+'''
+detection of available system resources,
+memory-aware sizing of WGCNA blocks, and
+division of a thread budget
+'''
+
+import logging
+import os
+from collections import OrderedDict
+from contextlib import contextmanager, nullcontext
+from math import ceil, sqrt
+
+try:
+    from threadpoolctl import threadpool_limits
+except ImportError:
+    threadpool_limits = None
+
+# for each block, blockwiseModules holds several
+# n x n double matrices at once (correlation/adjacency,
+# TOM, dissimilarity and the copies made by R while
+# converting between them)
+BLOCK_MATRIX_COPIES = 4
+BYTES_PER_VALUE = 8
+
+# fraction of the available memory that may be used for a block
+MEMORY_FRACTION = 0.8
+
+WGCNA_MAX_BLOCK_SIZE = 5000 # blockwiseModules default
+
+# blocks smaller than this give poor module detection;
+# never size blocks below it
+MIN_BLOCK_SIZE = 1000
+
+# cgroup v2 and v1 memory limit / usage files
+CGROUP_MEMORY_FILES = (('/sys/fs/cgroup/memory.max', '/sys/fs/cgroup/memory.current'),
+                       ('/sys/fs/cgroup/memory/memory.limit_in_bytes',
+                        '/sys/fs/cgroup/memory/memory.usage_in_bytes'))
+
+# cgroup v2 (quota and period in one file) and v1 CPU quota files
+CGROUP_CPU_MAX_FILE = '/sys/fs/cgroup/cpu.max'
+CGROUP_CPU_QUOTA_FILES = ('/sys/fs/cgroup/cpu/cpu.cfs_quota_us',
+                          '/sys/fs/cgroup/cpu/cpu.cfs_period_us')
+
+# environment variables read by BLAS/OpenMP libraries when they are
+# loaded (i.e., by spawned worker processes and their embedded R)
+BLAS_THREAD_VARIABLES = ('OMP_NUM_THREADS', 'OPENBLAS_NUM_THREADS', 'MKL_NUM_THREADS',
+                         'VECLIB_MAXIMUM_THREADS', 'BLIS_NUM_THREADS')
+
+# at most this fraction of the thread budget goes to compression workers
+COMPRESSION_THREAD_FRACTION = 0.25
+
+# fraction of the remaining (compute) threads given to the R BLAS
+# while R runs; WGCNA nThreads gets the rest
+R_BLAS_THREAD_FRACTION = 0.25
+
+# R error messages that indicate an allocation failure
+ALLOCATION_ERRORS = ('cannot allocate', 'memory exhausted')
+
+# on an allocation failure, the iteration is retried
+# with the block size reduced by this factor
+RETRY_BLOCK_FRACTION = 0.5
+
+logger = logging.getLogger('iterativeWGCNA.resources')
+
+
+def read_value(fileName):
+    '''
+    read a single integer from a /proc or /sys file;
+    returns None if the file does not exist or the
+    value is unlimited ('max')
+    '''
+    try:
+        with open(fileName) as f:
+            value = f.read().strip()
+        return None if value == 'max' else int(value)
+    except (IOError, OSError, ValueError):
+        return None
+
+
+def system_available_memory():
+    '''
+    memory (bytes) available to new allocations
+    according to /proc/meminfo (or sysconf where /proc
+    is not available)
+    '''
+    try:
+        with open('/proc/meminfo') as f:
+            for line in f:
+                if line.startswith('MemAvailable:'):
+                    return int(line.split()[1]) * 1024
+    except (IOError, OSError, ValueError, IndexError):
+        pass
+
+    try:
+        return os.sysconf('SC_AVPHYS_PAGES') * os.sysconf('SC_PAGE_SIZE')
+    except (ValueError, OSError, AttributeError):
+        return None
+
+
+def cgroup_available_memory():
+    '''
+    memory (bytes) remaining under the cgroup (container)
+    memory limit, or None if there is no limit
+    '''
+    for limitFile, usageFile in CGROUP_MEMORY_FILES:
+        limit = read_value(limitFile)
+        if limit is None:
+            continue
+        # cgroup v1 reports 'no limit' as a very large number
+        if limit >= 2 ** 60:
+            return None
+        usage = read_value(usageFile)
+        return max(0, limit - (usage if usage is not None else 0))
+    return None
+
+
+def available_memory():
+    '''
+    memory (bytes) available to this process: the lesser
+    of the system available memory and the memory
+    remaining under the cgroup limit
+    '''
+    values = [m for m in (system_available_memory(), cgroup_available_memory())
+              if m is not None]
+    return min(values) if values else None
+
+
+def estimate_block_memory(blockSize, sampleCount):
+    '''
+    estimated peak memory (bytes) needed by blockwiseModules
+    for a block of blockSize genes: the n x n adjacency/TOM matrices
+    plus the (transposed) expression data for the block
+    '''
+    return BYTES_PER_VALUE * (BLOCK_MATRIX_COPIES * blockSize * blockSize
+                              + 2 * blockSize * sampleCount)
+
+
+def max_block_size(sampleCount, memory, fraction=MEMORY_FRACTION):
+    '''
+    largest block size whose estimated memory fits
+    within fraction of the specified memory (bytes)
+    '''
+    budget = fraction * memory / BYTES_PER_VALUE
+    # solve copies * n^2 + 2 * samples * n = budget for n
+    a = BLOCK_MATRIX_COPIES
+    b = 2.0 * sampleCount
+    return int((-b + sqrt(b * b + 4.0 * a * budget)) / (2.0 * a))
+
+
+def choose_block_size(geneCount, sampleCount, memoryLimit=None):
+    '''
+    choose the block size for an iteration:
+    a single block if all genes fit in memory, otherwise the
+    largest block that fits (but not less than MIN_BLOCK_SIZE)
+
+    memoryLimit: memory (Mb) available for WGCNA; if not
+    specified, the available memory is detected
+
+    returns (block size, memory (bytes) used for sizing)
+    '''
+    memory = memoryLimit * 1048576.0 if memoryLimit is not None else available_memory()
+    if memory is None:
+        logger.warning("Unable to determine available memory; using a single block")
+        return geneCount, None
+
+    blockSize = max_block_size(sampleCount, memory)
+    if blockSize >= geneCount:
+        return geneCount, memory
+
+    if blockSize < MIN_BLOCK_SIZE:
+        logger.warning("Available memory (" + str(int(memory / 1048576)) + " Mb) "
+                       + "only allows blocks of " + str(blockSize) + " genes; "
+                       + "using the minimum block size of " + str(MIN_BLOCK_SIZE))
+        blockSize = MIN_BLOCK_SIZE
+    return blockSize, memory
+
+
+def is_allocation_failure(err):
+    '''
+    True if the exception was caused by R (or Python)
+    running out of memory
+    '''
+    if isinstance(err, MemoryError):
+        return True
+    message = str(err)
+    return any(pattern in message for pattern in ALLOCATION_ERRORS)
+
+
+def reduced_block_size(blockSize):
+    '''
+    block size to use when retrying after an allocation failure;
+    returns None if the block size cannot be reduced further
+    '''
+    reduced = int(blockSize * RETRY_BLOCK_FRACTION)
+    return reduced if reduced >= MIN_BLOCK_SIZE else None
+
+
+def cgroup_cpu_limit():
+    '''
+    number of CPUs allowed by the cgroup (container) CPU
+    quota (rounded up), or None if there is no quota
+    '''
+    try:
+        with open(CGROUP_CPU_MAX_FILE) as f:
+            quota, period = f.read().split()[:2]
+        if quota == 'max':
+            return None
+        return max(1, int(ceil(float(quota) / float(period))))
+    except (IOError, OSError, ValueError):
+        pass
+
+    quota = read_value(CGROUP_CPU_QUOTA_FILES[0])
+    period = read_value(CGROUP_CPU_QUOTA_FILES[1])
+    if quota is None or period is None or quota <= 0 or period <= 0:
+        return None # cgroup v1 reports no quota as -1
+    return max(1, int(ceil(float(quota) / period)))
+
+
+def available_cpus():
+    '''
+    number of CPUs this process may use: the CPUs it is
+    allowed to run on, capped by the cgroup CPU quota
+    '''
+    try:
+        cpus = len(os.sched_getaffinity(0))
+    except AttributeError:
+        cpus = os.cpu_count() or 1
+    limit = cgroup_cpu_limit()
+    return min(cpus, limit) if limit is not None else cpus
+
+
+def thread_budget(threads=None, compressionProcesses=0):
+    '''
+    divide a thread budget (default: all available CPUs; never
+    more than are available) among the stages of a run
+
+    compression workers run in the background, alongside R, and
+    get up to COMPRESSION_THREAD_FRACTION of the budget; the rest
+    (the compute threads) is divided between the R BLAS
+    (R_BLAS_THREAD_FRACTION) and WGCNA (nThreads), so their pools
+    never add up to more than the budget (each gets at least one
+    thread, so a budget of 1 compute thread is exceeded by one)
+
+    the NumPy stages (prefilter, neighbor screen, projection, kME)
+    run while R is idle, so the NumPy BLAS gets all compute threads
+    (see numpy_blas_threads)
+
+    returns an OrderedDict: budget, available CPUs, and the
+    threads (processes) for each stage
+    '''
+    cpus = available_cpus()
+    budget = cpus if threads is None else max(1, min(threads, cpus))
+    compression = 0
+    if compressionProcesses:
+        compression = min(compressionProcesses,
+                          max(1, int(budget * COMPRESSION_THREAD_FRACTION)))
+    compute = max(1, budget - compression)
+    rBLAS = max(1, int(compute * R_BLAS_THREAD_FRACTION))
+    wgcna = max(1, compute - rBLAS)
+    return OrderedDict((('budget', budget), ('availableCPUs', cpus),
+                        ('wgcnaThreads', wgcna), ('rBLASThreads', rBLAS),
+                        ('numpyBLASThreads', compute),
+                        ('compressionProcesses', compression)))
+
+
+def worker_threads(threads, processes):
+    '''
+    share of a thread budget for each of a pool of worker
+    processes (at least 1); None if there is no budget
+    '''
+    if threads is None:
+        return None
+    return max(1, min(threads, available_cpus()) // max(1, processes))
+
+
+def limit_job_threads(args, threads):
+    '''
+    cap the thread budget of a job run on a worker
+    process at the worker's share (if any)
+    '''
+    if threads is not None:
+        args.threads = threads if args.threads is None else min(args.threads, threads)
+
+
+def set_thread_environment(threads):
+    '''
+    set the BLAS/OpenMP thread variables; these take effect in
+    processes started afterwards (e.g., spawned workers)
+    '''
+    for variable in BLAS_THREAD_VARIABLES:
+        os.environ[variable] = str(threads)
+
+
+@contextmanager
+def thread_environment(threads):
+    '''
+    set the BLAS/OpenMP thread variables for processes
+    started in the block; the previous values are restored
+    '''
+    previous = dict((variable, os.environ.get(variable)) for variable in BLAS_THREAD_VARIABLES)
+    set_thread_environment(threads)
+    try:
+        yield
+    finally:
+        for variable, value in previous.items():
+            if value is None:
+                os.environ.pop(variable, None)
+            else:
+                os.environ[variable] = value
+
+
+def numpy_blas_threads(threads):
+    '''
+    context manager that limits the BLAS threads for a NumPy
+    stage and restores the previous limits on exit; a BLAS
+    shared with R is limited too, so use it only while R is idle
+
+    does nothing if threads is None or threadpoolctl is not installed
+    '''
+    if threads is None or threadpool_limits is None:
+        return nullcontext()
+    return threadpool_limits(limits=threads, user_api='blas')
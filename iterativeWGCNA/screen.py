@@ -0,0 +1,68 @@
+# pylint: disable=invalid-name
+'''
+neighbor screen: maximum absolute correlation of each gene
+to any other gene, computed with blocked matrix products so
+that only a (block rows x genes) slice of the correlation
+matrix is held in memory at a time
+
+genes without a sufficiently correlated neighbor cannot be
+assigned to a module; screening them out before calling
+blockwiseModules saves their share of the adjacency and TOM
+'''
+
+import numpy as np
+
+SCREEN_BLOCK_BYTES = 256 * 1024 * 1024 # memory for one block of correlations
+BYTES_PER_VALUE = 8
+
+
+def standardize_rows(values):
+    '''
+    center each row and scale it to unit norm, so that the
+    Pearson correlation of two rows is their dot product;
+    missing values are set to the row mean (zero after centering)
+    and constant rows are set to zero
+    '''
+    values = np.array(values, dtype=np.float64)
+    missing = np.isnan(values)
+    if missing.any():
+        counts = np.maximum((~missing).sum(axis=1), 1)
+        means = np.where(missing, 0.0, values).sum(axis=1) / counts
+        values[missing] = np.take(means, np.nonzero(missing)[0])
+    else:
+        means = values.mean(axis=1)
+    values -= means[:, None]
+    norms = np.sqrt(np.einsum('ij,ij->i', values, values))
+    norms[norms == 0] = np.inf
+    values /= norms[:, None]
+    return values
+
+
+def max_neighbor_correlation(values, maxBlockBytes=SCREEN_BLOCK_BYTES):
+    '''
+    for each row (gene) of a genes x samples array, the maximum
+    absolute Pearson correlation to any other row
+
+    exact for complete data; missing values are imputed with the
+    row mean (WGCNA uses pairwise-complete observations)
+    '''
+    standardized = standardize_rows(values)
+    geneCount = standardized.shape[0]
+    blockRows = max(1, min(geneCount, maxBlockBytes // (BYTES_PER_VALUE * max(geneCount, 1))))
+
+    maxCorrelation = np.zeros(geneCount, dtype=np.float64)
+    for start in range(0, geneCount, blockRows):
+        end = min(start + blockRows, geneCount)
+        block = np.abs(np.dot(standardized[start:end], standardized.T))
+        block[np.arange(end - start), np.arange(start, end)] = 0 # self-correlation
+        maxCorrelation[start:end] = block.max(axis=1)
+    # rounding can push |r| of identical profiles just above 1
+    return np.minimum(maxCorrelation, 1.0)
+
+
+def screen_isolated_genes(values, minCorrelation, maxBlockBytes=SCREEN_BLOCK_BYTES):
+    '''
+    returns a boolean array: True for genes with at least
+    one neighbor with |r| >= minCorrelation
+    '''
+    return max_neighbor_correlation(values, maxBlockBytes) >= minCorrelation
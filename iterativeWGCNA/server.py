@@ -0,0 +1,449 @@
+# pylint: disable=invalid-name
+# pylint: disable=broad-except
+'''
+job server: a local (localhost-only) HTTP daemon that runs
+iterativeWGCNA jobs on a pool of warm worker processes
+
+each worker starts R and loads WGCNA once; jobs are queued and
+run at most --processes at a time; progress events from each
+run are streamed back to clients as lines of JSON
+
+every request must carry the access token printed when the server
+starts (header "Authorization: Bearer <token>"); job submissions
+must be sent as Content-Type: application/json, so a browser page
+cannot submit a job without a CORS preflight (which is refused)
+
+the server keeps the last --maxCompletedJobs finished jobs and the
+last MAX_JOB_EVENTS progress events of each job
+
+API:
+  POST /jobs                  submit a job: {"inputFile": ..., "workingDir": ...,
+                              "options": "<iterativeWGCNA command line options>"}
+                              returns {"id": ..., "status": "queued"}
+  GET  /jobs                  list jobs
+  GET  /jobs/<id>             job status, progress events and (when
+                              complete) paths to the result files
+  GET  /jobs/<id>/events      stream progress events (one JSON object
+                              per line) until the job is complete
+'''
+
+from __future__ import print_function
+
+import json
+import logging
+import hmac
+import multiprocessing
+import os
+import secrets
+import threading
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from time import strftime, time
+
+from .batch import job_args
+from .io.utils import create_dir, warning
+from .resources import limit_job_threads, set_thread_environment, worker_threads
+from .sweep import WORKER, run_and_summarize
+
+SERVER_HOST = '127.0.0.1' # never accept connections from other hosts
+MAX_JOB_EVENTS = 1000 # progress events kept per job (most recent)
+
+# output files returned to the client (if present) when a job completes
+RESULT_FILES = ('final-membership.txt', 'final-eigengenes.txt',
+                'merged-{cut}-membership.txt', 'merged-{cut}-eigengenes.txt',
+                'iterative-wgcna-run-summary.txt', 'iterativeWGCNA.log')
+
+
+def initialize_worker(events):
+    '''
+    pool initializer: start R and load WGCNA once per worker;
+    progress events are sent to the server on the events queue
+    '''
+    # R is started here, in the (spawned) worker
+    from .r.imports import wgcna
+
+    WORKER['initialDir'] = os.getcwd()
+    WORKER['events'] = events
+    wgcna()
+
+
+def result_files(args):
+    '''
+    paths to the result files produced by a run
+    '''
+    names = [name.format(cut=args.finalMergeCutHeight) for name in RESULT_FILES]
+    return [os.path.join(args.workingDir, name) for name in names
+            if os.path.exists(os.path.join(args.workingDir, name))]
+
+
+def run_server_job(task):
+    '''
+    pool task: run iterativeWGCNA for a job, forwarding
+    progress events to the server; returns the job summary
+    '''
+    jobId, args = task
+    events = WORKER['events']
+    events.put((jobId, {'event': 'running', 'time': time(), 'pid': os.getpid()}))
+
+    summary = run_and_summarize('Job', jobId, args,
+                                listener=lambda event: events.put((jobId, event)))
+    summary['Results'] = result_files(args)
+    return summary
+
+
+class Job(object):
+    '''
+    status and progress of a submitted job
+    '''
+
+    def __init__(self, jobId, args):
+        self.id = jobId
+        self.args = args
+        self.status = 'queued'
+        self.submitted = time()
+        self.events = []
+        self.firstEvent = 0 # number of older events discarded
+        self.summary = None
+
+
+    def add_event(self, event):
+        '''
+        record a progress event, keeping the most recent MAX_JOB_EVENTS
+        '''
+        self.events.append(event)
+        if len(self.events) > MAX_JOB_EVENTS:
+            discarded = len(self.events) - MAX_JOB_EVENTS
+            del self.events[:discarded]
+            self.firstEvent = self.firstEvent + discarded
+
+
+    def is_complete(self):
+        '''
+        True if the job has finished (successfully or not)
+        '''
+        return self.status not in ('queued', 'running')
+
+
+    def to_dict(self, includeEvents=True):
+        '''
+        JSON-serializable description of the job
+        '''
+        description = OrderedDict((('id', self.id), ('status', self.status),
+                                   ('inputFile', self.args.inputFile),
+                                   ('workingDir', self.args.workingDir),
+                                   ('submitted', self.submitted)))
+        if includeEvents:
+            description['events'] = self.events
+        if self.summary is not None:
+            description['summary'] = OrderedDict((k, v) for k, v in self.summary.items()
+                                                 if k != 'Results')
+            description['results'] = self.summary['Results']
+        return description
+
+
+class JobServer(object):
+    '''
+    queue of jobs run on a pool of warm worker processes
+    '''
+
+    def __init__(self, args):
+        self.args = args
+        self.args.workingDir = os.path.abspath(self.args.workingDir)
+        create_dir(self.args.workingDir)
+        self.logger = self.__initialize_log()
+        self.jobs = OrderedDict()
+        self.jobCount = 0
+        # guards self.jobs; notified whenever a job changes
+        self.condition = threading.Condition()
+
+        self.workerThreads = worker_threads(self.args.threads, self.args.processes)
+        if self.workerThreads is not None:
+            set_thread_environment(self.workerThreads) # read by the spawned workers' BLAS
+
+        # spawn, not fork, so each worker embeds its own R instance
+        context = multiprocessing.get_context('spawn')
+        self.events = context.Queue()
+        self.pool = context.Pool(processes=self.args.processes,
+                                 initializer=initialize_worker,
+                                 initargs=(self.events,))
+        self.eventThread = threading.Thread(target=self.__receive_events, daemon=True)
+        self.eventThread.start()
+
+
+    def __initialize_log(self):
+        '''
+        initialize server log
+        '''
+        logger = logging.getLogger('iterativeWGCNA.JobServer')
+        logger.setLevel(logging.DEBUG)
+        handler = logging.FileHandler(os.path.join(self.args.workingDir,
+                                                   'iterativeWGCNA-server.log'), mode='a')
+        handler.setFormatter(logging.Formatter('%(levelname)s: %(message)s'))
+        logger.addHandler(handler)
+        logger.propagate = False
+        return logger
+
+
+    def pending_count(self):
+        '''
+        number of jobs queued or running
+        '''
+        return sum(1 for job in self.jobs.values() if not job.is_complete())
+
+
+    def submit(self, request):
+        '''
+        queue a job; request is a dict with inputFile, workingDir
+        and (optionally) options; raises ValueError for an
+        invalid request and OverflowError if the queue is full
+        '''
+        if 'inputFile' not in request or 'workingDir' not in request:
+            raise ValueError("inputFile and workingDir are required")
+        args = job_args(os.path.abspath(request['inputFile']),
+                        os.path.abspath(request['workingDir']),
+                        request.get('options', ''))
+        limit_job_threads(args, self.workerThreads)
+
+        with self.condition:
+            if self.pending_count() >= self.args.maxQueuedJobs:
+                raise OverflowError("job queue is full (" + str(self.args.maxQueuedJobs)
+                                    + " jobs queued or running)")
+            if any(job.args.workingDir == args.workingDir and not job.is_complete()
+                   for job in self.jobs.values()):
+                raise ValueError("working directory is in use by another job: "
+                                 + args.workingDir)
+            self.jobCount = self.jobCount + 1
+            job = Job('job' + str(self.jobCount), args)
+            self.jobs[job.id] = job
+
+        self.pool.apply_async(run_server_job, ((job.id, args),),
+                              callback=self.__complete, error_callback=self.__fail(job.id))
+        self.logger.info(strftime("%c") + " " + job.id + " queued: " + args.inputFile
+                         + " -> " + args.workingDir)
+        return job
+
+
+    def __receive_events(self):
+        '''
+        collect progress events sent by the workers
+        '''
+        while True:
+            jobId, event = self.events.get()
+            with self.condition:
+                job = self.jobs.get(jobId)
+                if job is not None:
+                    if event['event'] == 'running':
+                        job.status = 'running'
+                    job.add_event(event)
+                    self.condition.notify_all()
+
+
+    def __complete(self, summary):
+        '''
+        pool callback: record the result of a job
+        '''
+        with self.condition:
+            job = self.jobs[summary['Job']]
+            job.summary = summary
+            job.status = 'success' if summary['Status'] == 'SUCCESS' else 'fail'
+            self.__prune()
+            self.condition.notify_all()
+        self.logger.info(strftime("%c") + " " + job.id + ": " + summary['Status']
+                         + " [" + summary['Runtime'] + "s]")
+
+
+    def __fail(self, jobId):
+        '''
+        returns a pool error callback for the job
+        '''
+        def fail(err):
+            with self.condition:
+                self.jobs[jobId].status = 'fail'
+                self.jobs[jobId].add_event({'event': 'error', 'time': time(),
+                                            'message': str(err)})
+                self.__prune()
+                self.condition.notify_all()
+            self.logger.error(jobId + ": " + str(err))
+        return fail
+
+
+    def __prune(self):
+        '''
+        forget the oldest completed jobs beyond --maxCompletedJobs;
+        called with self.condition held
+        '''
+        completed = [jobId for jobId, job in self.jobs.items() if job.is_complete()]
+        for jobId in completed[:max(len(completed) - self.args.maxCompletedJobs, 0)]:
+            del self.jobs[jobId]
+
+
+    def describe(self, jobId=None):
+        '''
+        description of a single job or (if jobId is None) all jobs
+        '''
+        with self.condition:
+            if jobId is None:
+                return [job.to_dict(includeEvents=False) for job in self.jobs.values()]
+            job = self.jobs.get(jobId)
+            return job.to_dict() if job is not None else None
+
+
+    def stream_events(self, jobId):
+        '''
+        generator over the progress events of a job;
+        blocks until new events arrive and ends when
+        the job is complete
+        '''
+        with self.condition:
+            job = self.jobs[jobId] # kept even if the job is pruned while streaming
+        sent = 0 # index of the next event, counting discarded events
+        while True:
+            with self.condition:
+                while sent == job.firstEvent + len(job.events) and not job.is_complete():
+                    self.condition.wait()
+                events = job.events[max(sent - job.firstEvent, 0):]
+                sent = job.firstEvent + len(job.events)
+                complete = job.is_complete()
+                description = job.to_dict(includeEvents=False) if complete else None
+            for event in events:
+                yield event
+            if complete:
+                yield {'event': 'complete', 'time': time(), 'job': description}
+                return
+
+
+    def close(self):
+        '''
+        stop accepting work and shut down the worker pool
+        '''
+        self.pool.close()
+        self.pool.join()
+
+
+class RequestHandler(BaseHTTPRequestHandler):
+    '''
+    HTTP interface to the job server
+    '''
+    server_version = 'iterativeWGCNA'
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args): # pylint: disable=redefined-builtin
+        self.server.jobServer.logger.debug(self.address_string() + " " + (format % args))
+
+
+    def send_json(self, status, body):
+        '''
+        send a complete JSON response
+        '''
+        content = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+
+    def is_authorized(self):
+        '''
+        True if the request carries the server's access token;
+        otherwise sends 401
+        '''
+        expected = 'Bearer ' + self.server.token
+        if hmac.compare_digest(self.headers.get('Authorization', ''), expected):
+            return True
+        self.send_json(401, {'error': 'missing or invalid access token'})
+        return False
+
+
+    def send_chunk(self, data):
+        '''
+        send one chunk of a chunked (streaming) response
+        '''
+        self.wfile.write(('%x\r\n' % len(data)).encode('ascii') + data + b'\r\n')
+        self.wfile.flush()
+
+
+    def do_GET(self):
+        '''
+        job status and event streams
+        '''
+        if not self.is_authorized():
+            return
+        jobServer = self.server.jobServer
+        path = self.path.rstrip('/').split('/')[1:]
+        if path == ['jobs']:
+            self.send_json(200, jobServer.describe())
+        elif len(path) == 2 and path[0] == 'jobs':
+            description = jobServer.describe(path[1])
+            if description is None:
+                self.send_json(404, {'error': 'unknown job: ' + path[1]})
+            else:
+                self.send_json(200, description)
+        elif len(path) == 3 and path[0] == 'jobs' and path[2] == 'events':
+            if jobServer.describe(path[1]) is None:
+                self.send_json(404, {'error': 'unknown job: ' + path[1]})
+                return
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/x-ndjson')
+            self.send_header('Transfer-Encoding', 'chunked')
+            self.end_headers()
+            try:
+                for event in jobServer.stream_events(path[1]):
+                    self.send_chunk((json.dumps(event) + '\n').encode('utf-8'))
+                self.send_chunk(b'')
+            except (BrokenPipeError, ConnectionResetError):
+                pass # client disconnected; the job continues
+        else:
+            self.send_json(404, {'error': 'not found: ' + self.path})
+
+
+    def do_POST(self):
+        '''
+        job submission
+        '''
+        if not self.is_authorized():
+            return
+        if self.path.rstrip('/') != '/jobs':
+            self.send_json(404, {'error': 'not found: ' + self.path})
+            return
+        contentType = self.headers.get('Content-Type', '').split(';')[0].strip().lower()
+        if contentType != 'application/json':
+            self.send_json(415, {'error': 'Content-Type must be application/json'})
+            return
+        try:
+            length = int(self.headers.get('Content-Length', 0))
+            request = json.loads(self.rfile.read(length).decode('utf-8'))
+            job = self.server.jobServer.submit(request)
+            self.send_json(202, {'id': job.id, 'status': job.status})
+        except OverflowError as err:
+            self.send_json(503, {'error': str(err)})
+        except (ValueError, TypeError, AttributeError) as err:
+            self.send_json(400, {'error': str(err)})
+
+
+def serve(args):
+    '''
+    start the job server and handle requests until interrupted
+    '''
+    jobServer = JobServer(args)
+    httpServer = ThreadingHTTPServer((SERVER_HOST, args.port), RequestHandler)
+    httpServer.daemon_threads = True
+    httpServer.jobServer = jobServer
+    httpServer.token = secrets.token_urlsafe(24)
+
+    message = "iterativeWGCNA job server listening on http://" + SERVER_HOST + ":" \
+              + str(httpServer.server_address[1]) + " (" + str(args.processes) \
+              + " workers, up to " + str(args.maxQueuedJobs) + " queued jobs)"
+    jobServer.logger.info(strftime("%c") + " " + message)
+    if args.verbose:
+        warning(message)
+    # not logged: the token is only shown to the user who started the server
+    warning("Access token (send as 'Authorization: Bearer <token>'): " + httpServer.token)
+    try:
+        httpServer.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        httpServer.server_close()
+        jobServer.close()
+        jobServer.logger.info(strftime("%c") + " server stopped")
@@ -0,0 +1,141 @@
+# pylint: disable=invalid-name
+'''
+shared standardized-expression engine: the rows of a
+(genes x samples or modules x samples) matrix are centered and
+scaled to unit norm once, and every Pearson correlation (gene-gene
+or gene-eigengene) is computed as a matrix product of the cached
+rows; Expression and Eigengenes keep one engine per matrix, so
+the cache is rebuilt only when the profiles change
+
+rows with missing values are standardized with the row mean
+imputed; correlations involving them are recomputed exactly over
+pairwise-complete samples (as R's cor with use='p'); correlations
+involving constant rows are NaN (as in R)
+'''
+
+import numpy as np
+
+from .screen import standardize_rows
+
+
+def pairwise_complete_correlation(x, y):
+    '''
+    Pearson correlations between the rows of x and the rows
+    of y (both may contain NaN), each over the samples
+    present in both rows
+    '''
+    xPresent = (~np.isnan(x)).astype(np.float64)
+    yPresent = (~np.isnan(y)).astype(np.float64)
+    x = np.nan_to_num(x)
+    y = np.nan_to_num(y)
+    count = np.dot(xPresent, yPresent.T)
+    xSums = np.dot(x, yPresent.T)
+    ySums = np.dot(xPresent, y.T)
+    xSquares = np.dot(x * x, yPresent.T)
+    ySquares = np.dot(xPresent, (y * y).T)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        covariance = np.dot(x, y.T) - xSums * ySums / count
+        variance = (xSquares - xSums ** 2 / count) * (ySquares - ySums ** 2 / count)
+        correlation = covariance / np.sqrt(variance)
+    correlation[(count < 2) | ~(variance > 0)] = np.nan
+    return correlation
+
+
+class StandardizedProfiles(object):
+    '''
+    correlation-based statistics of a matrix from its
+    cached standardized (unit-norm, centered) rows
+    '''
+
+    def __init__(self, rowNames, values):
+        self.rowNames = list(rowNames)
+        self.index = dict((name, i) for i, name in enumerate(self.rowNames))
+        values = np.asarray(values, dtype=np.float64)
+        missing = np.isnan(values)
+        self.incomplete = np.nonzero(missing.any(axis=1))[0]
+        self.missing = missing[self.incomplete] # masks of the incomplete rows only
+        self.incompletePosition = dict((row, i) for i, row in enumerate(self.incomplete))
+        self.counts = values.shape[1] - missing.sum(axis=1) # non-missing samples per row
+        self.standardized = standardize_rows(values)
+        self.constant = ~self.standardized.any(axis=1)
+
+
+    def rows(self, names=None):
+        '''
+        row indexes for a list of row names (default: all rows)
+        '''
+        if names is None:
+            return np.arange(len(self.rowNames))
+        return np.array([self.index[name] for name in names], dtype=np.int64)
+
+
+    def __profiles(self, rows):
+        '''
+        standardized rows with NaN restored at missing values
+        (an affine transform of the input, so correlations
+        over any set of samples are unchanged)
+        '''
+        profiles = self.standardized[rows]
+        for i, row in enumerate(rows):
+            position = self.incompletePosition.get(row)
+            if position is not None:
+                profiles[i, self.missing[position]] = np.nan
+        return profiles
+
+
+    def __is_incomplete(self, rows):
+        '''
+        True for rows with missing values
+        '''
+        return np.isin(rows, self.incomplete)
+
+
+    def correlation(self, rows=None, columns=None, other=None):
+        '''
+        Pearson correlations (len(rows) x len(columns)) between
+        the named rows of this matrix and the named rows (columns)
+        of other (default: this matrix); None selects all rows
+        '''
+        other = self if other is None else other
+        rows = self.rows(rows)
+        columns = other.rows(columns)
+        correlation = np.dot(self.standardized[rows], other.standardized[columns].T)
+
+        incompleteRows = self.__is_incomplete(rows)
+        incompleteColumns = other.__is_incomplete(columns)
+        if incompleteRows.any():
+            correlation[incompleteRows] = pairwise_complete_correlation(
+                self.__profiles(rows[incompleteRows]), other.__profiles(columns))
+        if incompleteColumns.any() and not incompleteRows.all():
+            correlation[np.ix_(~incompleteRows, incompleteColumns)] = \
+                pairwise_complete_correlation(self.__profiles(rows[~incompleteRows]),
+                                              other.__profiles(columns[incompleteColumns]))
+
+        if other is self: # exact self-correlations, as in R
+            correlation[(rows[:, None] == columns[None, :])
+                        & ~self.constant[rows][:, None]] = 1.0
+        correlation[self.constant[rows]] = np.nan
+        correlation[:, other.constant[columns]] = np.nan
+        return np.clip(correlation, -1.0, 1.0)
+
+
+    def adjacency(self, rows=None, power=6, networkType='signed'):
+        '''
+        WGCNA adjacency among the named rows: signed ((1 + r) / 2)^power,
+        signed hybrid r^power (r > 0, else 0), or unsigned |r|^power
+        '''
+        correlation = self.correlation(rows, rows)
+        if networkType == 'signed':
+            return ((1.0 + correlation) / 2.0) ** power
+        if networkType == 'signed hybrid':
+            return np.where(correlation > 0, correlation, 0.0) ** power
+        if networkType == 'unsigned':
+            return np.abs(correlation) ** power
+        raise ValueError("Unsupported networkType: " + str(networkType))
+
+
+    def sample_counts(self, rows=None):
+        '''
+        non-missing samples in each named row
+        '''
+        return self.counts[self.rows(rows)]
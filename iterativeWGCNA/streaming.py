@@ -0,0 +1,217 @@
+# pylint: disable=invalid-name
+'''
+projected input (--projectedInput) for a (memory-mapped)
+genes x samples matrix that need not fit in memory: per-gene
+moments and the low-rank sample projection (and its correlation
+error) are accumulated over chunks of sample columns, so only a
+(genes x chunk) slice of the expression matrix is held in memory
+at a time
+
+the network itself is built from the projected profiles (see
+projection.py); exact gene-gene correlations over all samples
+are only computed for the genes sampled to estimate the error
+
+missing values are replaced by the gene mean (i.e., zero
+after centering); results are exact for complete data
+'''
+
+import numpy as np
+
+from .projection import INITIAL_RANK, OVERSAMPLES, POWER_ITERATIONS, PROJECTION_SEED
+
+SAMPLE_CHUNK = 512 # sample columns read per chunk
+GENE_CHUNK = 2000 # gene rows read per chunk (row-wise statistics)
+
+
+def iter_sample_chunks(matrix, chunkSamples=SAMPLE_CHUNK):
+    '''
+    yields (column slice, float64 copy of the columns)
+    '''
+    for start in range(0, matrix.shape[1], chunkSamples):
+        columns = slice(start, min(start + chunkSamples, matrix.shape[1]))
+        yield columns, np.array(matrix[:, columns], dtype=np.float64)
+
+
+def map_gene_chunks(matrix, function, chunkRows=GENE_CHUNK):
+    '''
+    apply a row-wise function (e.g., filter_reasons) to blocks
+    of gene rows; returns the concatenated list of results
+    '''
+    results = []
+    for start in range(0, matrix.shape[0], chunkRows):
+        results.extend(function(np.array(matrix[start:start + chunkRows], dtype=np.float64)))
+    return results
+
+
+def gene_moments(matrix, chunkSamples=SAMPLE_CHUNK):
+    '''
+    accumulate per-gene means and variances (ddof=1) over
+    sample chunks, ignoring missing values
+
+    returns (means, variances, non-missing counts)
+    '''
+    geneCount = matrix.shape[0]
+    counts = np.zeros(geneCount)
+    sums = np.zeros(geneCount)
+    for _, chunk in iter_sample_chunks(matrix, chunkSamples):
+        present = ~np.isnan(chunk)
+        counts += present.sum(axis=1)
+        sums += np.where(present, chunk, 0.0).sum(axis=1)
+    means = sums / np.maximum(counts, 1)
+
+    # second pass about the means (numerically stable)
+    squares = np.zeros(geneCount)
+    for _, chunk in iter_sample_chunks(matrix, chunkSamples):
+        deviations = chunk - means[:, None]
+        squares += np.where(np.isnan(deviations), 0.0, deviations ** 2).sum(axis=1)
+    variances = squares / np.maximum(counts - 1, 1)
+    return means, variances, counts
+
+
+class StreamingProfiles(object):
+    '''
+    sample projection of a genes x samples matrix,
+    computed over chunks of sample columns
+    '''
+
+    def __init__(self, matrix, chunkSamples=SAMPLE_CHUNK):
+        self.matrix = matrix
+        self.chunkSamples = chunkSamples
+        self.means, variances, _ = gene_moments(matrix, chunkSamples)
+        # scale of each centered row (0 for constant genes)
+        self.norms = np.sqrt(variances * (matrix.shape[1] - 1))
+
+
+    def standardized_chunks(self, rows=None):
+        '''
+        yields (column slice, unit-norm centered values for
+        a chunk of samples) for all genes or the specified rows
+        '''
+        means = self.means if rows is None else self.means[rows]
+        norms = self.norms if rows is None else self.norms[rows]
+        scale = np.where(norms > 0, 1.0 / np.where(norms > 0, norms, 1.0), 0.0)
+        for columns, chunk in iter_sample_chunks(self.matrix, self.chunkSamples):
+            if rows is not None:
+                chunk = chunk[rows]
+            chunk -= means[:, None]
+            chunk[np.isnan(chunk)] = 0.0
+            chunk *= scale[:, None]
+            yield columns, chunk
+
+
+    def __times(self, right):
+        '''
+        standardized matrix (genes x samples) times right (samples x k)
+        '''
+        result = np.zeros((self.matrix.shape[0], right.shape[1]))
+        for columns, chunk in self.standardized_chunks():
+            result += np.dot(chunk, right[columns])
+        return result
+
+
+    def __transpose_times(self, left):
+        '''
+        transposed standardized matrix (samples x genes) times left (genes x k)
+        '''
+        result = np.empty((self.matrix.shape[1], left.shape[1]))
+        for columns, chunk in self.standardized_chunks():
+            result[columns] = np.dot(chunk.T, left)
+        return result
+
+
+    def randomized_svd(self, rank, seed=PROJECTION_SEED):
+        '''
+        streaming counterpart of projection.randomized_svd
+        for the standardized matrix
+        '''
+        probes = min(rank + OVERSAMPLES, min(self.matrix.shape))
+        rng = np.random.default_rng(seed)
+        basis, _ = np.linalg.qr(self.__times(rng.standard_normal((self.matrix.shape[1],
+                                                                  probes))))
+        for _ in range(POWER_ITERATIONS):
+            basis, _ = np.linalg.qr(self.__transpose_times(basis))
+            basis, _ = np.linalg.qr(self.__times(basis))
+
+        # B^T = Z^T Q (samples x probes)
+        u, s, vt = np.linalg.svd(self.__transpose_times(basis).T, full_matrices=False)
+        return np.dot(basis, u), s, vt
+
+
+    def project_samples(self, varianceFraction, seed=PROJECTION_SEED):
+        '''
+        streaming counterpart of projection.project_samples;
+        also returns the sample basis (samples x components)
+        used by sample_eigengenes
+        '''
+        totalVariance = float(np.sum(self.norms > 0))
+        maxRank = min(self.matrix.shape)
+        rank = min(INITIAL_RANK, maxRank)
+        while True:
+            u, s, vt = self.randomized_svd(rank, seed)
+            explained = np.cumsum(s ** 2) / totalVariance if totalVariance > 0 \
+                        else np.ones(len(s))
+            if explained[-1] >= varianceFraction or len(s) >= maxRank:
+                break
+            rank = min(2 * rank, maxRank)
+
+        componentCount = min(int(np.searchsorted(explained, varianceFraction)) + 1, len(s))
+        projection = u[:, :componentCount] * s[:componentCount]
+        return (np.hstack((projection, -projection)), componentCount,
+                float(explained[componentCount - 1]), vt[:componentCount].T)
+
+
+    def correlation_error(self, projected, sampleSize, seed=PROJECTION_SEED):
+        '''
+        streaming counterpart of projection.correlation_error
+        '''
+        rng = np.random.default_rng(seed)
+        geneCount = self.matrix.shape[0]
+        sample = np.sort(rng.choice(geneCount, min(sampleSize, geneCount), replace=False))
+        if len(sample) < 2:
+            return 0.0, 0.0
+
+        # exact correlations of the sampled genes, accumulated
+        # as cross-products over sample chunks
+        exact = np.zeros((len(sample), len(sample)))
+        for _, chunk in self.standardized_chunks(sample):
+            exact += np.dot(chunk, chunk.T)
+        exact = np.clip(exact, -1.0, 1.0)
+        approximate = projected[sample] - projected[sample].mean(axis=1)[:, None]
+        norms = np.linalg.norm(approximate, axis=1)
+        approximate /= np.where(norms > 0, norms, 1.0)[:, None]
+        errors = exact - np.dot(approximate, approximate.T)
+        errors = errors[~np.eye(len(sample), dtype=bool)]
+        return float(np.abs(errors).max()), float(np.sqrt(np.mean(errors ** 2)))
+
+
+def sample_eigengenes(projected, basis, membership, modules):
+    '''
+    module eigengenes in sample space from projected profiles:
+    the first principal component of a module's projected
+    (component) profiles is mapped back to the samples with
+    the projection basis
+
+    projected: genes x (2 x components) array [Y, -Y]
+    basis: samples x components array
+    membership: module of each gene (same order as projected)
+
+    returns modules x samples array; eigengenes are scaled to
+    mean 0 and variance 1 and point along the module average
+    '''
+    componentCount = basis.shape[1]
+    membership = np.asarray(membership, dtype=object)
+    eigengenes = np.zeros((len(modules), basis.shape[0]))
+    for i, module in enumerate(modules):
+        members = projected[membership == module, :componentCount]
+        if len(members) == 0:
+            continue
+        norms = np.linalg.norm(members, axis=1)
+        members = members / np.where(norms > 0, norms, 1.0)[:, None]
+        _, _, vt = np.linalg.svd(members, full_matrices=False)
+        eigengene = np.dot(basis, vt[0])
+        if np.dot(eigengene, np.dot(basis, members.mean(axis=0))) < 0:
+            eigengene = -eigengene
+        eigengene -= eigengene.mean()
+        sd = eigengene.std(ddof=1)
+        eigengenes[i] = eigengene / sd if sd > 0 else eigengene
+    return eigengenes
@@ -0,0 +1,314 @@
+# pylint: disable=invalid-name
+# pylint: disable=broad-except
+# pylint: disable=global-statement
+'''
+parameter sweep: runs iterativeWGCNA for each configuration
+in a parameter grid on a pool of long-lived worker processes
+
+the input is parsed once; the expression matrix is placed in
+shared memory and each worker converts it to an R data frame
+once, reusing it (and its R session) for every configuration
+it runs
+'''
+
+from __future__ import print_function
+
+import logging
+import os
+import copy
+import itertools
+import multiprocessing
+from collections import OrderedDict
+from multiprocessing import shared_memory
+from time import time, strftime
+
+import numpy as np
+
+from .cmlargs import set_wgcna_parameter_defaults
+from .io.utils import create_dir, warning
+from .io.matrix import read_matrix
+from .resources import set_thread_environment, worker_threads
+
+# state held by each worker process for the lifetime of the pool
+WORKER = {}
+
+# grid parameters that are iterativeWGCNA options
+# rather than blockwiseModules parameters
+RUN_PARAMETERS = ('finalMergeCutHeight',)
+
+
+class SharedMatrix(object):
+    '''
+    2-D float matrix stored in a named shared memory block
+    so it can be read by worker processes without copying
+    '''
+
+    def __init__(self, name, shape, create=False):
+        nbytes = int(np.prod(shape)) * np.dtype(np.float64).itemsize
+        self.shm = shared_memory.SharedMemory(name=name, create=create,
+                                              size=max(nbytes, 1))
+        self.shape = tuple(shape)
+        self.values = np.ndarray(self.shape, dtype=np.float64, buffer=self.shm.buf)
+
+
+    @classmethod
+    def from_array(cls, values):
+        '''
+        copy an array into a new shared memory block
+        '''
+        matrix = cls(None, values.shape, create=True)
+        matrix.values[:] = values
+        return matrix
+
+
+    def descriptor(self):
+        '''
+        picklable (name, shape) pair for attaching from another process
+        '''
+        return (self.shm.name, self.shape)
+
+
+    def close(self):
+        '''
+        detach from the shared memory block
+        '''
+        self.values = None
+        self.shm.close()
+
+
+    def unlink(self):
+        '''
+        free the shared memory block; call once, from the owner
+        '''
+        self.shm.unlink()
+
+
+def expand_grid(grid):
+    '''
+    expand a param:[values] hash into a list
+    of param:value configurations
+    '''
+    names = list(grid.keys())
+    return [OrderedDict(zip(names, values))
+            for values in itertools.product(*[grid[n] for n in names])]
+
+
+def configuration_label(config):
+    '''
+    generate a directory-safe label for a configuration
+    '''
+    return '_'.join(name + '-' + str(value) for name, value in config.items())
+
+
+def configuration_args(args, config):
+    '''
+    build the run arguments for a single configuration
+    '''
+    configArgs = copy.deepcopy(args)
+    params = dict(args.wgcnaParameters) if args.wgcnaParameters is not None else {}
+
+    for name, value in config.items():
+        if name in RUN_PARAMETERS:
+            setattr(configArgs, name, value)
+        else:
+            params[name] = value
+
+    configArgs.wgcnaParameters = set_wgcna_parameter_defaults(params, args.skipSaveBlocks)
+    configArgs.workingDir = os.path.join(args.workingDir, configuration_label(config))
+    return configArgs
+
+
+def initialize_worker(descriptor, genes, samples):
+    '''
+    pool initializer: attach to the shared expression matrix
+    and convert it to an R data frame once per worker
+    '''
+    # R is started here, in the (spawned) worker
+    from .r.conversion import array2frame
+
+    WORKER['initialDir'] = os.getcwd()
+    name, shape = descriptor
+    matrix = SharedMatrix(name, shape)
+    WORKER['matrix'] = matrix
+    WORKER['data'] = array2frame(matrix.values, genes, samples)
+
+
+def run_configuration(task):
+    '''
+    pool task: run iterativeWGCNA for one configuration
+    in its own subdirectory and return its summary
+    '''
+    label, args = task
+    return run_and_summarize('Configuration', label, args, WORKER['data'])
+
+
+def run_and_summarize(labelField, label, args, data=None, listener=None):
+    '''
+    run iterativeWGCNA in a worker process and return a summary
+    of the result; the R workspace, sinks and log handlers are
+    reset afterwards so the worker can run another job
+
+    listener: optional function called with each progress event
+    '''
+    from .iterativeWGCNA import IterativeWGCNA
+
+    summary = OrderedDict(((labelField, label), ('Status', 'FAIL'),
+                           ('Passes', 'NA'), ('Iterations', 'NA'),
+                           ('Modules', 'NA'), ('Classified', 'NA'),
+                           ('Unclassified', 'NA')))
+    start = time()
+    alg = None
+    try:
+        alg = IterativeWGCNA(args, data=data)
+        if listener is not None:
+            alg.add_listener(listener)
+        if alg.run():
+            summary['Status'] = 'SUCCESS'
+            summary['Passes'] = alg.passCount
+            summary['Iterations'] = count_iterations(args.workingDir)
+            summary['Modules'] = len(alg.genes.get_modules())
+            summary['Classified'] = alg.genes.count_classified_genes()
+            summary['Unclassified'] = alg.genes.size - summary['Classified']
+    except Exception as err:
+        summary['Status'] = 'FAIL: ' + str(err).replace('\t', ' ').replace('\n', ' ')
+    except SystemExit:
+        # raised on a non-empty working directory (see __verify_clean_working_dir)
+        # or an unreadable input file
+        summary['Status'] = 'FAIL: working directory contains output from a prior run ' \
+                            + 'or input file could not be read'
+    finally:
+        if alg is not None:
+            alg.close()
+        reset_worker()
+
+    summary['Runtime'] = "{0:0.1f}".format(time() - start)
+    return summary
+
+
+def reset_worker():
+    '''
+    restore a worker to a clean state between runs: clear the
+    R global environment, close R connections (and sinks),
+    remove log handlers and restore the working directory
+    '''
+    from .r.imports import base, wgcna, rsnippets
+
+    wgcna().disableWGCNAThreads()
+    rsnippets.resetWorkspace()
+
+    rootLogger = logging.getLogger()
+    for handler in list(rootLogger.handlers):
+        rootLogger.removeHandler(handler)
+        handler.close()
+
+    if 'initialDir' in WORKER:
+        base().setwd(WORKER['initialDir'])
+
+
+def count_iterations(workingDir):
+    '''
+    count iterations recorded in the run summary
+    '''
+    fileName = os.path.join(workingDir, 'iterative-wgcna-run-summary.txt')
+    with open(fileName) as f:
+        return sum(1 for _ in f) - 1 # exclude header
+
+
+class ParameterSweep(object):
+    '''
+    run iterativeWGCNA for each configuration in
+    a parameter grid and assemble a comparison table
+    '''
+
+    def __init__(self, args):
+        self.args = args
+        self.args.workingDir = os.path.abspath(self.args.workingDir)
+        create_dir(self.args.workingDir)
+        self.configurations = expand_grid(self.args.grid)
+        self.logger = self.__initialize_log()
+
+
+    def __initialize_log(self):
+        '''
+        initialize sweep log
+        '''
+        logger = logging.getLogger('iterativeWGCNA.ParameterSweep')
+        logger.setLevel(logging.DEBUG)
+        handler = logging.FileHandler(os.path.join(self.args.workingDir,
+                                                   'iterativeWGCNA-sweep.log'), mode='w')
+        handler.setFormatter(logging.Formatter('%(levelname)s: %(message)s'))
+        logger.addHandler(handler)
+        logger.propagate = False
+        return logger
+
+
+    def __load_expression_matrix(self):
+        '''
+        parse the input once and copy it to shared memory
+        '''
+        genes, samples, values = read_matrix(self.args.inputFile)
+        matrix = SharedMatrix.from_array(values)
+        return matrix, genes, samples
+
+
+    def run(self):
+        '''
+        run all configurations; write the comparison table
+        '''
+        self.logger.info(strftime("%c"))
+        self.logger.info("Running " + str(len(self.configurations)) + " configurations on "
+                         + str(self.args.processes) + " worker processes")
+        if self.args.verbose:
+            warning("Running " + str(len(self.configurations)) + " configurations")
+
+        matrix, genes, samples = self.__load_expression_matrix()
+        tasks = [(configuration_label(config), configuration_args(self.args, config))
+                 for config in self.configurations]
+        threads = worker_threads(self.args.threads, self.args.processes)
+        if threads is not None:
+            # --threads is the budget for the whole sweep
+            for _, args in tasks:
+                args.threads = threads
+            set_thread_environment(threads) # read by the spawned workers' BLAS
+            self.logger.info("Thread budget: " + str(threads) + " threads per worker")
+
+        results = {}
+        try:
+            # spawn, not fork, so each worker embeds its own R instance
+            context = multiprocessing.get_context('spawn')
+            pool = context.Pool(processes=self.args.processes,
+                                initializer=initialize_worker,
+                                initargs=(matrix.descriptor(), genes, samples))
+            try:
+                for summary in pool.imap_unordered(run_configuration, tasks):
+                    results[summary['Configuration']] = summary
+                    self.logger.info(summary['Configuration'] + ": " + summary['Status'])
+                    if self.args.verbose:
+                        warning(summary['Configuration'] + ": " + summary['Status'])
+            finally:
+                pool.close()
+                pool.join()
+        finally:
+            matrix.close()
+            matrix.unlink()
+
+        self.write_summary(results)
+        self.logger.info(strftime("%c"))
+
+
+    def write_summary(self, results):
+        '''
+        write one row per configuration to the comparison table
+        '''
+        fileName = os.path.join(self.args.workingDir, 'sweep-summary.txt')
+        names = list(self.args.grid.keys())
+        with open(fileName, 'w') as f:
+            header = None
+            for config in self.configurations:
+                summary = results[configuration_label(config)]
+                if header is None:
+                    header = ['Configuration'] + names + list(summary.keys())[1:]
+                    print('\t'.join(header), file=f)
+                row = [summary['Configuration']] + [str(config[n]) for n in names] \
+                      + [str(v) for v in list(summary.values())[1:]]
+                print('\t'.join(row), file=f)
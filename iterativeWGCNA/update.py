@@ -0,0 +1,367 @@
+# pylint: disable=invalid-name
+'''
+incremental update of module eigengenes and kME when samples
+are appended to the expression data of an earlier run
+
+per-gene sufficient statistics (non-missing count, sum and
+sum of squares of the expression values, and the sums needed
+for the correlation with the gene's module eigengene over the
+same samples) are kept in <result>sufficient-statistics.npz
+in the run directory; new sample columns are folded into the
+statistics, so kME (pairwise-complete Pearson correlation, as
+in WGCNA) is exact for the extended eigengenes without
+rereading the earlier samples
+
+eigengene values for the new samples are folded in from the
+module loadings: for standardized profiles z, the first
+principal component (the eigengene, scaled as by WGCNA) is
+sum(kME_g * z_g) / sum(kME_g^2) over the module members, with
+the gene means and standard deviations of the earlier samples;
+the eigengene values of the earlier samples are written exactly
+as read (the extended eigengenes are not re-standardized, so
+they keep the scale of the earlier samples rather than having
+mean 0 and variance 1 over all samples)
+
+a module is flagged when its eigengene may have shifted and
+the module may need to be re-detected: the folded-in eigengene
+of the new samples is compared with the first principal
+component of the module members over the new samples alone
+'''
+
+from __future__ import print_function
+
+import logging
+import os
+from time import strftime
+
+import numpy as np
+
+from .classify import result_prefix
+from .io.matrix import read_matrix, write_matrix
+from .io.utils import read_membership, warning, write_table, xstr
+
+STATISTICS_FILE = 'sufficient-statistics.npz'
+UPDATED_PREFIX = 'updated-'
+MIN_DRIFT_SAMPLES = 3 # new samples needed to estimate the eigengene shift
+DRIFT_HEADER = ('Module', 'N Members', 'N New Samples',
+                'Variance Explained (Before)', 'Variance Explained (After)',
+                'New Sample Eigengene Correlation', 'Flag')
+
+
+def align_rows(rowNames, values, targetNames):
+    '''
+    rows of values in the order of targetNames; rows
+    missing from rowNames are all NaN
+
+    returns (aligned values, number of missing rows)
+    '''
+    index = dict((name, i) for i, name in enumerate(rowNames))
+    aligned = np.full((len(targetNames), values.shape[1]), np.nan)
+    rows = [index.get(name, -1) for name in targetNames]
+    present = np.array([row >= 0 for row in rows], dtype=bool)
+    if present.any():
+        aligned[present] = values[[row for row in rows if row >= 0]]
+    return aligned, int((~present).sum())
+
+
+def first_component(values):
+    '''
+    first right singular vector of the row-centered values
+    (genes x samples), i.e., the module eigengene direction
+    over these samples alone
+    '''
+    centered = values - values.mean(axis=1)[:, None]
+    _, _, vt = np.linalg.svd(centered, full_matrices=False)
+    return vt[0]
+
+
+class SufficientStatistics(object):
+    '''
+    per-gene sufficient statistics for the correlation of each
+    classified gene with its module eigengene; expression values
+    are accumulated about a fixed per-gene shift (the initial
+    gene mean) for numerical stability
+    '''
+
+    def __init__(self, genes, modules, samples, moduleIndex, eigengenes, shift):
+        self.genes = list(genes)
+        self.modules = list(modules)
+        self.samples = list(samples)
+        self.moduleIndex = np.asarray(moduleIndex, dtype=np.int64) # module of each gene
+        self.eigengenes = np.asarray(eigengenes, dtype=np.float64) # modules x samples
+        self.shift = np.asarray(shift, dtype=np.float64)
+        geneCount = len(self.genes)
+        self.count = np.zeros(geneCount)
+        self.sums = np.zeros(geneCount)
+        self.squares = np.zeros(geneCount)
+        self.cross = np.zeros(geneCount) # sum of (shifted) value x eigengene
+        self.eigengeneSums = np.zeros(geneCount) # over the gene's non-missing samples
+        self.eigengeneSquares = np.zeros(geneCount)
+
+
+    @classmethod
+    def from_profiles(cls, genes, modules, samples, moduleIndex, values, eigengenes):
+        '''
+        statistics for an expression matrix (genes x samples,
+        same order as genes and samples) and the module
+        eigengenes (modules x samples)
+        '''
+        with np.errstate(invalid='ignore'):
+            shift = np.nan_to_num(np.nanmean(values, axis=1)) if values.shape[1] > 0 \
+                    else np.zeros(len(genes))
+        statistics = cls(genes, modules, [], moduleIndex, np.zeros((len(modules), 0)), shift)
+        statistics.accumulate(values, eigengenes)
+        statistics.samples = list(samples)
+        statistics.eigengenes = np.asarray(eigengenes, dtype=np.float64)
+        return statistics
+
+
+    @classmethod
+    def load(cls, fileName):
+        '''
+        load statistics saved with save()
+        '''
+        data = np.load(fileName)
+        statistics = cls(data['genes'].tolist(), data['modules'].tolist(),
+                         data['samples'].tolist(), data['moduleIndex'],
+                         data['eigengenes'], data['shift'])
+        for name in ('count', 'sums', 'squares', 'cross', 'eigengeneSums', 'eigengeneSquares'):
+            setattr(statistics, name, data[name])
+        return statistics
+
+
+    def save(self, fileName):
+        '''
+        write the statistics (replacing the file only once complete)
+        '''
+        tmpFile = fileName + '.tmp'
+        with open(tmpFile, 'wb') as f:
+            np.savez(f, genes=np.array(self.genes, dtype=str),
+                     modules=np.array(self.modules, dtype=str),
+                     samples=np.array(self.samples, dtype=str),
+                     moduleIndex=self.moduleIndex, eigengenes=self.eigengenes,
+                     shift=self.shift, count=self.count, sums=self.sums,
+                     squares=self.squares, cross=self.cross,
+                     eigengeneSums=self.eigengeneSums,
+                     eigengeneSquares=self.eigengeneSquares)
+        os.replace(tmpFile, fileName)
+
+
+    def accumulate(self, values, eigengenes):
+        '''
+        add sample columns (genes x k values; modules x k eigengenes)
+        '''
+        geneEigengenes = eigengenes[self.moduleIndex]
+        present = ~np.isnan(values)
+        shifted = np.where(present, values - self.shift[:, None], 0.0)
+        geneEigengenes = np.where(present, geneEigengenes, 0.0)
+        self.count += present.sum(axis=1)
+        self.sums += shifted.sum(axis=1)
+        self.squares += np.einsum('ij,ij->i', shifted, shifted)
+        self.cross += np.einsum('ij,ij->i', shifted, geneEigengenes)
+        self.eigengeneSums += geneEigengenes.sum(axis=1)
+        self.eigengeneSquares += np.einsum('ij,ij->i', geneEigengenes, geneEigengenes)
+
+
+    def kME(self):
+        '''
+        correlation of each gene with its module eigengene
+        (NaN for genes with too few values or constant profiles)
+        '''
+        count = np.maximum(self.count, 1)
+        covariance = self.cross - self.sums * self.eigengeneSums / count
+        geneVariance = self.squares - self.sums ** 2 / count
+        eigengeneVariance = self.eigengeneSquares - self.eigengeneSums ** 2 / count
+        with np.errstate(invalid='ignore', divide='ignore'):
+            kME = covariance / np.sqrt(geneVariance * eigengeneVariance)
+        kME[(self.count < 3) | (geneVariance <= 0) | (eigengeneVariance <= 0)] = np.nan
+        return np.clip(kME, -1.0, 1.0)
+
+
+    def standardize(self, values):
+        '''
+        z-scores of values with the accumulated gene means and
+        standard deviations; missing values are set to 0 (the mean)
+        '''
+        count = np.maximum(self.count, 1)
+        means = self.shift + self.sums / count
+        variance = (self.squares - self.sums ** 2 / count) / np.maximum(self.count - 1, 1)
+        sd = np.sqrt(np.maximum(variance, 0))
+        scale = np.where(sd > 0, 1.0 / np.where(sd > 0, sd, 1.0), 0.0)
+        z = (values - means[:, None]) * scale[:, None]
+        z[np.isnan(z)] = 0.0
+        return z
+
+
+    def fold_in(self, values):
+        '''
+        eigengene values (modules x k) for new sample columns
+        (genes x k) from the current module loadings (kME)
+        '''
+        z = self.standardize(values)
+        kME = np.nan_to_num(self.kME())
+        eigengenes = np.zeros((len(self.modules), values.shape[1]))
+        for m in range(len(self.modules)):
+            members = self.moduleIndex == m
+            weight = np.dot(kME[members], kME[members])
+            if weight > 0:
+                eigengenes[m] = np.dot(kME[members], z[members]) / weight
+        return eigengenes, z
+
+
+    def append_samples(self, samples, values, tolerance):
+        '''
+        fold new sample columns (genes x k, same gene order)
+        into the eigengenes and statistics
+
+        returns the drift summary: a row per module (see
+        DRIFT_HEADER); a module is flagged if 1 - |correlation|
+        of its folded-in eigengene with the first principal
+        component of its members over the new samples
+        exceeds tolerance
+        '''
+        duplicates = set(samples) & set(self.samples)
+        if duplicates:
+            raise ValueError("Samples already included: " + ', '.join(sorted(duplicates)[:10]))
+
+        before = self.kME()
+        newEigengenes, z = self.fold_in(values)
+        self.accumulate(values, newEigengenes)
+        self.eigengenes = np.hstack((self.eigengenes, newEigengenes))
+        self.samples.extend(samples)
+        after = self.kME()
+
+        drift = []
+        for m, module in enumerate(self.modules):
+            members = self.moduleIndex == m
+            correlation = float('NaN')
+            if len(samples) >= MIN_DRIFT_SAMPLES and members.sum() > 1:
+                component = first_component(z[members])
+                eigengene = newEigengenes[m] - newEigengenes[m].mean()
+                norm = np.linalg.norm(eigengene)
+                if norm > 0:
+                    correlation = abs(float(np.dot(component, eigengene)) / norm)
+            flag = 'SHIFTED' if correlation == correlation and 1.0 - correlation > tolerance \
+                   else ''
+            drift.append((module, int(members.sum()), len(samples),
+                          xstr(round(float(np.nanmean(before[members] ** 2)), 4)),
+                          xstr(round(float(np.nanmean(after[members] ** 2)), 4)),
+                          xstr(round(correlation, 4)), flag))
+        return drift
+
+
+class SampleUpdater(object):
+    '''
+    fold new samples into the eigengenes and kME
+    of an existing iterativeWGCNA result
+    '''
+
+    def __init__(self, args):
+        self.args = args
+        self.logger = logging.getLogger('iterativeWGCNA.SampleUpdater')
+        logging.basicConfig(filename=os.path.join(self.args.workingDir,
+                                                  'update-iterativeWGCNA.log'),
+                            filemode='w', format='%(levelname)s: %(message)s',
+                            level=logging.DEBUG)
+        prefix = result_prefix(args)
+        self.membershipFile = os.path.join(args.workingDir, prefix + 'membership.txt')
+        self.eigengeneFile = os.path.join(args.workingDir, prefix + 'eigengenes.txt')
+        self.statisticsFile = os.path.join(args.workingDir, prefix + STATISTICS_FILE)
+        self.outputPrefix = os.path.join(args.workingDir, UPDATED_PREFIX + prefix)
+
+
+    def log(self, message):
+        '''
+        log, and print if verbose
+        '''
+        self.logger.info(message)
+        if self.args.verbose:
+            warning(message)
+
+
+    def initialize_statistics(self):
+        '''
+        compute the statistics from the input of the run
+        '''
+        if self.args.inputFile is None:
+            raise ValueError("No statistics file (" + self.statisticsFile + "); "
+                             + "specify the input file of the run (--inputFile)")
+
+        _, membership = read_membership(self.membershipFile)
+        modules, samples, eigengenes = read_matrix(self.eigengeneFile)
+        moduleIndex = dict((module, i) for i, module in enumerate(modules))
+        genes = [gene for gene, row in membership.items() if row[1] in moduleIndex]
+
+        inputGenes, inputSamples, values = read_matrix(self.args.inputFile)
+        sampleIndex = dict((sample, i) for i, sample in enumerate(inputSamples))
+        missing = [sample for sample in samples if sample not in sampleIndex]
+        if missing:
+            raise ValueError("Samples of the eigengenes missing from "
+                             + self.args.inputFile + ": " + ', '.join(missing[:10]))
+        values, missingGenes = align_rows(inputGenes, values[:, [sampleIndex[s] for s in samples]],
+                                          genes)
+        if missingGenes > 0:
+            raise ValueError(str(missingGenes) + " classified genes missing from "
+                             + self.args.inputFile)
+
+        self.log("Computed statistics for " + str(len(genes)) + " classified genes, "
+                 + str(len(modules)) + " modules, and " + str(len(samples)) + " samples")
+        return SufficientStatistics.from_profiles(genes, modules, samples,
+                                                  [moduleIndex[membership[g][1]] for g in genes],
+                                                  values, eigengenes)
+
+
+    def write_results(self, statistics, drift=None):
+        '''
+        write the updated eigengenes and membership (kME),
+        and the drift summary
+        '''
+        eigengeneFile = self.outputPrefix + 'eigengenes.txt'
+        write_matrix(eigengeneFile, 'Module', statistics.modules, statistics.samples,
+                     statistics.eigengenes)
+
+        header, membership = read_membership(self.membershipFile)
+        for gene, kME in zip(statistics.genes, statistics.kME()):
+            membership[gene][2] = xstr(round(float(kME), 2))
+        write_table(self.outputPrefix + 'membership.txt', header, membership.values())
+
+        if drift is not None:
+            write_table(self.outputPrefix + 'eigengene-drift.txt', DRIFT_HEADER, drift)
+
+
+    def run(self):
+        '''
+        fold the new samples (if any) into the statistics and
+        write the updated results; returns the flagged modules
+        '''
+        self.logger.info(strftime("%c"))
+        if os.path.exists(self.statisticsFile):
+            statistics = SufficientStatistics.load(self.statisticsFile)
+            self.log("Loaded statistics for " + str(len(statistics.genes)) + " genes and "
+                     + str(len(statistics.samples)) + " samples from " + self.statisticsFile)
+        else:
+            statistics = self.initialize_statistics()
+
+        drift = None
+        flagged = []
+        if self.args.newSamples is not None:
+            genes, samples, values = read_matrix(self.args.newSamples)
+            values, missingGenes = align_rows(genes, values, statistics.genes)
+            if missingGenes > 0:
+                self.log("WARNING: " + str(missingGenes) + " classified genes missing from "
+                         + self.args.newSamples + "; their new values are treated as missing")
+            drift = statistics.append_samples(samples, values, self.args.driftTolerance)
+            flagged = [row[0] for row in drift if row[-1]]
+            self.log("Added " + str(len(samples)) + " samples; "
+                     + str(len(statistics.samples)) + " samples in total")
+            if flagged:
+                self.log(str(len(flagged)) + " modules may need to be re-detected "
+                         + "(eigengene shift > " + str(self.args.driftTolerance) + "): "
+                         + ', '.join(flagged))
+
+        self.write_results(statistics, drift)
+        statistics.save(self.statisticsFile)
+        self.log("Wrote " + self.outputPrefix + "eigengenes.txt and "
+                 + self.outputPrefix + "membership.txt")
+        self.logger.info(strftime("%c"))
+        return flagged
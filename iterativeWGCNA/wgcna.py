@@ -9,6 +9,8 @@ from collections import OrderedDict
 import rpy2.robjects as ro
 from .r.imports import base, wgcna, rsnippets, stats
 from .r.manager import RManager
+from .r.conversion import array2matrix, frame2array
+from .standardized import StandardizedProfiles
 
 class WgcnaManager(RManager):
     '''
@@ -53,19 +55,22 @@ class WgcnaManager(RManager):
         wgcna().collectGarbage()
 
 
-    def adjacency(self, networkType='signed', removeNegatives=False, removeSelfReferences=False):
+    def adjacency(self, networkType='signed', removeNegatives=False, removeSelfReferences=False,
+                  profiles=None):
         '''
         calculate adjacency matrix; from pearson correlation
-        '''
-
-        adjParams = {}
-        adjParams['power'] = self.params['power'] if 'power' in self.params else 6
-        adjParams['corFnc'] = 'cor'
-        adjParams['corOptions'] = "use='p'"
-        adjParams['type'] = networkType
-        adjParams['datExpr'] = self.transpose_data()
-
-        self.adjacencyMatrix = wgcna().adjacency(**adjParams)
+        (pairwise-complete, as WGCNA adjacency with use='p')
+        of the standardized profiles; if profiles (an Expression
+        object containing the genes in data) is provided, its
+        cached standardized profiles are used
+        '''
+        genes = list(self.row_names())
+        standardized = profiles.standardized() if profiles is not None \
+                       else StandardizedProfiles(genes, frame2array(self.data))
+        power = self.params['power'] if 'power' in self.params else 6
+
+        self.adjacencyMatrix = array2matrix(standardized.adjacency(genes, power, networkType),
+                                            genes, genes)
         self.collect_garbage()
         if removeNegatives:
             self.adjacencyMatrix = rsnippets.filterByThreshold(self.adjacencyMatrix, 0)
@@ -0,0 +1,18 @@
+#!/usr/bin/env python
+
+'''Run a parameter sweep directly from source tree.'''
+
+# Installation workaround - see README
+# import readline
+#pylint: disable=invalid-name
+
+from iterativeWGCNA.sweep import ParameterSweep
+from iterativeWGCNA.cmlargs import parse_sweep_command_line_args
+
+if __name__ == '__main__':
+    args = parse_sweep_command_line_args()
+    sweep = ParameterSweep(args)
+    sweep.run()
+
+__author__ = 'Emily Greenfest-Allen'
+__copyright__ = 'Copyright 2018, University of Pennsylvania'
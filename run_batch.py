@@ -0,0 +1,18 @@
+#!/usr/bin/env python
+
+'''Run a batch of jobs directly from source tree.'''
+
+# Installation workaround - see README
+# import readline
+#pylint: disable=invalid-name
+
+from iterativeWGCNA.batch import BatchRunner
+from iterativeWGCNA.cmlargs import parse_batch_command_line_args
+
+if __name__ == '__main__':
+    args = parse_batch_command_line_args()
+    batch = BatchRunner(args)
+    batch.run()
+
+__author__ = 'Emily Greenfest-Allen'
+__copyright__ = 'Copyright 2018, University of Pennsylvania'
@@ -0,0 +1,17 @@
+#!/usr/bin/env python
+
+'''Run the job server directly from source tree.'''
+
+# Installation workaround - see README
+# import readline
+#pylint: disable=invalid-name
+
+from iterativeWGCNA.server import serve
+from iterativeWGCNA.cmlargs import parse_server_command_line_args
+
+if __name__ == '__main__':
+    args = parse_server_command_line_args()
+    serve(args)
+
+__author__ = 'Emily Greenfest-Allen'
+__copyright__ = 'Copyright 2018, University of Pennsylvania'
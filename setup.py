@@ -12,7 +12,11 @@ setup(name='iterativeWGCNA',
       author_email='allenem@pennmedicine.upenn.edu',
       license='GNU',
       packages=find_packages(),
-      install_requires=['rpy2','matplotlib'],
+      python_requires='>=3.8',
+      install_requires=['rpy2>=3.0','matplotlib','numpy>=1.17'],
       keywords=['network', 'WGCNA', 'gene expression', 'bioinformatics'],
-      scripts=['bin/iterativeWGCNA', 'bin/iterativeWGCNA_merge'],
+      scripts=['bin/iterativeWGCNA', 'bin/iterativeWGCNA_merge',
+               'bin/iterativeWGCNA_sweep', 'bin/iterativeWGCNA_report',
+               'bin/iterativeWGCNA_batch', 'bin/iterativeWGCNA_server',
+               'bin/iterativeWGCNA_classify', 'bin/iterativeWGCNA_update'],
       zip_safe=False)
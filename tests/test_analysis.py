@@ -0,0 +1,36 @@
+'''
+tests for the critical correlation of the reassignment p-value
+'''
+
+import numpy as np
+import pytest
+
+from iterativeWGCNA.analysis import critical_correlation, regularized_incomplete_beta
+
+
+# Student t quantiles from R: qt(1 - threshold / 2, n - 2)
+@pytest.mark.parametrize('threshold, sampleCount, t', [(0.05, 12, 2.228138851986274),
+                                                       (0.05, 3, 12.70620473617471),
+                                                       (0.05, 102, 1.983971518523552),
+                                                       (0.01, 30, 2.763262455461066)])
+def test_matches_student_t_quantile(threshold, sampleCount, t):
+    df = sampleCount - 2.0
+    np.testing.assert_allclose(critical_correlation(threshold, [sampleCount]),
+                               [t / np.sqrt(df + t ** 2)], rtol=1e-10)
+
+
+@pytest.mark.parametrize('sampleCount', [4, 25, 500, 20000])
+def test_p_value_of_critical_correlation_is_the_threshold(sampleCount):
+    r = critical_correlation(0.001, [sampleCount])[0]
+    # P(r^2 > x) for r^2 ~ Beta(1/2, (n - 2)/2)
+    pValue = 1.0 - regularized_incomplete_beta(r ** 2, 0.5, (sampleCount - 2) / 2.0)
+    assert pValue == pytest.approx(0.001, rel=1e-8)
+
+
+def test_one_value_per_gene():
+    counts = [12, 2, 30, 12, 0]
+    result = critical_correlation(0.05, counts)
+    assert result.shape == (5,)
+    assert result[0] == result[3]
+    assert result[1] == result[4] == 1.0 # too few samples: never significant
+    assert result[2] < result[0]
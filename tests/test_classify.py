@@ -0,0 +1,61 @@
+'''
+tests for classifying new genes against an existing module set
+'''
+
+import argparse
+import os
+
+import numpy as np
+
+from iterativeWGCNA.classify import Classifier
+from iterativeWGCNA.io.matrix import read_matrix, write_matrix
+from iterativeWGCNA.io.utils import read_membership, write_table
+
+
+def classify_args(workingDir, inputFile, batchSize=2):
+    return argparse.Namespace(workingDir=workingDir, inputFile=inputFile, verbose=False,
+                              result='merged', finalMergeCutHeight=0.05, minKMEtoStay=0.8,
+                              reassignThreshold=0.05, batchSize=batchSize)
+
+
+def test_new_genes_are_assigned_to_modules(tmp_path):
+    rng = np.random.default_rng(5)
+    samples = ['S' + str(i) for i in range(30)]
+    eigengenes = rng.normal(size=(2, 30))
+    workingDir = str(tmp_path)
+    write_matrix(os.path.join(workingDir, 'merged-0.05-eigengenes.txt'), 'Module',
+                 ['blue', 'red'], samples, eigengenes)
+    write_table(os.path.join(workingDir, 'merged-0.05-membership.txt'),
+                ('Gene', 'Module', 'kME'), [('old1', 'blue', '0.95'), ('old2', 'red', '0.91')])
+
+    genes = ['old1', 'newBlue', 'newRed', 'noise', 'newBlue2']
+    values = np.vstack((eigengenes[0], eigengenes[0] + 0.1 * rng.normal(size=30),
+                        -3 + 2 * eigengenes[1] + 0.1 * rng.normal(size=30),
+                        rng.normal(size=30), eigengenes[0] + 0.2 * rng.normal(size=30)))
+    inputFile = os.path.join(workingDir, 'input.txt')
+    # input samples in a different order than the eigengenes
+    order = rng.permutation(30)
+    write_matrix(inputFile, 'Gene', genes, [samples[i] for i in order], values[:, order])
+
+    classifier = Classifier(classify_args(workingDir, inputFile))
+    assert classifier.run() == 3
+
+    _, membership = read_membership(os.path.join(workingDir,
+                                                 'classified-merged-0.05-membership.txt'))
+    assert list(membership) == ['old1', 'old2', 'newBlue', 'newRed', 'noise', 'newBlue2']
+    assert membership['old1'][1:] == ['blue', '0.95'] # existing genes are kept as is
+    assert [membership[g][1] for g in ('newBlue', 'newRed', 'noise', 'newBlue2')] \
+        == ['blue', 'red', 'UNCLASSIFIED', 'blue']
+
+    kmeGenes, modules, kME = read_matrix(os.path.join(workingDir,
+                                                      'classified-merged-0.05-kme.txt'))
+    assert kmeGenes == ['newBlue', 'newRed', 'noise', 'newBlue2'] # appended per batch
+    assert modules == ['blue', 'red']
+    np.testing.assert_allclose(kME[0, 0], np.corrcoef(values[1], eigengenes[0])[0, 1])
+    assert float(membership['newRed'][2]) == round(kME[1, 1], 2)
+
+    # a rerun replaces the kME file
+    classifier = Classifier(classify_args(workingDir, inputFile, batchSize=10))
+    classifier.run()
+    assert read_matrix(os.path.join(workingDir, 'classified-merged-0.05-kme.txt'))[0] \
+        == kmeGenes
@@ -0,0 +1,70 @@
+'''
+tests for the verified compression of output files
+'''
+
+import os
+
+import pytest
+
+from iterativeWGCNA.io.compress import archive_name, compress_file, matching_files, \
+    open_archive, Compressor, CODECS
+
+
+def write_file(fileName, size=100000):
+    data = os.urandom(size // 2) + b'\0' * (size - size // 2)
+    with open(fileName, 'wb') as f:
+        f.write(data)
+    return data
+
+
+@pytest.mark.parametrize('codec', sorted(CODECS))
+def test_compress_file_round_trip(tmp_path, codec):
+    fileName = str(tmp_path / 'block-TOM.RData')
+    data = write_file(fileName)
+    name, originalSize, compressedSize = compress_file(fileName, codec, level=0)
+    assert (name, originalSize) == (fileName, len(data))
+    assert not os.path.exists(fileName) # removed only once verified
+    archive = archive_name(fileName, codec)
+    assert os.path.getsize(archive) == compressedSize
+    with open_archive(archive, 'rb', codec) as f:
+        assert f.read() == data
+
+
+def test_failed_verification_keeps_original(tmp_path, monkeypatch):
+    fileName = str(tmp_path / 'block-TOM.RData')
+    write_file(fileName)
+    monkeypatch.setattr('iterativeWGCNA.io.compress.stream_checksum', lambda stream: (0, 0))
+    with pytest.raises(IOError):
+        compress_file(fileName)
+    assert os.path.exists(fileName)
+    assert os.listdir(str(tmp_path)) == ['block-TOM.RData']
+
+
+def test_matching_files_skips_archives(tmp_path):
+    for name in ('a-TOM.RData', 'b-TOM.RData.gz', 'c-TOM.RData.gz.part', 'membership.txt'):
+        write_file(str(tmp_path / name), 10)
+    assert matching_files(str(tmp_path), 'TOM') == [str(tmp_path / 'a-TOM.RData')]
+
+
+def test_compressor(tmp_path):
+    for name in ('a-TOM.RData', 'b-TOM.RData'):
+        write_file(str(tmp_path / name))
+    compressor = Compressor('gzip', 1, processes=2)
+    compressor.submit(str(tmp_path), 'TOM')
+    assert compressor.close() == []
+    assert sorted(os.listdir(str(tmp_path))) == ['a-TOM.RData.gz', 'b-TOM.RData.gz']
+
+
+class FailingResult(object):
+    def get(self):
+        raise ValueError('unexpected')
+
+
+def test_compressor_is_shut_down_on_unexpected_errors():
+    compressor = Compressor('gzip', 1, processes=1)
+    compressor.pending.append(('x', FailingResult()))
+    with pytest.raises(ValueError):
+        compressor.close()
+    assert compressor.pending == []
+    with pytest.raises(ValueError): # the pool is closed
+        compressor.pool.apply_async(len, ([],))
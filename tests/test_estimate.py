@@ -0,0 +1,38 @@
+'''
+tests for the dry-run cost model
+'''
+
+from iterativeWGCNA.estimate import iteration_cost, pass_iterations, run_passes, \
+    ITERATION_RETAIN_FRACTION, MAX_ESTIMATED_PASSES
+
+
+def test_pass_iterations_converge():
+    counts, classified = pass_iterations(10000, 20)
+    assert counts[0] == 10000
+    assert counts[1] == int(10000 * ITERATION_RETAIN_FRACTION)
+    # the fraction dropped shrinks with each iteration
+    drops = [1.0 - float(b) / a for a, b in zip(counts, counts[1:])]
+    assert all(later < earlier for earlier, later in zip(drops, drops[1:]))
+    assert 0 < classified <= counts[-1]
+
+
+def test_pass_iterations_too_few_genes():
+    assert pass_iterations(30, 20) == ([], 0)
+
+
+def test_later_passes_run_on_residuals():
+    passes = run_passes(10000, 20)
+    assert 1 < len(passes) <= MAX_ESTIMATED_PASSES
+    genes = 10000
+    for counts in passes:
+        assert counts[0] == genes
+        _, classified = pass_iterations(genes, 20)
+        genes = genes - classified
+    assert run_passes(10, 20) == []
+
+
+def test_iteration_cost_blocks():
+    blocks, seconds, memory = iteration_cost(2500, 10, 1000, 1.0, 0.0)
+    assert blocks == 3
+    assert seconds == 10 * (2 * 1000 ** 2 + 500 ** 2)
+    assert memory > 0
@@ -0,0 +1,113 @@
+'''
+tests for the native matrix reader and writer
+'''
+
+import gzip
+
+import numpy as np
+import pytest
+
+from iterativeWGCNA.io.matrix import count_lines, iter_matrix_chunks, read_header, \
+    read_matrix, write_matrix
+
+
+@pytest.fixture
+def matrix():
+    rng = np.random.default_rng(1)
+    values = rng.normal(size=(7, 4))
+    values[2, 1] = np.nan
+    return ['1', 'ENSG-0001', 'gene.3', 'X4', 'a b', '6', '7'], ['S-1', 'S 2', '3', 'S4'], values
+
+
+def test_round_trip(tmp_path, matrix):
+    rowNames, colNames, values = matrix
+    fileName = str(tmp_path / 'matrix.txt')
+    write_matrix(fileName, 'Gene', rowNames, colNames, values, chunkRows=3)
+
+    readRows, readColumns, readValues = read_matrix(fileName, chunkRows=2)
+    assert readRows == rowNames # labels are not altered as they are by R
+    assert readColumns == colNames
+    np.testing.assert_array_equal(np.isnan(readValues), np.isnan(values))
+    np.testing.assert_allclose(readValues, values, rtol=1e-14)
+
+
+def test_missing_values_are_written_as_na(tmp_path, matrix):
+    rowNames, colNames, values = matrix
+    fileName = str(tmp_path / 'matrix.txt')
+    write_matrix(fileName, 'Gene', rowNames, colNames, values)
+    with open(fileName) as f:
+        lines = f.readlines()
+    assert lines[3].split('\t')[2] == 'NA'
+    assert 'nan' not in ''.join(lines)
+
+
+def test_write_appends_rows(tmp_path, matrix):
+    rowNames, colNames, values = matrix
+    fileName = str(tmp_path / 'matrix.txt')
+    write_matrix(fileName, 'Gene', rowNames[:3], colNames, values[:3], append=True)
+    write_matrix(fileName, 'Gene', rowNames[3:], colNames, values[3:], append=True)
+    assert count_lines(fileName) == 8
+    assert read_matrix(fileName)[0] == rowNames
+
+
+def test_write_replaces_existing_file(tmp_path, matrix):
+    rowNames, colNames, values = matrix
+    fileName = str(tmp_path / 'matrix.txt')
+    write_matrix(fileName, 'Gene', rowNames, colNames, values)
+    write_matrix(fileName, 'Gene', rowNames[:2], colNames, values[:2])
+    assert count_lines(fileName) == 3
+    assert read_matrix(fileName)[0] == rowNames[:2]
+
+
+def test_chunks(tmp_path, matrix):
+    rowNames, colNames, values = matrix
+    fileName = str(tmp_path / 'matrix.txt')
+    write_matrix(fileName, 'Gene', rowNames, colNames, values)
+    chunks = list(iter_matrix_chunks(fileName, chunkRows=3))
+    assert [len(names) for names, _ in chunks] == [3, 3, 1]
+    assert all(chunk.shape[1] == len(colNames) for _, chunk in chunks)
+
+
+def test_quoted_gzipped_input_with_r_style_header(tmp_path):
+    fileName = str(tmp_path / 'matrix.txt.gz')
+    with gzip.open(fileName, 'wt') as f:
+        f.write('"A"\t"B"\n"g1"\t1.5\tNA\n"g2"\t"NA"\t-2\n')
+    assert read_header(fileName) == (None, ['A', 'B'])
+    rowNames, colNames, values = read_matrix(fileName)
+    assert rowNames == ['g1', 'g2']
+    assert colNames == ['A', 'B']
+    np.testing.assert_array_equal(values, [[1.5, np.nan], [np.nan, -2.0]])
+
+
+def test_empty_fields_are_missing(tmp_path):
+    fileName = str(tmp_path / 'matrix.txt')
+    with open(fileName, 'w') as f:
+        f.write('Gene\tA\tB\tC\ng1\t\t1\t\ng2\t2\t\t3\r\ng3\t4\t5\t')
+    rowNames, _, values = read_matrix(fileName)
+    assert rowNames == ['g1', 'g2', 'g3']
+    np.testing.assert_array_equal(values, [[np.nan, 1.0, np.nan],
+                                           [2.0, np.nan, 3.0],
+                                           [4.0, 5.0, np.nan]])
+
+
+def test_count_lines_without_final_newline(tmp_path):
+    fileName = str(tmp_path / 'lines.txt')
+    with open(fileName, 'w') as f:
+        f.write('a\nb\nc')
+    assert count_lines(fileName) == 3
+
+
+def test_duplicate_row_labels_are_rejected(tmp_path):
+    fileName = str(tmp_path / 'matrix.txt')
+    with open(fileName, 'w') as f:
+        f.write('Gene\tA\ng1\t1\ng1\t2\n')
+    with pytest.raises(ValueError):
+        read_matrix(fileName)
+
+
+def test_non_numeric_values_are_reported(tmp_path):
+    fileName = str(tmp_path / 'matrix.txt')
+    with open(fileName, 'w') as f:
+        f.write('Gene\tA\tB\ng1\t1\tx\n')
+    with pytest.raises(ValueError, match='lines 2-2'):
+        read_matrix(fileName)
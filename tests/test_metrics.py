@@ -0,0 +1,61 @@
+'''
+tests for the per-stage timing and memory instrumentation
+'''
+
+import json
+
+from iterativeWGCNA.metrics import Metrics
+
+
+class RMemory(object):
+    def __init__(self):
+        self.calls = []
+
+    def __call__(self, full=True):
+        self.calls.append(full)
+        return 100.0 + 10 * len(self.calls)
+
+
+def test_records_per_stage_r_memory(tmp_path):
+    fileName = str(tmp_path / 'metrics.jsonl')
+    rMemory = RMemory()
+    metrics = Metrics(fileName, rMemory=rMemory)
+    metrics.begin_iteration('P1_I1', 100)
+    with metrics.stage('blockwise_modules'):
+        pass
+    with metrics.stage('update_kME'):
+        pass
+    with metrics.stage('update_kME'):
+        pass
+    metrics.begin_iteration('P1_I2', 50)
+    with metrics.stage('blockwise_modules'):
+        pass
+    metrics.end_iteration()
+
+    # a minor collection after each stage, a full one per iteration
+    assert rMemory.calls == [False, False, False, True, False, True]
+    with open(fileName) as f:
+        records = [json.loads(line) for line in f]
+    assert [record['iteration'] for record in records] == ['P1_I1', 'P1_I2']
+    stages = records[0]['stages']
+    assert stages['blockwise_modules']['rMb'] == 110.0
+    assert stages['update_kME']['calls'] == 2 and stages['update_kME']['rMb'] == 130.0
+    assert records[0]['rMb'] == 140.0 and records[1]['rMb'] == 160.0
+    assert records[0]['genes'] == 100
+    assert all(stage['rssMb'] > 0 for stage in stages.values())
+
+    summary = metrics.summary()
+    assert summary[0].split() == ['Stage', 'Calls', 'Seconds', '%', 'Max', 'RSS', 'Max', 'R']
+    row = dict((line.split()[0], line.split()) for line in summary[1:-2])
+    assert row['blockwise_modules'][1] == '2' and row['blockwise_modules'][-1] == '150.0'
+    assert summary[-1] == 'Max R memory (Mb): 160.0'
+
+
+def test_without_r():
+    metrics = Metrics(None)
+    with metrics.stage('prefilter'):
+        pass
+    metrics.end_iteration()
+    summary = metrics.summary()
+    assert summary[1].split()[-1] == 'NA'
+    assert summary[-1].startswith('TOTAL')
@@ -0,0 +1,44 @@
+'''
+tests for the variance/MAD/mean/missingness prefilter
+'''
+
+import argparse
+
+import numpy as np
+
+from iterativeWGCNA.prefilter import filter_reasons, median_absolute_deviation, \
+    prefilter_enabled, LOW_MAD, LOW_MEAN, LOW_VARIANCE, MISSING
+
+
+def test_prefilter_enabled():
+    assert not prefilter_enabled(argparse.Namespace())
+    assert not prefilter_enabled(argparse.Namespace(minVariance=None, minMAD=None))
+    assert prefilter_enabled(argparse.Namespace(minMAD=0.5))
+    assert prefilter_enabled(argparse.Namespace(maxMissingFraction=0.2))
+
+
+def test_median_absolute_deviation():
+    values = np.array([[1.0, 2.0, 3.0, 4.0, 100.0], [1.0, np.nan, 1.0, 3.0, 1.0]])
+    np.testing.assert_allclose(median_absolute_deviation(values), [1.0, 0.0])
+
+
+def test_filter_reasons():
+    values = np.array([[5.0, 6.0, 7.0, 8.0],         # passes
+                       [5.0, np.nan, np.nan, 8.0],   # missing
+                       [0.1, 0.2, 0.3, 0.4],         # low mean
+                       [5.0, 5.0, 5.0, 5.01],        # low variance (and MAD)
+                       [5.0, 5.0, 5.0, 9.0],         # low MAD only
+                       [np.nan] * 4])                # all missing
+    reasons = filter_reasons(values, minVariance=0.5, minMAD=0.5, minMean=1.0,
+                             maxMissingFraction=0.25)
+    assert reasons == [None, MISSING, LOW_MEAN, LOW_VARIANCE, LOW_MAD, MISSING]
+
+
+def test_filter_reasons_without_thresholds():
+    assert filter_reasons(np.zeros((3, 4))) == [None, None, None]
+
+
+def test_all_missing_row_fails_any_threshold():
+    values = np.array([[np.nan] * 4, [1.0, 2.0, 3.0, 4.0]])
+    assert filter_reasons(values, minVariance=0.0) == [LOW_VARIANCE, None]
+    assert filter_reasons(values, minMean=-np.inf) == [LOW_MEAN, None]
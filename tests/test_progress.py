@@ -0,0 +1,94 @@
+'''
+tests for progress reporting and the ETA model
+'''
+
+import io
+import json
+
+import pytest
+
+from iterativeWGCNA.progress import ProgressReporter, format_duration
+
+
+def iteration(passCount, iterationCount, genes, classified, time):
+    return {'event': 'iteration', 'time': time, 'passCount': passCount,
+            'iteration': 'P' + str(passCount) + '_I' + str(iterationCount),
+            'iterationCount': iterationCount, 'genes': genes, 'classified': classified,
+            'modules': 3}
+
+
+def read_status(statusFile):
+    with open(statusFile) as f:
+        return json.load(f)
+
+
+@pytest.fixture
+def reporter(tmp_path):
+    return ProgressReporter(statusFile=str(tmp_path / 'status.json'))
+
+
+def test_format_duration():
+    assert format_duration(None) == '?'
+    assert format_duration(3725.4) == '1:02:05'
+
+
+def test_no_estimate_before_first_iteration(reporter):
+    reporter({'event': 'start', 'time': 0.0, 'genes': 1000, 'samples': 20})
+    status = read_status(reporter.statusFile)
+    assert status['state'] == 'running' and status['pass'] == 1
+    assert status['genesInPlay'] == 1000 and status['classifiedGenes'] == 0
+    assert status['passEtaSeconds'] is None and status['runEtaSeconds'] is None
+
+
+def test_status_and_estimates(reporter):
+    reporter({'event': 'start', 'time': 0.0, 'genes': 1000, 'samples': 20})
+    reporter(iteration(1, 1, 1000, 600, 10.0))
+    status = read_status(reporter.statusFile)
+    assert status['iteration'] == 'P1_I1'
+    assert status['genesInPlay'] == 600 and status['classifiedGenes'] == 600
+    assert status['fractionClassified'] == 0.6
+    assert status['lastIterationSeconds'] == 10.0
+    # later passes on the residuals add to the run estimate
+    assert 0 < status['passEtaSeconds'] < status['runEtaSeconds']
+
+    reporter(iteration(1, 2, 600, 600, 13.6))
+    reporter({'event': 'pass', 'time': 13.6, 'passCount': 1, 'genes': 1000,
+              'classified': 600, 'totalClassified': 600})
+    status = read_status(reporter.statusFile)
+    assert status['pass'] == 2 and status['iteration'] is None
+    assert status['genesInPlay'] == 400 and status['classifiedGenes'] == 600
+    assert reporter.rate() == pytest.approx(13.6 / (1000 ** 2 + 600 ** 2))
+
+    reporter({'event': 'final', 'time': 20.0, 'genes': 1000, 'classified': 800,
+              'modules': 5})
+    assert read_status(reporter.statusFile)['state'] == 'merging'
+    reporter({'event': 'merged', 'time': 21.0, 'genes': 1000, 'classified': 850,
+              'modules': 4})
+    reporter({'event': 'end', 'time': 22.0, 'success': True})
+    status = read_status(reporter.statusFile)
+    assert status['state'] == 'complete' and status['classifiedGenes'] == 850
+    assert status['elapsedSeconds'] == 22.0
+
+
+def test_remaining_run_cost_includes_later_passes(reporter):
+    reporter.passClassified = 0.5
+    passCost = reporter.remaining_pass_cost(1000)
+    assert passCost >= 1000 ** 2
+    assert reporter.remaining_run_cost(passCost, 1000) > passCost
+    reporter.passClassified = 0.0
+    assert reporter.remaining_run_cost(passCost, 1000) == passCost
+
+
+def test_unknown_events_are_ignored(reporter):
+    reporter({'event': 'other', 'time': 1.0})
+    assert reporter.lastTime is None
+
+
+def test_terminal_line():
+    stream = io.StringIO()
+    reporter = ProgressReporter(terminal=True, stream=stream)
+    reporter({'event': 'start', 'time': 0.0, 'genes': 100, 'samples': 10})
+    reporter(iteration(1, 1, 100, 80, 5.0))
+    line = stream.getvalue().splitlines()[-1]
+    assert line.startswith('[running] pass 1 P1_I1 | genes in play: 80')
+    assert 'classified: 80/100 (80.0%)' in line
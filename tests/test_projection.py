@@ -0,0 +1,62 @@
+'''
+tests for the low-rank sample-space projection
+'''
+
+import numpy as np
+import pytest
+
+from iterativeWGCNA.projection import component_labels, correlation_error, project_samples, \
+    randomized_svd
+from iterativeWGCNA.screen import standardize_rows
+
+
+@pytest.fixture
+def values():
+    rng = np.random.default_rng(7)
+    return np.dot(rng.normal(size=(60, 4)), rng.normal(size=(4, 200))) \
+        + 0.05 * rng.normal(size=(60, 200))
+
+
+def test_randomized_svd_matches_svd(values):
+    _, s, _ = randomized_svd(values, 4)
+    np.testing.assert_allclose(s[:4], np.linalg.svd(values, compute_uv=False)[:4], rtol=1e-6)
+
+
+def test_projection_preserves_correlations(values):
+    projected, componentCount, explained = project_samples(values, 0.95)
+    assert componentCount == 4
+    assert projected.shape == (60, 8)
+    assert 0.95 <= explained <= 1.0
+    np.testing.assert_allclose(projected[:, 4:], -projected[:, :4])
+    np.testing.assert_allclose(projected.mean(axis=1), 0, atol=1e-12)
+    np.testing.assert_allclose(np.corrcoef(projected), np.corrcoef(values), atol=0.02)
+
+
+def test_projection_is_reproducible(values):
+    first, _, _ = project_samples(values, 0.9)
+    second, _, _ = project_samples(values, 0.9)
+    np.testing.assert_array_equal(first, second)
+
+
+def test_full_projection(values):
+    projected, componentCount, explained = project_samples(values, 1.0)
+    assert componentCount <= 60
+    assert explained == pytest.approx(1.0)
+    maxError, rmsError = correlation_error(values, projected)
+    assert maxError < 1e-8 and rmsError < 1e-8
+
+
+def test_correlation_error(values):
+    projected, componentCount, _ = project_samples(values, 0.5)
+    maxError, rmsError = correlation_error(values, projected, sampleSize=30)
+    assert componentCount < 4
+    assert maxError >= rmsError > 0
+    exact = standardize_rows(values)
+    approximate = standardize_rows(projected)
+    errors = np.abs(np.dot(exact, exact.T) - np.dot(approximate, approximate.T))
+    assert maxError <= errors.max() + 1e-12
+    assert correlation_error(values[:1], projected[:1]) == (0.0, 0.0)
+
+
+def test_component_labels():
+    assert component_labels(2) == ['PC1', 'PC2', 'PC1_neg', 'PC2_neg']
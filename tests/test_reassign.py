@@ -0,0 +1,65 @@
+'''
+tests for reassignment of genes to the best-fitting module
+'''
+
+import numpy as np
+import pytest
+
+from iterativeWGCNA.reassign import reassign_to_modules
+
+
+def sequential_reassign(kME, significant, minKMEtoStay, current, currentKME):
+    '''
+    the gene-by-gene loop of the original Genes.reassign_to_best_fit
+    '''
+    current = list(current)
+    currentKME = list(currentKME)
+    count = 0
+    for m in range(kME.shape[1]):
+        for g in range(kME.shape[0]):
+            if current[g] != m:
+                newKME = round(kME[g, m], 2)
+                if (current[g] < 0 and newKME >= minKMEtoStay) \
+                   or (newKME > currentKME[g] and significant[g, m]):
+                    current[g] = m
+                    currentKME[g] = newKME
+                    count = count + 1
+    return np.array(current), np.array(currentKME, dtype=np.float64), count
+
+
+@pytest.mark.parametrize('seed', range(10))
+def test_matches_sequential_loop(seed):
+    rng = np.random.default_rng(seed)
+    geneCount, moduleCount = 200, 6
+    kME = rng.uniform(-1, 1, size=(geneCount, moduleCount))
+    kME[rng.random(kME.shape) < 0.02] = np.nan
+    significant = np.abs(kME) > 0.4
+    current = rng.integers(-1, moduleCount, size=geneCount)
+    currentKME = np.where(current >= 0, rng.uniform(0, 1, size=geneCount), np.nan)
+
+    assigned, assignedKME, count = reassign_to_modules(kME, significant, 0.8,
+                                                       current, currentKME)
+    expected, expectedKME, expectedCount = sequential_reassign(kME, significant, 0.8,
+                                                               current, currentKME)
+    np.testing.assert_array_equal(assigned, expected)
+    np.testing.assert_array_equal(assignedKME, expectedKME)
+    assert count == expectedCount
+
+
+def test_inputs_are_not_modified():
+    kME = np.array([[0.9, 0.95]])
+    current = np.array([0])
+    currentKME = np.array([0.9])
+    reassign_to_modules(kME, np.ones((1, 2), dtype=bool), 0.8, current, currentKME)
+    assert current[0] == 0 and currentKME[0] == 0.9
+
+
+def test_unclassified_genes():
+    kME = np.array([[0.79, 0.5], # below minKMEtoStay everywhere
+                    [0.85, 0.9], # joins the first module, moves to the second
+                    [0.85, 0.9]]) # as above, but the second correlation is not significant
+    significant = np.array([[True, True], [True, True], [True, False]])
+    assigned, assignedKME, count = reassign_to_modules(kME, significant, 0.8)
+    np.testing.assert_array_equal(assigned, [-1, 1, 0])
+    np.testing.assert_array_equal(assignedKME, [np.nan, 0.9, 0.85])
+    assert count == 3
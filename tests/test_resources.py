@@ -0,0 +1,119 @@
+'''
+tests for block sizing and the thread budget
+'''
+
+import os
+from contextlib import nullcontext
+
+import pytest
+
+from iterativeWGCNA import resources
+from iterativeWGCNA.resources import choose_block_size, estimate_block_memory, \
+    is_allocation_failure, limit_job_threads, max_block_size, numpy_blas_threads, \
+    reduced_block_size, set_thread_environment, thread_budget, worker_threads, \
+    BLAS_THREAD_VARIABLES, MEMORY_FRACTION, MIN_BLOCK_SIZE
+
+
+class Args(object):
+    def __init__(self, threads=None):
+        self.threads = threads
+
+
+@pytest.mark.parametrize('sampleCount', [10, 500, 20000])
+def test_max_block_size_fits_in_memory(sampleCount):
+    memory = 8 * 1024 ** 3
+    blockSize = max_block_size(sampleCount, memory)
+    assert estimate_block_memory(blockSize, sampleCount) <= MEMORY_FRACTION * memory
+    assert estimate_block_memory(blockSize + 1, sampleCount) > MEMORY_FRACTION * memory
+
+
+def test_choose_block_size_with_memory_limit():
+    # all genes fit: a single block
+    assert choose_block_size(5000, 100, memoryLimit=16384) == (5000, 16384 * 1048576.0)
+    # too little memory: never below the minimum block size
+    blockSize, _ = choose_block_size(50000, 100, memoryLimit=1)
+    assert blockSize == MIN_BLOCK_SIZE
+
+
+def test_reduced_block_size():
+    assert reduced_block_size(8000) == 4000
+    assert reduced_block_size(MIN_BLOCK_SIZE) is None
+
+
+def test_is_allocation_failure():
+    assert is_allocation_failure(MemoryError())
+    assert is_allocation_failure(RuntimeError("Error: cannot allocate vector of size 2.5 Gb"))
+    assert not is_allocation_failure(RuntimeError("object 'x' not found"))
+
+
+@pytest.mark.parametrize('threads', [1, 2, 3, 4, 8, 16, 64])
+@pytest.mark.parametrize('compressionProcesses', [0, 2])
+def test_thread_budget_is_not_oversubscribed(monkeypatch, threads, compressionProcesses):
+    monkeypatch.setattr(resources, 'available_cpus', lambda: 32)
+    split = thread_budget(threads, compressionProcesses)
+    assert split['budget'] == min(threads, 32)
+    compute = split['budget'] - split['compressionProcesses']
+    assert min(split['wgcnaThreads'], split['rBLASThreads']) >= 1
+    if compute >= 2:
+        assert split['wgcnaThreads'] + split['rBLASThreads'] == compute
+    # the NumPy stages run while R is idle
+    assert split['numpyBLASThreads'] == max(1, compute)
+    assert split['compressionProcesses'] <= max(1, split['budget'] // 4)
+
+
+def test_thread_budget_defaults_to_available_cpus(monkeypatch):
+    monkeypatch.setattr(resources, 'available_cpus', lambda: 12)
+    split = thread_budget()
+    assert split['budget'] == 12
+    assert split['compressionProcesses'] == 0
+    assert (split['wgcnaThreads'], split['rBLASThreads'], split['numpyBLASThreads']) == (9, 3, 12)
+
+
+def test_worker_threads(monkeypatch):
+    monkeypatch.setattr(resources, 'available_cpus', lambda: 8)
+    assert worker_threads(None, 4) is None
+    assert worker_threads(8, 4) == 2
+    assert worker_threads(64, 4) == 2 # capped by the available CPUs
+    assert worker_threads(2, 4) == 1
+
+
+def test_limit_job_threads():
+    args = Args()
+    limit_job_threads(args, 4)
+    assert args.threads == 4
+    args = Args(threads=16)
+    limit_job_threads(args, 4)
+    assert args.threads == 4
+    args = Args(threads=2)
+    limit_job_threads(args, None)
+    assert args.threads == 2
+
+
+def test_set_thread_environment(monkeypatch):
+    for variable in BLAS_THREAD_VARIABLES:
+        monkeypatch.delenv(variable, raising=False)
+    set_thread_environment(3)
+    assert all(os.environ[variable] == '3' for variable in BLAS_THREAD_VARIABLES)
+
+
+def test_numpy_blas_threads_is_scoped(monkeypatch):
+    calls = []
+
+    class Limits(object):
+        def __init__(self, limits, user_api):
+            calls.append((limits, user_api))
+
+        def __enter__(self):
+            calls.append('enter')
+
+        def __exit__(self, *exc):
+            calls.append('restore')
+
+    monkeypatch.setattr(resources, 'threadpool_limits', Limits)
+    with numpy_blas_threads(6):
+        assert calls == [(6, 'blas'), 'enter']
+    assert calls[-1] == 'restore'
+
+    assert isinstance(numpy_blas_threads(None), nullcontext)
+    monkeypatch.setattr(resources, 'threadpool_limits', None)
+    assert isinstance(numpy_blas_threads(6), nullcontext)
@@ -0,0 +1,52 @@
+'''
+tests for the blocked max-neighbor-correlation screen
+'''
+
+import numpy as np
+import pytest
+
+from iterativeWGCNA.screen import max_neighbor_correlation, screen_isolated_genes, \
+    standardize_rows
+
+
+@pytest.fixture
+def values():
+    rng = np.random.default_rng(5)
+    signal = rng.normal(size=30)
+    correlated = signal + 0.2 * rng.normal(size=(10, 30))
+    return np.vstack((correlated, rng.normal(size=(15, 30))))
+
+
+def expected_max_correlation(values):
+    correlation = np.abs(np.corrcoef(values))
+    np.fill_diagonal(correlation, 0)
+    return correlation.max(axis=1)
+
+
+def test_standardize_rows(values):
+    standardized = standardize_rows(values)
+    np.testing.assert_allclose(np.dot(standardized, standardized.T), np.corrcoef(values),
+                               atol=1e-12)
+
+
+def test_standardize_constant_and_missing_rows():
+    standardized = standardize_rows([[1.0, 1.0, 1.0], [1.0, np.nan, 3.0]])
+    np.testing.assert_array_equal(standardized[0], 0)
+    np.testing.assert_allclose(standardized[1], [-np.sqrt(0.5), 0, np.sqrt(0.5)])
+
+
+@pytest.mark.parametrize('maxBlockBytes', [1, 8 * 25 * 3, 8 * 25 * 100])
+def test_max_neighbor_correlation_matches_corrcoef(values, maxBlockBytes):
+    np.testing.assert_allclose(max_neighbor_correlation(values, maxBlockBytes),
+                               expected_max_correlation(values), atol=1e-12)
+
+
+def test_identical_profiles_do_not_exceed_one():
+    values = np.tile(np.arange(5.0), (3, 1))
+    assert (max_neighbor_correlation(values) <= 1.0).all()
+
+
+def test_screen_isolated_genes(values):
+    kept = screen_isolated_genes(values, 0.8)
+    np.testing.assert_array_equal(kept, expected_max_correlation(values) >= 0.8)
+    assert kept[:10].all() and not kept[10:].any()
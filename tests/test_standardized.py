@@ -0,0 +1,103 @@
+'''
+tests for the shared standardized-expression engine
+'''
+
+import numpy as np
+import pytest
+
+from iterativeWGCNA.standardized import StandardizedProfiles, pairwise_complete_correlation
+
+
+def reference_correlation(x, y):
+    '''
+    pairwise-complete Pearson correlations, one pair at a time
+    '''
+    result = np.full((x.shape[0], y.shape[0]), np.nan)
+    for i, a in enumerate(x):
+        for j, b in enumerate(y):
+            present = ~np.isnan(a) & ~np.isnan(b)
+            if present.sum() > 1 and np.std(a[present]) > 0 and np.std(b[present]) > 0:
+                result[i, j] = np.corrcoef(a[present], b[present])[0, 1]
+    return result
+
+
+@pytest.fixture
+def values():
+    rng = np.random.default_rng(42)
+    return rng.normal(size=(30, 12))
+
+
+def names(count, prefix='g'):
+    return [prefix + str(i) for i in range(count)]
+
+
+def test_correlation_matches_numpy(values):
+    profiles = StandardizedProfiles(names(30), values)
+    np.testing.assert_allclose(profiles.correlation(), np.corrcoef(values), atol=1e-12)
+
+
+def test_self_correlation_is_exactly_one(values):
+    correlation = StandardizedProfiles(names(30), values).correlation()
+    assert (np.diag(correlation) == 1.0).all()
+
+
+def test_named_rows_and_columns(values):
+    profiles = StandardizedProfiles(names(30), values)
+    correlation = profiles.correlation(['g3', 'g7'], ['g1', 'g3', 'g20'])
+    expected = np.corrcoef(values)[np.ix_([3, 7], [1, 3, 20])]
+    np.testing.assert_allclose(correlation, expected, atol=1e-12)
+
+
+def test_missing_values_use_pairwise_complete_samples(values):
+    values[2, [0, 5]] = np.nan
+    values[9, 5] = np.nan
+    values[11, 3] = np.nan
+    profiles = StandardizedProfiles(names(30), values)
+    np.testing.assert_allclose(profiles.correlation(), reference_correlation(values, values),
+                               atol=1e-12)
+    np.testing.assert_array_equal(profiles.sample_counts(['g2', 'g9', 'g0']), [10, 11, 12])
+
+
+def test_correlation_with_other_profiles(values):
+    rng = np.random.default_rng(7)
+    eigengenes = rng.normal(size=(4, 12))
+    eigengenes[1, 4] = np.nan
+    values[5, 0] = np.nan
+    profiles = StandardizedProfiles(names(30), values)
+    other = StandardizedProfiles(names(4, 'ME'), eigengenes)
+    np.testing.assert_allclose(profiles.correlation(other=other),
+                               reference_correlation(values, eigengenes), atol=1e-12)
+
+
+def test_constant_rows_are_nan(values):
+    values[4] = 3.0
+    correlation = StandardizedProfiles(names(30), values).correlation()
+    assert np.isnan(correlation[4]).all()
+    assert np.isnan(correlation[:, 4]).all()
+    assert not np.isnan(np.delete(np.delete(correlation, 4, 0), 4, 1)).any()
+
+
+def test_pairwise_complete_correlation(values):
+    values[0, 1] = np.nan
+    values[3, [2, 4]] = np.nan
+    np.testing.assert_allclose(pairwise_complete_correlation(values[:5], values[5:10]),
+                               reference_correlation(values[:5], values[5:10]), atol=1e-12)
+
+
+@pytest.mark.parametrize('networkType', ['signed', 'signed hybrid', 'unsigned'])
+def test_adjacency(values, networkType):
+    correlation = np.corrcoef(values)
+    if networkType == 'signed':
+        expected = ((1 + correlation) / 2) ** 6
+    elif networkType == 'signed hybrid':
+        expected = np.where(correlation > 0, correlation, 0) ** 6
+    else:
+        expected = np.abs(correlation) ** 6
+    adjacency = StandardizedProfiles(names(30), values).adjacency(power=6,
+                                                                  networkType=networkType)
+    np.testing.assert_allclose(adjacency, expected, atol=1e-12)
+
+
+def test_adjacency_rejects_unknown_network_type(values):
+    with pytest.raises(ValueError):
+        StandardizedProfiles(names(30), values).adjacency(networkType='distance')
@@ -0,0 +1,70 @@
+'''
+tests for the projected input: statistics accumulated
+over chunks of sample columns
+'''
+
+import numpy as np
+import pytest
+
+from iterativeWGCNA.projection import project_samples
+from iterativeWGCNA.screen import standardize_rows
+from iterativeWGCNA.streaming import StreamingProfiles, gene_moments, map_gene_chunks, \
+    sample_eigengenes
+
+
+@pytest.fixture
+def values():
+    rng = np.random.default_rng(3)
+    factors = rng.normal(size=(3, 40))
+    return np.dot(rng.normal(size=(50, 3)), factors) + 0.1 * rng.normal(size=(50, 40))
+
+
+def test_gene_moments_match_numpy(values):
+    values[4, [2, 9]] = np.nan
+    means, variances, counts = gene_moments(values, chunkSamples=7)
+    np.testing.assert_allclose(means, np.nanmean(values, axis=1))
+    np.testing.assert_allclose(variances, np.nanvar(values, axis=1, ddof=1))
+    assert counts[4] == 38 and counts[0] == 40
+
+
+def test_map_gene_chunks(values):
+    results = map_gene_chunks(values, lambda chunk: list(chunk.sum(axis=1)), chunkRows=8)
+    np.testing.assert_allclose(results, values.sum(axis=1))
+
+
+def test_projection_matches_in_memory_projection(values):
+    streamed, componentCount, explained, basis = \
+        StreamingProfiles(values, chunkSamples=6).project_samples(0.9)
+    projected, expectedCount, expectedExplained = project_samples(values, 0.9)
+    assert (componentCount, basis.shape) == (expectedCount, (40, expectedCount))
+    assert explained == pytest.approx(expectedExplained)
+    # components are unique up to sign: compare the correlations
+    np.testing.assert_allclose(np.dot(standardize_rows(streamed), standardize_rows(streamed).T),
+                               np.dot(standardize_rows(projected), standardize_rows(projected).T),
+                               atol=1e-8)
+
+
+def test_full_rank_projection_has_no_correlation_error(values):
+    profiles = StreamingProfiles(values, chunkSamples=9)
+    projected, _, _, _ = profiles.project_samples(1.0)
+    maxError, rmsError = profiles.correlation_error(projected, 20)
+    assert maxError < 1e-8 and rmsError < 1e-8
+
+
+def test_correlation_error_of_truncated_projection(values):
+    profiles = StreamingProfiles(values, chunkSamples=9)
+    projected, componentCount, _, _ = profiles.project_samples(0.5)
+    maxError, rmsError = profiles.correlation_error(projected, len(values))
+    assert componentCount < 3
+    assert maxError >= rmsError > 0.01
+
+
+def test_sample_eigengenes_follow_module_average(values):
+    projected, _, _, basis = StreamingProfiles(values).project_samples(0.99)
+    membership = ['a'] * 20 + ['b'] * 30
+    eigengenes = sample_eigengenes(projected, basis, membership, ['a', 'b'])
+    assert eigengenes.shape == (2, 40)
+    np.testing.assert_allclose(eigengenes.mean(axis=1), 0, atol=1e-12)
+    np.testing.assert_allclose(eigengenes.std(axis=1, ddof=1), 1)
+    average = standardize_rows(values[:20]).mean(axis=0)
+    assert np.corrcoef(eigengenes[0], average)[0, 1] > 0.9
@@ -0,0 +1,80 @@
+'''
+tests for the parameter sweep: grid expansion, per-configuration
+run arguments and output directories, and the summary table
+'''
+
+import argparse
+import os
+from collections import OrderedDict
+
+import numpy as np
+
+from iterativeWGCNA.sweep import ParameterSweep, SharedMatrix, configuration_args, \
+    configuration_label, expand_grid
+
+
+def sweep_args(tmp_path):
+    grid = OrderedDict((('power', [6, 8]), ('minModuleSize', [10, 20, 30]),
+                        ('finalMergeCutHeight', [0.05])))
+    return argparse.Namespace(workingDir=str(tmp_path), grid=grid, skipSaveBlocks=True,
+                              wgcnaParameters={'minKMEtoStay': 0.7}, finalMergeCutHeight=0.1,
+                              verbose=False)
+
+
+def test_expand_grid(tmp_path):
+    configurations = expand_grid(sweep_args(tmp_path).grid)
+    assert len(configurations) == 6
+    assert [(c['power'], c['minModuleSize']) for c in configurations] \
+        == [(6, 10), (6, 20), (6, 30), (8, 10), (8, 20), (8, 30)]
+    assert all(list(c.keys()) == ['power', 'minModuleSize', 'finalMergeCutHeight']
+               for c in configurations)
+
+
+def test_configuration_args(tmp_path):
+    args = sweep_args(tmp_path)
+    labels = set()
+    for config in expand_grid(args.grid):
+        configArgs = configuration_args(args, config)
+        label = configuration_label(config)
+        labels.add(label)
+        assert configArgs.workingDir == os.path.join(str(tmp_path), label)
+        assert configArgs.wgcnaParameters['power'] == config['power']
+        assert configArgs.wgcnaParameters['minModuleSize'] == config['minModuleSize']
+        assert configArgs.wgcnaParameters['minKMEtoStay'] == 0.7
+        # run parameters are options, not blockwiseModules parameters
+        assert configArgs.finalMergeCutHeight == 0.05
+        assert 'finalMergeCutHeight' not in configArgs.wgcnaParameters
+    assert len(labels) == 6
+    assert 'power-6_minModuleSize-10_finalMergeCutHeight-0.05' in labels
+    # the sweep arguments are not modified
+    assert args.wgcnaParameters == {'minKMEtoStay': 0.7}
+    assert args.finalMergeCutHeight == 0.1
+
+
+def test_shared_matrix():
+    values = np.arange(12, dtype=np.float64).reshape(3, 4)
+    matrix = SharedMatrix.from_array(values)
+    try:
+        attached = SharedMatrix(*matrix.descriptor())
+        np.testing.assert_array_equal(attached.values, values)
+        attached.close()
+    finally:
+        matrix.close()
+        matrix.unlink()
+
+
+def test_write_summary(tmp_path):
+    sweep = ParameterSweep(sweep_args(tmp_path))
+    results = {}
+    for config in reversed(sweep.configurations): # completion order
+        label = configuration_label(config)
+        results[label] = OrderedDict((('Configuration', label), ('Status', 'SUCCESS'),
+                                      ('Modules', config['minModuleSize'] // 10)))
+    sweep.write_summary(results)
+    with open(os.path.join(str(tmp_path), 'sweep-summary.txt')) as f:
+        rows = [line.rstrip('\n').split('\t') for line in f]
+    assert rows[0] == ['Configuration', 'power', 'minModuleSize', 'finalMergeCutHeight',
+                       'Status', 'Modules']
+    assert [row[0] for row in rows[1:]] \
+        == [configuration_label(c) for c in sweep.configurations]
+    assert rows[1][1:] == ['6', '10', '0.05', 'SUCCESS', '1']
@@ -0,0 +1,102 @@
+'''
+tests for the incremental update of eigengenes and kME
+when samples are appended
+'''
+
+import argparse
+import os
+
+import numpy as np
+import pytest
+
+from iterativeWGCNA.io.matrix import read_matrix, write_matrix
+from iterativeWGCNA.io.utils import read_membership, write_table
+from iterativeWGCNA.update import SampleUpdater, SufficientStatistics
+
+
+def planted_modules(rng, sampleCount):
+    '''
+    two modules of 6 genes, each following its own signal, and an unclassified gene
+    '''
+    signals = rng.normal(size=(2, sampleCount))
+    loadings = np.repeat(np.eye(2), 6, axis=0) * rng.uniform(1, 2, size=(12, 1))
+    values = np.dot(loadings, signals) + 0.3 * rng.normal(size=(12, sampleCount))
+    return np.vstack((values + 5, rng.normal(size=(1, sampleCount))))
+
+
+def eigengene(values):
+    z = (values - values.mean(axis=1)[:, None]) / values.std(axis=1, ddof=1)[:, None]
+    _, _, vt = np.linalg.svd(z, full_matrices=False)
+    component = vt[0] if np.dot(vt[0], z.mean(axis=0)) > 0 else -vt[0]
+    return (component - component.mean()) / component.std(ddof=1)
+
+
+@pytest.fixture
+def run(tmp_path):
+    '''
+    run directory with merged results for 20 samples, and 15 + 10 new samples
+    '''
+    rng = np.random.default_rng(11)
+    values = planted_modules(rng, 45)
+    genes = ['g' + str(i) for i in range(13)]
+    samples = ['S' + str(i) for i in range(45)]
+    modules = ['blue'] * 6 + ['red'] * 6 + ['UNCLASSIFIED']
+    eigengenes = np.vstack((eigengene(values[:6, :20]), eigengene(values[6:12, :20])))
+
+    workingDir = str(tmp_path)
+    write_matrix(os.path.join(workingDir, 'merged-0.05-eigengenes.txt'), 'Module',
+                 ['blue', 'red'], samples[:20], eigengenes)
+    write_table(os.path.join(workingDir, 'merged-0.05-membership.txt'), ('Gene', 'Module', 'kME'),
+                [(gene, module, '0.9' if module != 'UNCLASSIFIED' else 'NA')
+                 for gene, module in zip(genes, modules)])
+    files = []
+    for name, columns in (('input', slice(0, 20)), ('new1', slice(20, 35)),
+                          ('new2', slice(35, 45))):
+        files.append(os.path.join(workingDir, name + '.txt'))
+        write_matrix(files[-1], 'Gene', genes, samples[columns], values[:, columns])
+    return workingDir, files, values
+
+
+def update_args(workingDir, newSamples, inputFile=None):
+    return argparse.Namespace(workingDir=workingDir, newSamples=newSamples, inputFile=inputFile,
+                              verbose=False, result='merged', finalMergeCutHeight=0.05,
+                              driftTolerance=0.1)
+
+
+def test_update_is_exact_for_the_extended_eigengenes(run):
+    workingDir, (inputFile, new1, new2), values = run
+    _, _, original = read_matrix(os.path.join(workingDir, 'merged-0.05-eigengenes.txt'))
+
+    assert SampleUpdater(update_args(workingDir, new1, inputFile)).run() == []
+    # the second update reads only the saved statistics and the new samples
+    assert SampleUpdater(update_args(workingDir, new2)).run() == []
+
+    modules, samples, eigengenes = read_matrix(os.path.join(
+        workingDir, 'updated-merged-0.05-eigengenes.txt'))
+    assert modules == ['blue', 'red'] and len(samples) == 45
+    np.testing.assert_array_equal(eigengenes[:, :20], original) # earlier samples unchanged
+    for m in range(2): # folded-in values follow the module
+        assert np.corrcoef(eigengenes[m, 20:], eigengene(values[6 * m:6 * m + 6, 20:]))[0, 1] > 0.9
+
+    _, membership = read_membership(os.path.join(workingDir,
+                                                 'updated-merged-0.05-membership.txt'))
+    for g in range(12):
+        expected = np.corrcoef(values[g], eigengenes[g // 6])[0, 1]
+        assert float(membership['g' + str(g)][2]) == round(expected, 2)
+    assert membership['g12'][1:] == ['UNCLASSIFIED', 'NA']
+
+
+def test_statistics_round_trip(tmp_path):
+    rng = np.random.default_rng(2)
+    values = rng.normal(size=(4, 10))
+    values[1, 3] = np.nan
+    statistics = SufficientStatistics.from_profiles(['a', 'b', 'c', 'd'], ['m'],
+                                                    ['S' + str(i) for i in range(10)],
+                                                    [0, 0, 0, 0], values, rng.normal(size=(1, 10)))
+    fileName = str(tmp_path / 'statistics.npz')
+    statistics.save(fileName)
+    loaded = SufficientStatistics.load(fileName)
+    assert loaded.genes == statistics.genes and loaded.samples == statistics.samples
+    np.testing.assert_array_equal(loaded.kME(), statistics.kME())
+    with pytest.raises(ValueError):
+        loaded.append_samples(['S3'], values[:, [3]], 0.1)
@@ -0,0 +1,41 @@
+'''
+tests for the background output writer
+'''
+
+import threading
+
+import pytest
+
+from iterativeWGCNA.io.writer import OutputWriter
+
+
+def test_tasks_run_in_order_on_the_writer_thread():
+    results = []
+    writer = OutputWriter(maxQueueSize=2)
+    for i in range(10):
+        writer.submit(lambda value: results.append((value, threading.current_thread().name)), i)
+    assert writer.close() == []
+    assert [value for value, _ in results] == list(range(10))
+    assert set(name for _, name in results) == {'iterativeWGCNA-writer'}
+
+
+def test_errors_are_returned_and_later_tasks_still_run():
+    results = []
+
+    def fail():
+        raise IOError('disk full')
+
+    writer = OutputWriter()
+    writer.submit(fail)
+    writer.submit(results.append, 'written')
+    errors = writer.close()
+    assert len(errors) == 1 and 'disk full' in errors[0]
+    assert results == ['written']
+
+
+def test_submit_after_close_is_rejected():
+    writer = OutputWriter()
+    writer.close()
+    assert writer.close() == [] # closing twice is harmless
+    with pytest.raises(RuntimeError):
+        writer.submit(print, 'late')
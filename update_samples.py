@@ -0,0 +1,18 @@
+#!/usr/bin/env python
+
+'''Fold new samples into an existing run directly from source tree.'''
+
+# Installation workaround - see README
+# import readline
+#pylint: disable=invalid-name
+
+from iterativeWGCNA.update import SampleUpdater
+from iterativeWGCNA.cmlargs import parse_update_command_line_args
+
+if __name__ == '__main__':
+    args = parse_update_command_line_args()
+    updater = SampleUpdater(args)
+    updater.run()
+
+__author__ = 'Emily Greenfest-Allen'
+__copyright__ = 'Copyright 2018, University of Pennsylvania'